@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+# classify(food names, candidate labels) -> {food name: {label: score}}
+ClassifyFn = Callable[[List[str], List[str]], Dict[str, Dict[str, float]]]
+
+
+def group_by_labels(pending: Dict[str, List[str]]) -> Dict[Tuple[str, ...], List[str]]:
+    """
+    Group {food name: labels} by label set, so each model call shares its candidate labels
+    """
+    groups = {}
+    for name, labels in pending.items():
+        groups.setdefault(tuple(sorted(set(labels))), []).append(name)
+    return groups
+
+
+class AllergenBatcher:
+    """
+    Micro-batching front end for the zero-shot allergen classifier, shared by every
+    plan a planner builds concurrently.
+
+    Callers on any thread submit {food name: allergens} and block on the result. An
+    asyncio loop on a background thread collects submissions for up to window_ms (or
+    until max_batch foods are pending), merges them so each distinct (food, allergen)
+    pair is classified once, runs the batch off the loop and fans the scores back out
+    to every caller. Submissions arriving while a batch runs form the next one
+    """
+
+    def __init__(self, classify: ClassifyFn, window_ms: float = 5.0, max_batch: int = 32):
+        self.classify = classify
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.submissions = 0
+        self._loop = None
+        self._queue = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._queue = asyncio.Queue()
+                loop.create_task(self._collect())
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name='allergen-batcher', daemon=True).start()
+            ready.wait()
+            self._loop = loop
+
+    def score(self, pending: Dict[str, List[str]]) -> Dict[str, Dict[str, float]]:
+        """
+        Scores for each food against the allergens it lists, batched with whatever
+        other callers submit in the same window. Classifier errors are re-raised here
+        """
+        if not pending:
+            return {}
+        self._ensure_started()
+        future = Future()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (pending, future))
+        return future.result()
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    submission = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(submission)
+                size += len(submission[0])
+            await self._run(batch)
+
+    async def _run(self, batch: List[Tuple[Dict[str, List[str]], Future]]):
+        merged = {}
+        for pending, _ in batch:
+            for name, labels in pending.items():
+                merged.setdefault(name, set()).update(labels)
+
+        try:
+            scores = await asyncio.get_running_loop().run_in_executor(None, self._classify_merged, merged)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.submissions += len(batch)
+        for pending, future in batch:
+            future.set_result({
+                name: {label: scores[name][label] for label in labels}
+                for name, labels in pending.items()
+            })
+
+    def _classify_merged(self, merged: Dict[str, set]) -> Dict[str, Dict[str, float]]:
+        scores = {}
+        for labels, names in group_by_labels(merged).items():
+            for name, food_scores in self.classify(names, list(labels)).items():
+                scores.setdefault(name, {}).update(food_scores)
+        return scores
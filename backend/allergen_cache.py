@@ -0,0 +1,51 @@
+import os
+import re
+from typing import Dict, Iterable, List
+
+from json_files import JSONFileCache
+
+
+class AllergenScoreCache(JSONFileCache):
+    """
+    On-disk cache of zero-shot allergen scores, one JSON file per model id.
+
+    Entries are stored as {food name: {allergen: score}} so a food only has to
+    be classified once per allergen, no matter how many plans ask for it.
+    """
+
+    key_field = 'model_id'
+    entries_field = 'scores'
+    description = 'allergen cache'
+
+    def __init__(self, cache_dir: str = ".allergy_cache", model_id: str = "facebook/bart-large-mnli"):
+        self.model_id = model_id
+        path = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '__', model_id) + ".json")
+        super().__init__(cache_dir, model_id, path)
+
+    def get(self, food_name: str, allergen: str):
+        """
+        Return the cached score for (food name, allergen), or None if unseen
+        """
+        return self._entries.get(food_name, {}).get(allergen.lower())
+
+    def missing(self, food_names: Iterable[str], allergens: List[str]) -> Dict[str, List[str]]:
+        """
+        Map each food name to the allergens it has never been scored against
+        """
+        result = {}
+        for name in food_names:
+            known = self._entries.get(name, {})
+            todo = [a for a in allergens if a.lower() not in known]
+            if todo:
+                result[name] = todo
+        return result
+
+    def update(self, food_name: str, scores: Dict[str, float]):
+        """
+        Record freshly computed scores for a food
+        """
+        with self._lock:
+            entry = self._entries.setdefault(food_name, {})
+            for allergen, score in scores.items():
+                entry[allergen.lower()] = float(score)
+            self._dirty = True
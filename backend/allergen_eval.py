@@ -0,0 +1,135 @@
+"""
+Compare zero-shot allergen models and CPU runtimes against the reference model.
+
+    python allergen_eval.py --candidates valhalla/distilbart-mnli-12-1 \
+        facebook/bart-large-mnli:int8 facebook/bart-large-mnli:onnx --output allergen_eval.json
+
+Each model is given as MODEL_ID[:RUNTIME] (runtime 'torch', 'int8' or 'onnx',
+default 'torch'). Every model scores the same food names against the same
+allergens; the report gives load time, latency per 1,000 food names, and how
+often the model agrees with the reference at the planner's allergy threshold,
+both per (food, allergen) pair and per food (the check_allergy decision).
+"""
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allergen_models import (ALLERGY_RUNTIMES, ALLERGY_THRESHOLD, DEFAULT_ALLERGENS, DEFAULT_ALLERGY_MODEL,
+                             classify_batches, load_zero_shot_classifier)
+from catalog import is_catalog, load_catalog
+
+
+def parse_model_spec(spec: str) -> Tuple[str, str]:
+    """
+    'model_id[:runtime]' -> (model_id, runtime)
+    """
+    model_id, _, runtime = spec.rpartition(':')
+    if model_id and runtime in ALLERGY_RUNTIMES:
+        return model_id, runtime
+    return spec, 'torch'
+
+
+def load_food_names(path: str, limit: int, seed: int) -> List[str]:
+    """
+    Up to limit distinct food names from a food CSV or catalog, sampled reproducibly
+    """
+    food_df = load_catalog(path)[0] if is_catalog(path) else pd.read_csv(path)
+    names = food_df['Food Name'].astype(str).unique()
+    if len(names) > limit:
+        names = np.random.default_rng(seed).choice(names, size=limit, replace=False)
+    return sorted(names.tolist())
+
+
+def score_matrix(scores: Dict[str, Dict[str, float]], names: List[str], allergies: List[str]) -> np.ndarray:
+    return np.array([[scores[name][allergy] for allergy in allergies] for name in names])
+
+
+def evaluate_model(model_id: str, runtime: str, names: List[str], allergies: List[str],
+                   batch_size: int) -> Dict:
+    """
+    Load one model and score every name, timing both
+    """
+    start = time.perf_counter()
+    classifier = load_zero_shot_classifier(model_id, runtime)
+    load_s = time.perf_counter() - start
+
+    # One warm-up batch so lazy initialization is not billed to the first names
+    classify_batches(classifier, names[:batch_size], allergies, batch_size)
+
+    start = time.perf_counter()
+    scores = classify_batches(classifier, names, allergies, batch_size)
+    classify_s = time.perf_counter() - start
+
+    return {
+        'model_id': model_id,
+        'runtime': runtime,
+        'load_s': round(load_s, 3),
+        'classify_s': round(classify_s, 3),
+        'ms_per_1000_names': round(classify_s / len(names) * 1000 * 1000, 1),
+        'scores': score_matrix(scores, names, allergies)
+    }
+
+
+def agreement(scores: np.ndarray, reference: np.ndarray, threshold: float) -> Dict:
+    """
+    Agreement of thresholded scores with the reference's, per pair and per food
+    """
+    flagged, reference_flagged = scores > threshold, reference > threshold
+    food_flagged, reference_food_flagged = flagged.any(axis=1), reference_flagged.any(axis=1)
+    return {
+        'pair_agreement': round(float((flagged == reference_flagged).mean()), 4),
+        'food_agreement': round(float((food_flagged == reference_food_flagged).mean()), 4),
+        'foods_flagged': int(food_flagged.sum()),
+        'foods_missed': int((reference_food_flagged & ~food_flagged).sum()),
+        'foods_extra': int((food_flagged & ~reference_food_flagged).sum()),
+        'mean_abs_score_diff': round(float(np.abs(scores - reference).mean()), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare zero-shot allergen models against the reference model")
+    parser.add_argument("--foods", default="new_foods.csv", help="Food CSV or catalog")
+    parser.add_argument("--reference", default=DEFAULT_ALLERGY_MODEL, help="Reference MODEL_ID[:RUNTIME]")
+    parser.add_argument("--candidates", nargs='+', required=True, help="Models to compare, MODEL_ID[:RUNTIME]")
+    parser.add_argument("--allergies", nargs='+', default=DEFAULT_ALLERGENS)
+    parser.add_argument("--limit", type=int, default=1000, help="Food names to score")
+    parser.add_argument("--threshold", type=float, default=ALLERGY_THRESHOLD)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="allergen_eval.json")
+    args = parser.parse_args()
+
+    names = load_food_names(args.foods, args.limit, args.seed)
+    print(f"Scoring {len(names)} foods against {', '.join(args.allergies)}")
+
+    reference = evaluate_model(*parse_model_spec(args.reference), names, args.allergies, args.batch_size)
+    results = []
+    for spec in [args.reference] + args.candidates:
+        result = reference if spec == args.reference else evaluate_model(
+            *parse_model_spec(spec), names, args.allergies, args.batch_size)
+        result = {**{key: value for key, value in result.items() if key != 'scores'},
+                  **agreement(result['scores'], reference['scores'], args.threshold)}
+        results.append(result)
+        print(f"{spec:50s} {result['ms_per_1000_names']:>10.1f} ms/1k names   "
+              f"food agreement {result['food_agreement']:.3f}   pair agreement {result['pair_agreement']:.3f}")
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'config': vars(args),
+        'foods': len(names),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
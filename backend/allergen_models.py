@@ -0,0 +1,79 @@
+from typing import Callable, Dict, List
+
+DEFAULT_ALLERGY_MODEL = "facebook/bart-large-mnli"
+
+# Zero-shot score above which a food is treated as containing an allergen
+ALLERGY_THRESHOLD = 0.7
+
+# Allergens with substitution advice in the planner; the default label set for
+# offline annotation and model evaluation
+DEFAULT_ALLERGENS = ['dairy', 'nuts', 'gluten', 'seafood', 'eggs']
+
+# How the NLI model is executed on CPU:
+#   'torch' - the Hugging Face model as published (float32)
+#   'int8'  - the same weights with Linear layers dynamically quantized to int8
+#   'onnx'  - exported to ONNX and run by ONNX Runtime (requires optimum[onnxruntime])
+ALLERGY_RUNTIMES = ('torch', 'int8', 'onnx')
+
+
+def allergy_model_key(model_id: str, runtime: str = 'torch') -> str:
+    """
+    Identity of a model + runtime, used to keep their cached scores apart
+    (quantized and exported models do not reproduce the float32 scores exactly)
+    """
+    return model_id if runtime == 'torch' else f"{model_id}@{runtime}"
+
+
+def load_zero_shot_classifier(model_id: str = DEFAULT_ALLERGY_MODEL, runtime: str = 'torch') -> Callable:
+    """
+    Zero-shot classification pipeline for model_id on the given runtime. Imports
+    transformers (and torch / optimum) only when called
+    """
+    if runtime not in ALLERGY_RUNTIMES:
+        raise ValueError(f"Unknown allergy runtime '{runtime}' (expected one of {', '.join(ALLERGY_RUNTIMES)})")
+
+    from transformers import pipeline
+
+    if runtime == 'torch':
+        return pipeline("zero-shot-classification", model=model_id)
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+    if runtime == 'int8':
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        model = AutoModelForSequenceClassification.from_pretrained(model_id)
+        model.eval()
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError as e:
+            raise ImportError("The 'onnx' allergy runtime requires optimum[onnxruntime]") from e
+        model = ORTModelForSequenceClassification.from_pretrained(model_id, export=True)
+
+    return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
+
+
+def classify_batches(classifier: Callable, food_names: List[str], labels: List[str],
+                     batch_size: int = 32) -> Dict[str, Dict[str, float]]:
+    """
+    Multi-label zero-shot scores of food names for one set of candidate labels,
+    batch_size names per classifier call
+    """
+    scores = {}
+    for start in range(0, len(food_names), batch_size):
+        batch = food_names[start:start + batch_size]
+        results = classifier(
+            batch,
+            candidate_labels=labels,
+            multi_label=True,
+            batch_size=batch_size
+        )
+        if isinstance(results, dict):
+            results = [results]
+        for name, result in zip(batch, results):
+            scores[name] = dict(zip(result['labels'], result['scores']))
+    return scores
@@ -2,16 +2,12 @@ import streamlit as st
 import pandas as pd
 import os
 import sys
-from io import StringIO
+import hashlib
+from io import BytesIO, StringIO
 import contextlib
 
-# Import all functions from model.py
-from new_new import (
-    ayurvedic_rules, nutrient_requirements, sign_to_effect,
-    enhanced_dessert_label, train_dessert_classifier, load_dessert_classifier,
-    predict_dessert, food_dosha_penalty, calculate_portion_sizes,
-    plan_weekly_meals, DESSERT_KEYWORDS, BREAKFAST_KEYWORDS
-)
+# Planning core shared with the API server and batch jobs
+from planning import load_dessert_classifier, nutrient_requirements, plan_weekly_meals
 
 # Set page config
 st.set_page_config(
@@ -87,69 +83,57 @@ if 'portion_sizes' not in st.session_state:
 if 'model_loaded' not in st.session_state:
     st.session_state.model_loaded = False
 
-# Function to calculate portion sizes in grams
-def calculate_portion_grams(food, target_nutrients, meal_type):
-    """
-    Calculate portion size in grams based on nutritional content
-    """
-    # Base portion size (grams)
-    base_portion = 100
-    
-    # Get food nutrients per 100g
-    calories_per_100g = food.get('calories_kcal', 0) or 0
-    protein_per_100g = food.get('protein_g', 0) or 0
-    carbs_per_100g = food.get('carbs_g', 0) or 0
-    fat_per_100g = food.get('fat_g', 0) or 0
-    
-    # If we have no nutritional data, return base portion
-    if calories_per_100g == 0:
-        return base_portion
-    
-    # Calculate how many grams needed to meet calorie target
-    calories_needed = target_nutrients['calories']
-    portion_grams = (calories_needed / calories_per_100g) * 100
-    
-    # Apply some constraints
-    min_portion = 80  # Minimum portion size in grams
-    max_portion = 300  # Maximum portion size in grams
-    
-    # Adjust for meal type
-    if meal_type == 'breakfast':
-        max_portion = 250
-    elif meal_type == 'lunch':
-        max_portion = 350
-    elif meal_type == 'dinner':
-        max_portion = 300
-    
-    # Ensure portion is within reasonable limits
-    portion_grams = max(min_portion, min(max_portion, portion_grams))
-    
-    # Round to nearest 25g for practicality
-    portion_grams = round(portion_grams / 25) * 25
-    
-    return int(portion_grams)
+DESSERT_MODEL_DIR = "dessert_model_dir"
+
+# Load the classifier once per server process; every browser session shares it.
+# Failed loads raise and are not cached, so "Try to reload model" retries
+@st.cache_resource(show_spinner=False)
+def load_dessert_components(model_dir=DESSERT_MODEL_DIR):
+    if not os.path.exists(model_dir):
+        raise FileNotFoundError(f"Pre-trained model directory '{model_dir}' not found.")
+    # Check if the directory contains model files
+    if not any(f.endswith('.json') for f in os.listdir(model_dir)):
+        raise ValueError("Model directory exists but doesn't contain model files.")
+    dessert_tokenizer, dessert_model, dessert_label_encoder, dessert_meta = load_dessert_classifier(model_dir)
+    return dessert_tokenizer, dessert_model, dessert_label_encoder
 
 # Load the pre-trained dessert classifier
 def load_dessert_model():
     try:
-        model_dir = "dessert_model_dir"
-        if os.path.exists(model_dir):
-            # Check if the directory contains model files
-            model_files = os.listdir(model_dir)
-            if not any(f.endswith('.json') for f in model_files):
-                st.error("Model directory exists but doesn't contain model files.")
-                return None, None, None
-                
-            dessert_tokenizer, dessert_model, dessert_label_encoder, dessert_meta = load_dessert_classifier(model_dir)
-            st.success("Dessert classifier loaded successfully!")
-            return dessert_tokenizer, dessert_model, dessert_label_encoder
-        else:
-            st.error("Pre-trained model directory 'dessert_model_dir' not found.")
-            return None, None, None
+        components = load_dessert_components()
+        st.success("Dessert classifier loaded successfully!")
+        return components
+    except (FileNotFoundError, ValueError) as e:
+        st.error(str(e))
+        return None, None, None
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None, None, None
 
+# Parse each distinct upload once; reruns and other sessions with the same file reuse it
+@st.cache_data(show_spinner=False, max_entries=16)
+def read_foods_csv(catalog_hash, _content):
+    return pd.read_csv(BytesIO(_content))
+
+# Identical (catalog, profile) requests reuse the plan instead of re-running the planner
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_weekly_plan(catalog_hash, profile, _df_foods, model_dir=DESSERT_MODEL_DIR):
+    dessert_tokenizer, dessert_model, dessert_label_encoder = load_dessert_components(model_dir)
+    return plan_weekly_meals(
+        _df_foods,
+        dessert_tokenizer=dessert_tokenizer,
+        dessert_model=dessert_model,
+        dessert_label_encoder=dessert_label_encoder,
+        person_profile=profile
+    )
+
+def group_plan_by_day(plan_df):
+    """
+    First planned food of each (day, meal), grouped once for the whole week
+    """
+    first_foods = plan_df.drop_duplicates(['day', 'meal'])
+    return {(row['day'], row['meal']): row for row in first_foods.to_dict('records')}
+
 # Load model on app start
 if not st.session_state.model_loaded:
     with st.spinner("Loading pre-trained dessert classifier..."):
@@ -167,7 +151,9 @@ with st.sidebar:
     uploaded_file = st.file_uploader("Choose foods.csv", type="csv")
     
     if uploaded_file is not None:
-        df_foods = pd.read_csv(uploaded_file)
+        content = uploaded_file.getvalue()
+        catalog_hash = hashlib.sha256(content).hexdigest()
+        df_foods = read_foods_csv(catalog_hash, content)
         st.success(f"Loaded {len(df_foods)} food items")
         
         # Show a preview of the data
@@ -229,39 +215,14 @@ with st.sidebar:
         if st.session_state.dessert_components is None:
             st.error("Dessert classifier not loaded. Please check if 'dessert_model_dir' exists with the correct model files.")
         else:
-            dessert_tokenizer, dessert_model, dessert_label_encoder = st.session_state.dessert_components
-            
             with st.spinner("Generating your personalized meal plan..."):
                 try:
-                    plan_df, totals_df, portion_sizes = plan_weekly_meals(
-                        df_foods,
-                        dessert_tokenizer=dessert_tokenizer,
-                        dessert_model=dessert_model,
-                        dessert_label_encoder=dessert_label_encoder,
-                        person_profile=profile
-                    )
+                    # Portions in grams come with the plan, as the planner chose them
+                    plan_df, totals_df, portion_sizes = cached_weekly_plan(catalog_hash, profile, df_foods)
                     
-                    # Add portion sizes in grams to the meal plan
                     if not plan_df.empty:
-                        # Create a copy to avoid modifying the original
-                        plan_df_with_portions = plan_df.copy()
-                        
-                        # Add portion sizes in grams
-                        portion_grams_list = []
-                        for _, row in plan_df.iterrows():
-                            meal_type = row['meal']
-                            if meal_type in portion_sizes:
-                                portion_grams = calculate_portion_grams(
-                                    row, portion_sizes[meal_type], meal_type
-                                )
-                                portion_grams_list.append(portion_grams)
-                            else:
-                                portion_grams_list.append(100)  # Default portion size
-                        
-                        plan_df_with_portions['portion_grams'] = portion_grams_list
-                        
                         # Store results in session state
-                        st.session_state.meal_plan = plan_df_with_portions
+                        st.session_state.meal_plan = plan_df
                         st.session_state.totals = totals_df
                         st.session_state.portion_sizes = portion_sizes
                     
@@ -322,76 +283,35 @@ if st.session_state.meal_plan is not None:
     
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     
+    meals_by_day = group_plan_by_day(plan_df)
+    
     for day in range(7):
         st.markdown(f"### {days[day]}")
         
-        day_meals = plan_df[plan_df['day'] == day]
-        
-        # Check if we have all meals
-        meals_found = day_meals['meal'].unique()
-        
-        # Breakfast
-        breakfast = day_meals[day_meals['meal'] == 'breakfast']
-        if not breakfast.empty:
-            meal = breakfast.iloc[0]
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Breakfast:</b> {meal['name_common']}<br>
-                Portion: {meal['portion_grams']}g<br>
-                Calories: {meal['calories_kcal']:.0f} kcal | Protein: {meal['protein_g']:.1f}g
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Breakfast:</b> No suitable breakfast found in dataset
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Lunch
-        lunch = day_meals[day_meals['meal'] == 'lunch']
-        if not lunch.empty:
-            meal = lunch.iloc[0]
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Lunch:</b> {meal['name_common']}<br>
-                Portion: {meal['portion_grams']}g<br>
-                Calories: {meal['calories_kcal']:.0f} kcal | Protein: {meal['protein_g']:.1f}g
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Lunch:</b> No suitable lunch found in dataset
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Dinner
-        dinner = day_meals[day_meals['meal'] == 'dinner']
-        if not dinner.empty:
-            meal = dinner.iloc[0]
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Dinner:</b> {meal['name_common']}<br>
-                Portion: {meal['portion_grams']}g<br>
-                Calories: {meal['calories_kcal']:.0f} kcal | Protein: {meal['protein_g']:.1f}g
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="meal-card">
-                <b>Dinner:</b> No suitable dinner found in dataset
-            </div>
-            """, unsafe_allow_html=True)
+        for meal_type in ['breakfast', 'lunch', 'dinner']:
+            meal = meals_by_day.get((day, meal_type))
+            if meal is not None:
+                st.markdown(f"""
+                <div class="meal-card">
+                    <b>{meal_type.capitalize()}:</b> {meal['name_common']}<br>
+                    Portion: {meal['portion_grams']:.0f}g<br>
+                    Calories: {meal['calories_kcal']:.0f} kcal | Protein: {meal['protein_g']:.1f}g
+                </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.markdown(f"""
+                <div class="meal-card">
+                    <b>{meal_type.capitalize()}:</b> No suitable {meal_type} found in dataset
+                </div>
+                """, unsafe_allow_html=True)
         
         # Dessert
-        dessert = day_meals[day_meals['meal'] == 'dessert']
-        if not dessert.empty:
-            meal = dessert.iloc[0]
+        meal = meals_by_day.get((day, 'dessert'))
+        if meal is not None:
             st.markdown(f"""
             <div class="meal-card dessert-card">
                 <b>Dessert:</b> {meal['name_common']}<br>
-                Portion: {meal['portion_grams']}g<br>
+                Portion: {meal['portion_grams']:.0f}g<br>
                 Calories: {meal['calories_kcal']:.0f} kcal
             </div>
             """, unsafe_allow_html=True)
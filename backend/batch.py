@@ -0,0 +1,211 @@
+"""
+Batch weekly plan generation for a whole patient roster.
+
+    python batch.py patients.csv --workers 8 --output plans.jsonl
+
+Profiles are read from CSV or JSONL (one profile per row/line, with the
+arguments of generate_weekly_plan plus an optional patient_id). The food table
+is loaded and preprocessed once in the parent process and shared with the
+worker processes, and each patient's plan is appended to the output as soon
+as it finishes. With --rows-output / --summary-output the plans are also
+streamed as one food row per line (CSV, JSONL or Parquet, with a Patient ID
+column) and as per-patient summary sections.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from allergen_models import ALLERGY_RUNTIMES, DEFAULT_ALLERGY_MODEL
+from export import SummaryWriter, open_plan_writer
+from json_files import json_default
+from new_new_new_new_new import SOLVER_BACKENDS, AdvancedAyurvedicMealPlanner
+
+# Planner used by worker processes; inherited on fork, or sent once per worker otherwise
+_PLANNER = None
+
+
+def parse_allergies(value) -> List[str]:
+    """
+    Accept a list, or a string separated by ';' or ','
+    """
+    if isinstance(value, list):
+        return [str(allergy).strip() for allergy in value if str(allergy).strip()]
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    return [allergy.strip() for allergy in str(value).replace(';', ',').split(',') if allergy.strip()]
+
+
+def normalize_profile(raw: Dict, position: int) -> Dict:
+    """
+    Coerce a raw CSV/JSONL record into a patient id and generate_weekly_plan arguments
+    """
+    raw = {key: (None if isinstance(value, float) and np.isnan(value) else value) for key, value in raw.items()}
+    profile = {
+        'age': int(raw['age']),
+        'height': float(raw['height']),
+        'weight': float(raw['weight']),
+        'gender': str(raw['gender']),
+        'prakriti': str(raw.get('prakriti') or ''),
+        'vikriti': raw.get('vikriti') or None,
+        'activity_level': str(raw.get('activity_level') or 'moderate'),
+        'goal': str(raw.get('goal') or 'maintain'),
+        'season': str(raw['season']),
+        'dietary_pref': str(raw.get('dietary_pref') or 'none'),
+        'allergies': parse_allergies(raw.get('allergies'))
+    }
+    patient_id = raw.get('patient_id')
+    return {'patient_id': str(patient_id) if patient_id is not None else str(position), 'profile': profile}
+
+
+def load_profiles(path: str) -> List[Dict]:
+    """
+    Read patient profiles from a .csv or .jsonl file
+    """
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        with open(path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        records = pd.read_csv(path).to_dict(orient='records')
+    return [normalize_profile(record, position) for position, record in enumerate(records)]
+
+
+def _init_worker(planner: AdvancedAyurvedicMealPlanner = None):
+    global _PLANNER
+    if planner is not None:
+        _PLANNER = planner
+    # Only the parent writes the allergen score file; workers writing it too would
+    # overwrite each other's scores
+    _PLANNER.allergy_cache.persist = False
+
+
+def _plan_one(patient: Dict) -> Dict:
+    start = time.perf_counter()
+    try:
+        plan = _PLANNER.generate_weekly_plan(**patient['profile'])
+    except Exception as e:
+        plan = {'error': f"{type(e).__name__}: {e}"}
+    result = {'patient_id': patient['patient_id'], 'profile': patient['profile']}
+    if 'error' in plan:
+        result['error'] = plan['error']
+    else:
+        result['plan'] = plan
+    result['elapsed_s'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def generate_plans_batch(profiles: Iterable[Dict], workers: int = None, output_path: str = "plans.jsonl",
+                         food_data_path: str = "new_foods.csv", planner: AdvancedAyurvedicMealPlanner = None,
+                         rows_output_path: str = None, summary_output_path: str = None, append: bool = False,
+                         **planner_kwargs) -> Dict:
+    """
+    Generate weekly plans for many patients in parallel, streaming one JSON line per
+    patient to output_path in completion order. Profiles are dicts with 'patient_id'
+    and 'profile' (see load_profiles). Plan rows and summaries can also be streamed
+    to rows_output_path (.csv/.jsonl/.parquet) and summary_output_path, appending to
+    existing files with append=True. Returns a summary of the run
+    """
+    global _PLANNER
+    start = time.perf_counter()
+    profiles = list(profiles)
+    workers = workers or os.cpu_count() or 1
+
+    if planner is None:
+        planner = AdvancedAyurvedicMealPlanner(food_data_path, **planner_kwargs)
+
+    # Classify the catalog against every allergy in the roster once, up front, so
+    # workers start with a warm score cache and never load the classifier themselves
+    roster_allergies = sorted({allergy.lower() for patient in profiles for allergy in patient['profile']['allergies']})
+    if roster_allergies:
+        planner.filter_foods('none', roster_allergies)
+
+    planned = failed = 0
+    with contextlib.ExitStack() as writers:
+        rows_writer = summary_writer = None
+        if rows_output_path:
+            rows_writer = writers.enter_context(open_plan_writer(rows_output_path, append=append, patient_column=True))
+        if summary_output_path:
+            summary_writer = writers.enter_context(SummaryWriter(summary_output_path, append=append))
+        out = writers.enter_context(open(output_path, 'a' if append else 'w', encoding='utf-8'))
+
+        if workers == 1:
+            _PLANNER = planner
+            results = map(_plan_one, profiles)
+            pool = None
+        elif 'fork' in mp.get_all_start_methods() and planner.allergy_classifier is None:
+            # Workers inherit the preprocessed planner copy-on-write, nothing is re-read or pickled
+            _PLANNER = planner
+            pool = mp.get_context('fork').Pool(workers, initializer=_init_worker)
+            results = pool.imap_unordered(_plan_one, profiles)
+        else:
+            # Spawned workers receive the preprocessed tables and score cache once each, not
+            # the CSV path; a loaded classifier (torch) is not fork-safe and is not sent
+            pool = mp.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=(planner,))
+            results = pool.imap_unordered(_plan_one, profiles)
+
+        try:
+            for result in results:
+                out.write(json.dumps(result, default=json_default) + "\n")
+                out.flush()
+                if 'error' in result:
+                    failed += 1
+                    continue
+                planned += 1
+                if rows_writer is not None:
+                    rows_writer.write_plan(result['plan'], result['patient_id'])
+                if summary_writer is not None:
+                    summary_writer.write_summary(result['plan'], result['patient_id'])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    return {
+        'patients': len(profiles),
+        'planned': planned,
+        'failed': failed,
+        'workers': workers,
+        'output': output_path,
+        'elapsed_s': round(time.perf_counter() - start, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate weekly Ayurvedic meal plans for a patient roster")
+    parser.add_argument("profiles", help="CSV or JSONL file of patient profiles")
+    parser.add_argument("--foods", default="new_foods.csv", help="Food catalog")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default="plans.jsonl", help="Output JSONL file")
+    parser.add_argument("--rows-output", default=None,
+                        help="Also write one row per planned food (.csv, .jsonl or .parquet)")
+    parser.add_argument("--summary-output", default=None, help="Also write per-patient plan summaries (CSV)")
+    parser.add_argument("--append", action="store_true", help="Append to existing output files")
+    parser.add_argument("--allergy-backend", default="auto", choices=['keyword', 'zeroshot', 'auto'])
+    parser.add_argument("--allergy-model", default=DEFAULT_ALLERGY_MODEL, help="Zero-shot NLI model id")
+    parser.add_argument("--allergy-runtime", default="torch", choices=ALLERGY_RUNTIMES)
+    parser.add_argument("--solver", default="cbc", choices=SOLVER_BACKENDS, help="MILP solver backend")
+    parser.add_argument("--solver-time-limit", type=float, default=None, help="Seconds per solve")
+    parser.add_argument("--solver-threads", type=int, default=1, help="Threads per solve")
+    parser.add_argument("--solver-gap", type=float, default=None, help="Relative MIP gap")
+    parser.add_argument("--solver-seed", type=int, default=None, help="Solver random seed")
+    args = parser.parse_args()
+
+    summary = generate_plans_batch(
+        load_profiles(args.profiles), workers=args.workers, output_path=args.output,
+        food_data_path=args.foods, rows_output_path=args.rows_output,
+        summary_output_path=args.summary_output, append=args.append, allergy_backend=args.allergy_backend,
+        allergy_model_id=args.allergy_model, allergy_runtime=args.allergy_runtime,
+        solver_backend=args.solver, solver_time_limit=args.solver_time_limit,
+        solver_threads=args.solver_threads, solver_gap=args.solver_gap, solver_seed=args.solver_seed
+    )
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Benchmark the meal planner pipeline on synthetic food catalogs.
+
+    python benchmark.py --sizes 8000 25000 100000 --output bench_results.json
+
+Catalogs share the schema of new_foods.csv (Meal Type, Food Name, Calories,
+Protein (g), Fats (g), Carbs (g), Vata, Pitta, Kapha). Each stage is timed
+per catalog size, meal selector and diet/allergy setting, and the results are
+written as JSON records so runs can be compared for regressions. Weekly plans
+are timed cold (the planner's filtered-foods memo cleared before each call) and
+warm (memo filled), and the joint selector is skipped above --joint-max-size.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import pulp
+
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+MEAL_TYPES = ['Breakfast', 'Lunch', 'Dinner']
+
+# Name parts: ingredients carry tastes and allergen/diet keywords, so filtering and
+# scoring see realistic hit rates
+DISHES = ['Curry', 'Sabzi', 'Pulao', 'Khichdi', 'Dosa', 'Upma', 'Paratha', 'Chilla', 'Soup',
+          'Salad', 'Stew', 'Rice', 'Bowl', 'Idli', 'Biryani', 'Poha', 'Roti', 'Dal']
+INGREDIENTS = ['Rice', 'Wheat', 'Moong', 'Spinach', 'Potato', 'Cauliflower', 'Eggplant', 'Lauki',
+               'Ginger', 'Cumin', 'Coriander', 'Lemon', 'Mango', 'Banana', 'Apple', 'Millet',
+               'Ragi', 'Oats', 'Carrot', 'Beetroot', 'Tofu', 'Mushroom', 'Chickpea', 'Rajma',
+               'Paneer', 'Ghee', 'Yogurt', 'Cashew', 'Almond', 'Chicken', 'Fish', 'Egg', 'Mutton']
+
+DEFAULT_SETTINGS = [
+    ('none', []),
+    ('vegetarian', []),
+    ('vegan', []),
+    ('vegetarian', ['dairy', 'nuts']),
+    ('none', ['gluten', 'seafood', 'eggs'])
+]
+
+PROFILE = {
+    'age': 35, 'height': 170, 'weight': 70, 'gender': 'male', 'prakriti': 'Vata-Pitta',
+    'vikriti': 'Vata', 'activity_level': 'moderate', 'season': 'winter'
+}
+
+
+def generate_synthetic_catalog(size: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random catalog of the given size with the same columns and value ranges as new_foods.csv
+    """
+    rng = np.random.default_rng(seed)
+    first = rng.choice(INGREDIENTS, size)
+    second = rng.choice(INGREDIENTS, size)
+    dish = rng.choice(DISHES, size)
+    names = [f"{a} {b} {d} {i}" for i, (a, b, d) in enumerate(zip(first, second, dish))]
+
+    protein = rng.uniform(3, 30, size).round(1)
+    fats = rng.uniform(2, 25, size).round(1)
+    carbs = rng.uniform(10, 70, size).round(1)
+    calories = (protein * 4 + fats * 9 + carbs * 4).round()
+
+    effects = np.array(['+', '-', '='])
+    return pd.DataFrame({
+        'Meal Type': rng.choice(MEAL_TYPES, size),
+        'Food Name': names,
+        'Calories': calories,
+        'Protein (g)': protein,
+        'Fats (g)': fats,
+        'Carbs (g)': carbs,
+        'Vata': rng.choice(effects, size),
+        'Pitta': rng.choice(effects, size),
+        'Kapha': rng.choice(effects, size)
+    })
+
+
+@contextlib.contextmanager
+def silence_output():
+    """
+    Silence stdout at the file descriptor level, which also covers the CBC subprocess
+    """
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        os.close(devnull)
+
+
+def time_call(func: Callable, repeats: int, setup: Callable = None) -> List[float]:
+    """
+    Wall time of each of repeats calls, with planner/solver output silenced.
+    setup runs untimed before each call
+    """
+    times = []
+    for _ in range(repeats):
+        with silence_output():
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def record(results: List[Dict], size: int, stage: str, times: List[float], **labels):
+    entry = {
+        'catalog_size': size,
+        'stage': stage,
+        **labels,
+        'repeats': len(times),
+        'median_s': round(statistics.median(times), 6),
+        'min_s': round(min(times), 6),
+        'max_s': round(max(times), 6)
+    }
+    results.append(entry)
+    label_text = ' '.join(f"{key}={value}" for key, value in labels.items())
+    print(f"{size:>7} {stage:<22} {label_text:<60} {entry['median_s'] * 1000:10.1f} ms")
+
+
+def run_benchmarks(sizes: List[int], selectors: List[str], repeats: int = 3,
+                   allergy_backend: str = "keyword", settings=DEFAULT_SETTINGS, seed: int = 0,
+                   solver_time_limit: float = None, joint_max_size: int = None) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            catalog_path = os.path.join(tmp_dir, f"foods_{size}.csv")
+            generate_synthetic_catalog(size, seed).to_csv(catalog_path, index=False)
+
+            record(results, size, 'load', time_call(
+                lambda: AdvancedAyurvedicMealPlanner(catalog_path, allergy_backend=allergy_backend,
+                                                     allergy_cache_dir=tmp_dir), repeats))
+
+            for selector in selectors:
+                if selector == 'joint' and joint_max_size is not None and size > joint_max_size:
+                    print(f"{size:>7} skipping joint above --joint-max-size {joint_max_size}")
+                    continue
+                weekly_mode = 'joint' if selector == 'joint' else 'greedy'
+                meal_selector = 'auto' if selector == 'joint' else selector
+                planner = AdvancedAyurvedicMealPlanner(
+                    catalog_path, allergy_backend=allergy_backend, allergy_cache_dir=tmp_dir,
+                    meal_selector=meal_selector, weekly_mode=weekly_mode, solver_time_limit=solver_time_limit
+                )
+                daily_calories, calories_per_meal = planner.calculate_caloric_needs(
+                    PROFILE['age'], PROFILE['height'], PROFILE['weight'], PROFILE['gender'], PROFILE['activity_level']
+                )
+
+                for dietary_pref, allergies in settings:
+                    labels = {'selector': selector, 'diet': dietary_pref, 'allergies': ','.join(allergies) or '-'}
+
+                    record(results, size, 'filter_foods', time_call(
+                        lambda: planner.filter_foods(dietary_pref, allergies), repeats), **labels)
+
+                    if selector != 'joint':
+                        filtered_foods = planner.filter_foods(dietary_pref, allergies)
+                        record(results, size, 'optimize_meals', time_call(
+                            lambda: planner.optimize_meals(
+                                filtered_foods, PROFILE['prakriti'], PROFILE['vikriti'], calories_per_meal,
+                                PROFILE['season'], 'lunch', PROFILE['age'], set(), 0
+                            ), repeats), **labels)
+
+                    def plan():
+                        return planner.generate_weekly_plan(dietary_pref=dietary_pref, allergies=allergies, **PROFILE)
+
+                    # Cold: filtering and candidate indexing redone on every call
+                    record(results, size, 'generate_weekly_plan', time_call(
+                        plan, repeats, setup=planner.filtered_foods_cache.clear), **labels, cache='cold')
+                    # Warm: filtered foods memoized by an untimed first call
+                    with silence_output():
+                        plan()
+                    record(results, size, 'generate_weekly_plan', time_call(plan, repeats), **labels, cache='warm')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Ayurvedic meal planner on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[8000, 25000, 100000])
+    parser.add_argument("--selectors", nargs='+', default=['vectorized', 'pulp'],
+                        choices=['vectorized', 'pulp', 'joint'],
+                        help="Meal selection engines to time ('joint' = whole-week MILP)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--solver-time-limit", type=float, default=None,
+                        help="Time limit in seconds for each PuLP solve (default: the planner's)")
+    parser.add_argument("--joint-max-size", type=int, default=100000,
+                        help="Largest catalog size the joint selector is timed on")
+    parser.add_argument("--allergy-backend", default="keyword", choices=['keyword', 'zeroshot', 'auto'])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.selectors, args.repeats, args.allergy_backend, seed=args.seed,
+                             solver_time_limit=args.solver_time_limit, joint_max_size=args.joint_max_size)
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'pulp': pulp.__version__
+        },
+        'config': vars(args),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import copy
+from typing import Callable, Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class MealCandidates:
+    """
+    A filtered food table partitioned once into per-meal-type row positions, with
+    bitsets of the food names already used this week and of names ruled out
+    entirely. Marking a food is O(1) and looking up a slot's candidates only
+    touches rows of that meal type.
+
+    Per-meal-type arrays (scores, calorie contributions) can be cached alongside, as
+    they do not change between the days of one plan. fresh() returns a copy sharing
+    the partition but with empty bitsets and caches, for the next plan
+    """
+
+    def __init__(self, foods: pd.DataFrame, used_names: Iterable[str] = ()):
+        self.foods = foods
+        name_codes, names = pd.factorize(foods['Food Name'])
+        self.name_codes = name_codes
+        self.name_lookup = {name: code for code, name in enumerate(names)}
+        self.used = np.zeros(len(names), dtype=bool)
+        self.excluded = np.zeros(len(names), dtype=bool)
+
+        meal_types = foods['Meal Type'].astype(str).str.lower().to_numpy()
+        self.positions = {meal_type: np.flatnonzero(meal_types == meal_type) for meal_type in np.unique(meal_types)}
+        self._arrays: Dict[Tuple[str, str], np.ndarray] = {}
+
+        for name in used_names:
+            self.mark_used(name)
+
+    def fresh(self) -> 'MealCandidates':
+        candidates = copy.copy(self)
+        candidates.used = np.zeros_like(self.used)
+        candidates.excluded = np.zeros_like(self.excluded)
+        candidates._arrays = {}
+        return candidates
+
+    def mark_used(self, name: str):
+        code = self.name_lookup.get(name)
+        if code is not None:
+            self.used[code] = True
+
+    def exclude(self, name: str):
+        code = self.name_lookup.get(name)
+        if code is not None:
+            self.excluded[code] = True
+
+    def lookup(self, meal_type: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Row positions of the meal type's foods, and whether each one was already
+        used / is excluded
+        """
+        positions = self.positions.get(meal_type.lower(), np.empty(0, dtype=np.int64))
+        codes = self.name_codes[positions]
+        return positions, self.used[codes], self.excluded[codes]
+
+    def meal_array(self, key: str, meal_type: str, compute: Callable[[pd.DataFrame], np.ndarray]) -> np.ndarray:
+        """
+        Array aligned with lookup(meal_type)'s positions, computed on first use
+        """
+        cache_key = (key, meal_type.lower())
+        if cache_key not in self._arrays:
+            positions = self.positions.get(meal_type.lower(), np.empty(0, dtype=np.int64))
+            self._arrays[cache_key] = np.asarray(compute(self.foods.iloc[positions]))
+        return self._arrays[cache_key]
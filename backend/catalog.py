@@ -0,0 +1,287 @@
+"""
+Columnar food catalog: a one-time import of a food CSV into a directory of
+memory-mappable .npy column files.
+
+    python catalog.py new_foods.csv new_foods.catalog
+
+The CSV is validated once and stored with normalized dtypes (categorical Meal
+Type and dosha effects, float32 macros) together with the planner's per-food
+feature table (lowercase names, tastes, lexicon bitmask), so AdvancedAyurvedicMealPlanner("new_foods.catalog") opens it
+without parsing or recomputing anything. Numeric columns are memory-mapped,
+so worker processes share them through the page cache.
+
+    python catalog.py annotate new_foods.catalog --allergens dairy nuts gluten
+
+runs the zero-shot allergen classifier over the catalog once and stores one
+score column per allergen, so filter_foods becomes a boolean mask over those
+columns instead of model inference. Re-importing a CSV keeps the scores of
+foods already annotated; annotating again only classifies the new rows.
+"""
+import argparse
+import json
+import os
+import tempfile
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allergen_models import ALLERGY_RUNTIMES, DEFAULT_ALLERGENS
+from json_files import write_json_atomic
+
+CATALOG_VERSION = 1
+META_FILE = "meta.json"
+
+MACRO_COLUMNS = ['Calories', 'Protein (g)', 'Fats (g)', 'Carbs (g)']
+EFFECT_COLUMNS = ['Vata', 'Pitta', 'Kapha']
+REQUIRED_COLUMNS = ['Meal Type', 'Food Name'] + MACRO_COLUMNS + EFFECT_COLUMNS
+EFFECT_SYMBOLS = ['+', '-', '=']
+
+
+def is_catalog(path: str) -> bool:
+    """
+    Whether path is an imported columnar catalog (rather than a CSV)
+    """
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def normalize_catalog(food_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validate a raw food table and return it with normalized dtypes.
+    Raises ValueError describing the first problem found
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in food_df.columns]
+    if missing:
+        raise ValueError(f"Food catalog is missing columns: {', '.join(missing)}")
+
+    df = food_df[REQUIRED_COLUMNS].copy()
+    df['Food Name'] = df['Food Name'].astype(str).str.strip()
+    if (df['Food Name'] == '').any() or food_df['Food Name'].isna().any():
+        raise ValueError("Food catalog has rows without a Food Name")
+
+    meal_types = df['Meal Type'].astype(str).str.strip().str.capitalize()
+    df['Meal Type'] = pd.Categorical(meal_types)
+
+    for column in MACRO_COLUMNS:
+        values = pd.to_numeric(df[column], errors='coerce')
+        bad = values.isna() | (values < 0)
+        if bad.any():
+            row = int(np.argmax(bad.to_numpy()))
+            raise ValueError(f"Invalid {column} value {food_df[column].iloc[row]!r} for '{df['Food Name'].iloc[row]}'")
+        df[column] = values.astype(np.float32)
+
+    for column in EFFECT_COLUMNS:
+        effects = df[column].astype(str).str.strip()
+        bad = ~effects.isin(EFFECT_SYMBOLS)
+        if bad.any():
+            row = int(np.argmax(bad.to_numpy()))
+            raise ValueError(f"Invalid {column} effect {food_df[column].iloc[row]!r} for '{df['Food Name'].iloc[row]}'"
+                             f" (expected one of {' '.join(EFFECT_SYMBOLS)})")
+        df[column] = pd.Categorical(effects, categories=EFFECT_SYMBOLS)
+
+    return df.reset_index(drop=True)
+
+
+def _write_columns(df: pd.DataFrame, directory: str, prefix: str) -> Dict[str, Dict]:
+    """
+    Write each column as .npy; categoricals as int8 codes, strings as fixed-width unicode
+    """
+    columns = {}
+    for position, column in enumerate(df.columns):
+        filename = f"{prefix}{position}.npy"
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(directory, filename), series.cat.codes.to_numpy(dtype=np.int8))
+            columns[column] = {'file': filename, 'kind': 'categorical',
+                               'categories': [str(category) for category in series.cat.categories]}
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            np.save(os.path.join(directory, filename), series.to_numpy())
+            columns[column] = {'file': filename, 'kind': 'numeric'}
+        else:
+            np.save(os.path.join(directory, filename), series.astype(str).to_numpy(dtype=str))
+            columns[column] = {'file': filename, 'kind': 'string'}
+    return columns
+
+
+def _read_columns(directory: str, columns: Dict[str, Dict]) -> pd.DataFrame:
+    data = {}
+    for column, spec in columns.items():
+        values = np.load(os.path.join(directory, spec['file']), mmap_mode='r')
+        if spec['kind'] == 'categorical':
+            data[column] = pd.Categorical.from_codes(values, categories=spec['categories'])
+        elif spec['kind'] == 'string':
+            data[column] = values.astype(object)
+        else:
+            data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def write_catalog(path: str, food_df: pd.DataFrame, features: pd.DataFrame = None,
+                  feature_signature: str = None) -> Dict:
+    """
+    Write a normalized food table (and optionally its feature table) as a columnar catalog
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {
+        'version': CATALOG_VERSION,
+        'rows': len(food_df),
+        'columns': _write_columns(food_df, path, 'col'),
+        'feature_signature': feature_signature if features is not None else None,
+        'features': _write_columns(features, path, 'feat') if features is not None else None
+    }
+    write_json_atomic(os.path.join(path, META_FILE), meta, indent=2)
+    return meta
+
+
+def load_catalog(path: str) -> Tuple[pd.DataFrame, Optional[pd.DataFrame], Optional[str]]:
+    """
+    Open a columnar catalog. Returns (food table, stored feature table or None,
+    signature of the planner settings the features were built with)
+    """
+    with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != CATALOG_VERSION:
+        raise ValueError(f"Unsupported catalog version {meta.get('version')} in {path}; re-run the import")
+
+    food_df = _read_columns(path, meta['columns'])
+    features = None
+    if meta.get('features'):
+        features = _read_columns(path, meta['features'])
+    return food_df, features, meta.get('feature_signature')
+
+
+def load_annotations(path: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Stored allergen scores (one column per allergen, aligned with the food table,
+    NaN for rows not annotated yet) and the model they came from, or (None, None)
+    """
+    with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+        annotations = json.load(f).get('annotations')
+    if not annotations:
+        return None, None
+    return _read_columns(path, annotations['columns']), annotations['model']
+
+
+def write_annotations(path: str, scores: pd.DataFrame, model: str) -> Dict:
+    """
+    Store per-allergen scores (rows aligned with the catalog's food table)
+    """
+    with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if len(scores) != meta['rows']:
+        raise ValueError(f"Annotations have {len(scores)} rows, catalog {path} has {meta['rows']}")
+    meta['annotations'] = {
+        'model': model,
+        'columns': _write_columns(scores.astype(np.float32).reset_index(drop=True), path, 'ann')
+    }
+    write_json_atomic(os.path.join(path, META_FILE), meta, indent=2)
+    return meta
+
+
+def realign_annotations(scores: pd.DataFrame, old_names: pd.Series, new_names: pd.Series) -> pd.DataFrame:
+    """
+    Carry scores over to a new food table by food name; rows of new foods are NaN
+    """
+    by_name = scores.set_axis(old_names.to_numpy()).groupby(level=0).first()
+    return by_name.reindex(new_names.to_numpy()).reset_index(drop=True)
+
+
+def import_catalog(csv_path: str, output_path: str) -> Dict:
+    """
+    Validate a food CSV, normalize it and write it with its planner features.
+    Allergen scores of a catalog already at output_path are kept for foods that
+    are still in the CSV
+    """
+    # Imported here: the planner itself reads catalogs through this module
+    from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+    previous = None
+    if is_catalog(output_path):
+        scores, model = load_annotations(output_path)
+        if scores is not None:
+            previous = (np.array(scores), list(scores.columns), load_catalog(output_path)[0]['Food Name'].copy(), model)
+
+    # Features are built from the normalized table, so stage it as a catalog first
+    with tempfile.TemporaryDirectory() as staging_path:
+        write_catalog(staging_path, normalize_catalog(pd.read_csv(csv_path)))
+        planner = AdvancedAyurvedicMealPlanner(staging_path, allergy_backend='keyword')
+        meta = write_catalog(output_path, planner.food_df, planner.food_features, planner.feature_signature())
+
+    if previous is not None:
+        values, columns, old_names, model = previous
+        scores = realign_annotations(pd.DataFrame(values, columns=columns), old_names, planner.food_df['Food Name'])
+        meta = write_annotations(output_path, scores, model)
+    return meta
+
+
+def annotate_catalog(path: str, allergens: List[str] = None, **planner_kwargs) -> Dict:
+    """
+    Score every food of a catalog against allergens with the planner's zero-shot
+    model and store the scores. Only rows without scores for an allergen (new
+    foods, new allergens) are classified, through the planner's score cache;
+    annotations from another model are replaced
+    """
+    from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+    planner = AdvancedAyurvedicMealPlanner(path, allergy_backend='zeroshot', **planner_kwargs)
+    food_names = planner.food_df['Food Name']
+    labels = list(dict.fromkeys(allergen.strip().lower() for allergen in allergens or DEFAULT_ALLERGENS))
+
+    scores, model = load_annotations(path)
+    if scores is None or model != planner.allergy_model_key():
+        scores = pd.DataFrame(index=food_names.index)
+    labels = list(dict.fromkeys(list(scores.columns) + labels))
+    # Copied: stored columns are read-only memory maps
+    values = scores.reindex(columns=labels).to_numpy(dtype=np.float32, copy=True)
+
+    pending = np.isnan(values)
+    pending_rows = pending.any(axis=1)
+    names = food_names[pending_rows].unique().tolist()
+    if names:
+        new_scores = planner.score_allergens(names, labels)
+        for column, label in enumerate(labels):
+            rows = np.flatnonzero(pending[:, column])
+            values[rows, column] = [new_scores[name][label] for name in food_names.iloc[rows]]
+
+    write_annotations(path, pd.DataFrame(values, columns=labels), planner.allergy_model_key())
+    return {'rows': len(values), 'annotated_rows': int(pending_rows.sum()), 'classified_foods': len(names),
+            'allergens': labels, 'model': planner.allergy_model_key()}
+
+
+def annotate_main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="catalog.py annotate",
+                                     description="Store zero-shot allergen scores as catalog columns")
+    parser.add_argument("catalog", help="Catalog directory written by the import")
+    parser.add_argument("--allergens", nargs='+', default=None, help="Allergen labels (default: the planner's)")
+    parser.add_argument("--allergy-model", default=None, help="Zero-shot NLI model id")
+    parser.add_argument("--allergy-runtime", default="torch", choices=ALLERGY_RUNTIMES)
+    parser.add_argument("--allergy-cache-dir", default=".allergy_cache")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    planner_kwargs = {'allergy_runtime': args.allergy_runtime, 'allergy_cache_dir': args.allergy_cache_dir,
+                      'allergy_batch_size': args.batch_size}
+    if args.allergy_model:
+        planner_kwargs['allergy_model_id'] = args.allergy_model
+    summary = annotate_catalog(args.catalog, args.allergens, **planner_kwargs)
+    print(f"Annotated {summary['annotated_rows']} of {summary['rows']} rows "
+          f"({summary['classified_foods']} foods classified) for {', '.join(summary['allergens'])}")
+
+
+def main():
+    if sys.argv[1:2] == ['annotate']:
+        annotate_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Import a food CSV into the columnar catalog format")
+    parser.add_argument("csv", help="Food CSV (Meal Type, Food Name, macros, Vata/Pitta/Kapha)")
+    parser.add_argument("output", help="Catalog directory to write, e.g. new_foods.catalog")
+    args = parser.parse_args()
+
+    meta = import_catalog(args.csv, args.output)
+    print(f"Imported {meta['rows']} foods into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List
+
+from json_files import JSONFileCache
+
+
+def dessert_model_key(metadata: Dict) -> str:
+    """
+    Short stable hash of a dessert model's metadata (base model, labels, training
+    run, config); retraining or swapping the model changes it
+    """
+    payload = json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class DessertLabelCache(JSONFileCache):
+    """
+    On-disk cache of dessert classifier labels, one JSON file per model key, so a
+    food name is only run through a given model once across restarts
+    """
+
+    key_field = 'model_key'
+    entries_field = 'labels'
+    description = 'dessert label cache'
+
+    def __init__(self, cache_dir: str = ".dessert_cache", model_key: str = "default"):
+        self.model_key = model_key
+        super().__init__(cache_dir, model_key, os.path.join(cache_dir, f"dessert_labels_{model_key}.json"))
+
+    def get(self, food_name: str):
+        """
+        Return the cached label for a food name, or None if unseen
+        """
+        return self._entries.get(food_name)
+
+    def missing(self, food_names: Iterable[str]) -> List[str]:
+        """
+        Food names that have never been labelled by this model
+        """
+        return [name for name in food_names if name not in self._entries]
+
+    def update(self, labels: Dict[str, str]):
+        """
+        Record freshly predicted labels
+        """
+        with self._lock:
+            self._entries.update(labels)
+            self._dirty = True
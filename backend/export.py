@@ -0,0 +1,260 @@
+import abc
+import csv
+import json
+import os
+import re
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+PLAN_COLUMNS = [
+    'Day', 'Meal Type', 'Food Name', 'Portion (g)', 'Calories',
+    'Protein (g)', 'Carbs (g)', 'Fats (g)', 'Vata Effect',
+    'Pitta Effect', 'Kapha Effect', 'Tastes', 'Allergy Warnings'
+]
+
+# Summary rows are padded to the widest row (the daily calories table)
+SUMMARY_WIDTH = 5
+
+# Allergy warnings name their food as "...For '<food name>', consider: ..."
+WARNING_FOOD_PATTERN = re.compile(r"For '(.+?)', consider: ")
+
+
+def index_allergy_warnings(day_warnings: List[str]) -> Dict[str, List[str]]:
+    """
+    Group a day's allergy warnings by the food they are about
+    """
+    by_food = {}
+    for warning in day_warnings:
+        match = WARNING_FOOD_PATTERN.search(warning)
+        if match:
+            by_food.setdefault(match.group(1), []).append(warning)
+    return by_food
+
+
+def iter_plan_rows(meal_plan: Dict) -> Iterator[List]:
+    """
+    One row (in PLAN_COLUMNS order) per food of a weekly plan
+    """
+    for day, day_plan in meal_plan['weekly_plan'].items():
+        warnings_by_food = index_allergy_warnings(meal_plan['weekly_allergy_warnings'].get(day, []))
+        for meal_type, meal in day_plan['meals'].items():
+            for food in meal['foods']:
+                yield [
+                    day,
+                    meal_type.capitalize(),
+                    food['name'],
+                    food['portion'],
+                    food['calories'],
+                    food['protein'],
+                    food['carbs'],
+                    food['fats'],
+                    food['vata_effect'],
+                    food['pitta_effect'],
+                    food['kapha_effect'],
+                    food['tastes'],
+                    " | ".join(warnings_by_food.get(food['name'], []))
+                ]
+
+
+def iter_summary_rows(meal_plan: Dict) -> Iterator[List]:
+    """
+    Rows of the two-column plan summary: profile, daily calories and allergy warnings
+    """
+    summary = meal_plan['nutrition_summary']
+    yield ['User Profile', '']
+    yield ['Age', summary.get('age', '')]
+    yield ['Height (cm)', summary.get('height', '')]
+    yield ['Weight (kg)', summary.get('weight', '')]
+    yield ['Gender', summary.get('gender', '')]
+    yield ['Prakriti', summary['prakriti']]
+    yield ['Vikriti', summary['vikriti']]
+    yield ['Dietary Preference', summary['dietary_preference']]
+    yield ['Allergies', ', '.join(summary['allergies'])]
+    yield ['Daily Calorie Target', summary['daily_calorie_target']]
+    yield ['Calories per Meal Target', summary['calories_per_meal_target']]
+    yield ['', '']
+
+    yield ['Daily Nutrition Summary', '']
+    yield ['Day', 'Total Calories', 'Breakfast Calories', 'Lunch Calories', 'Dinner Calories']
+    for day, day_plan in meal_plan['weekly_plan'].items():
+        meals = day_plan['meals']
+        yield [day, day_plan['total_calories'], meals['breakfast']['total_calories'],
+               meals['lunch']['total_calories'], meals['dinner']['total_calories']]
+
+    yield ['', '']
+    yield ['Allergy Warnings', '']
+    if meal_plan['weekly_allergy_warnings']:
+        for day, warnings in meal_plan['weekly_allergy_warnings'].items():
+            for warning in warnings:
+                yield [day, warning]
+    else:
+        yield ['No allergy warnings', '']
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class PlanWriter(abc.ABC):
+    """
+    Writes weekly plans one food row at a time. With patient_column=True every row
+    starts with a 'Patient ID' column, so many patients can share one file.
+    Use as a context manager, or call close()
+    """
+
+    def __init__(self, path: str, append: bool = False, patient_column: bool = False):
+        self.path = path
+        self.append = append
+        self.columns = (['Patient ID'] if patient_column else []) + PLAN_COLUMNS
+        self.patient_column = patient_column
+        self.rows_written = 0
+
+    def write_plan(self, meal_plan: Dict, patient_id: str = None) -> int:
+        """
+        Append a plan's rows; returns the number of rows written
+        """
+        prefix = [patient_id] if self.patient_column else []
+        rows = 0
+        for row in iter_plan_rows(meal_plan):
+            self.write_row(prefix + [_plain(value) for value in row])
+            rows += 1
+        self.flush()
+        self.rows_written += rows
+        return rows
+
+    @abc.abstractmethod
+    def write_row(self, row: List):
+        """
+        Write one row in self.columns order
+        """
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CSVPlanWriter(PlanWriter):
+    def __init__(self, path: str, append: bool = False, patient_column: bool = False):
+        super().__init__(path, append, patient_column)
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self._file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if write_header:
+            self._writer.writerow(self.columns)
+
+    def write_row(self, row: List):
+        self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLPlanWriter(PlanWriter):
+    def __init__(self, path: str, append: bool = False, patient_column: bool = False):
+        super().__init__(path, append, patient_column)
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write_row(self, row: List):
+        self._file.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPlanWriter(PlanWriter):
+    """
+    Writes one Parquet row group per plan. Requires pyarrow; Parquet files cannot be
+    appended to once closed, so append=True is only accepted for a new file
+    """
+
+    def __init__(self, path: str, append: bool = False, patient_column: bool = False):
+        super().__init__(path, append, patient_column)
+        if append and os.path.exists(path):
+            raise ValueError("Parquet plan files cannot be appended to; write a new file or use CSV/JSONL")
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+        self._pa = pa
+        fields = [pa.field(column, pa.string()) for column in self.columns]
+        for column in ['Portion (g)', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']:
+            fields[self.columns.index(column)] = pa.field(column, pa.float64())
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._pending = []
+
+    def write_row(self, row: List):
+        self._pending.append(row)
+
+    def flush(self):
+        if not self._pending:
+            return
+        columns = list(zip(*self._pending))
+        arrays = [self._pa.array(values, type=field.type) for values, field in zip(columns, self._schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+class SummaryWriter:
+    """
+    Writes plan summaries to one CSV, one section per plan (headed by the patient id
+    when given)
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self._file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+
+    def write_summary(self, meal_plan: Dict, patient_id: str = None):
+        if patient_id is not None:
+            self._writer.writerow(['Patient ID', patient_id])
+        for row in iter_summary_rows(meal_plan):
+            self._writer.writerow([_plain(value) for value in row] + [''] * (SUMMARY_WIDTH - len(row)))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+PLAN_WRITERS = {'csv': CSVPlanWriter, 'jsonl': JSONLPlanWriter, 'parquet': ParquetPlanWriter}
+
+
+def open_plan_writer(path: str, fmt: str = None, append: bool = False, patient_column: bool = False) -> PlanWriter:
+    """
+    Plan writer for the format given, or inferred from the file extension
+    """
+    if fmt is None:
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        fmt = {'ndjson': 'jsonl', 'pq': 'parquet'}.get(extension, extension)
+    if fmt not in PLAN_WRITERS:
+        raise ValueError(f"Unknown plan export format '{fmt}' (expected one of {', '.join(PLAN_WRITERS)})")
+    return PLAN_WRITERS[fmt](path, append=append, patient_column=patient_column)
@@ -0,0 +1,209 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Dict, Optional
+
+import pulp
+
+# Recorder for the plan being built in the current thread/context, or None when
+# instrumentation is off (every helper below is then a no-op)
+_current = contextvars.ContextVar('plan_instrumentation', default=None)
+
+
+class PlanInstrumentation:
+    """
+    Timings for one weekly plan: wall time per stage, one record per solver call
+    and the number of fallback selections, grouped by reason.
+
+    Stages nest (e.g. allergen_classification runs inside filter_foods), so stage
+    times are inclusive and do not add up to the total
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.solves = []
+        self.fallbacks: Dict[str, int] = {}
+        self.slot = None
+        self.cache_hit = False
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'cache_hit': self.cache_hit,
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            'solver': {
+                'solves': len(self.solves),
+                'total_ms': round(sum(solve['seconds'] for solve in self.solves) * 1000, 3),
+                'meals': [
+                    {**{key: value for key, value in solve.items() if key != 'seconds'},
+                     'ms': round(solve['seconds'] * 1000, 3)}
+                    for solve in self.solves
+                ]
+            },
+            'fallbacks': sum(self.fallbacks.values()),
+            'fallback_reasons': dict(self.fallbacks)
+        }
+
+
+@contextlib.contextmanager
+def recording(enabled: bool = True):
+    """
+    Collect instrumentation for everything run inside the block. Yields the
+    recorder, or None when disabled
+    """
+    recorder = PlanInstrumentation() if enabled else None
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Add the wall time of the block to the named stage
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_stage(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def slot(label: str):
+    """
+    Label solver calls made inside the block with the meal slot being planned
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    previous, recorder.slot = recorder.slot, label
+    try:
+        yield
+    finally:
+        recorder.slot = previous
+
+
+def solve(prob: pulp.LpProblem, solver=None) -> int:
+    """
+    Solve prob, recording solver status, wall time and model size when instrumented
+    """
+    recorder = _current.get()
+    if recorder is None:
+        return prob.solve(solver)
+    start = time.perf_counter()
+    try:
+        return prob.solve(solver)
+    finally:
+        seconds = time.perf_counter() - start
+        recorder.add_stage('solve', seconds)
+        recorder.solves.append({
+            'meal': recorder.slot,
+            'model': prob.name,
+            'status': pulp.LpStatus.get(prob.status, str(prob.status)),
+            # Tells a proven optimum from the best solution at the time limit, both 'Optimal' above
+            'solution': pulp.LpSolution.get(prob.sol_status, str(prob.sol_status)),
+            'variables': prob.numVariables(),
+            'constraints': prob.numConstraints(),
+            'seconds': seconds
+        })
+
+
+def mark_cache_hit():
+    """
+    Note that the plan was served from the plan cache
+    """
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.cache_hit = True
+
+
+def fallback(reason: str):
+    """
+    Count a fallback selection (solver failure, classifier failure, ...)
+    """
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.fallbacks[reason] = recorder.fallbacks.get(reason, 0) + 1
+
+
+class PlannerMetrics:
+    """
+    Thread-safe totals of plan instrumentation across plans, exported in the
+    Prometheus text format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.plans = 0
+        self.cache_hits = 0
+        self.stages: Dict[str, list] = {}  # stage -> [count, total seconds]
+        self.solves: Dict[str, list] = {}  # status -> [count, total seconds]
+        self.max_variables = 0
+        self.max_constraints = 0
+        self.fallbacks: Dict[str, int] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def observe(self, recorder: Optional[PlanInstrumentation]):
+        if recorder is None:
+            return
+        with self._lock:
+            self.plans += 1
+            self.cache_hits += int(recorder.cache_hit)
+            for name, seconds in recorder.stages.items():
+                stats = self.stages.setdefault(name, [0, 0.0])
+                stats[0] += 1
+                stats[1] += seconds
+            for record in recorder.solves:
+                stats = self.solves.setdefault(record['status'], [0, 0.0])
+                stats[0] += 1
+                stats[1] += record['seconds']
+                self.max_variables = max(self.max_variables, record['variables'])
+                self.max_constraints = max(self.max_constraints, record['constraints'])
+            for reason, count in recorder.fallbacks.items():
+                self.fallbacks[reason] = self.fallbacks.get(reason, 0) + count
+
+    def to_text(self) -> str:
+        with self._lock:
+            lines = [
+                '# TYPE planner_plans_total counter',
+                f'planner_plans_total {self.plans}',
+                '# TYPE planner_plan_cache_hits_total counter',
+                f'planner_plan_cache_hits_total {self.cache_hits}',
+                '# TYPE planner_build_stage_seconds summary'
+            ]
+            for name, (count, total) in sorted(self.stages.items()):
+                lines.append(f'planner_build_stage_seconds_count{{stage="{name}"}} {count}')
+                lines.append(f'planner_build_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append('# TYPE planner_solver_seconds summary')
+            for status, (count, total) in sorted(self.solves.items()):
+                lines.append(f'planner_solver_seconds_count{{status="{status}"}} {count}')
+                lines.append(f'planner_solver_seconds_sum{{status="{status}"}} {total:.6f}')
+            lines.append('# TYPE planner_solver_model_variables_max gauge')
+            lines.append(f'planner_solver_model_variables_max {self.max_variables}')
+            lines.append('# TYPE planner_solver_model_constraints_max gauge')
+            lines.append(f'planner_solver_model_constraints_max {self.max_constraints}')
+            lines.append('# TYPE planner_fallbacks_total counter')
+            for reason, count in sorted(self.fallbacks.items()):
+                lines.append(f'planner_fallbacks_total{{reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
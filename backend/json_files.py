@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+from typing import Dict
+
+import numpy as np
+
+
+def json_default(value):
+    """
+    json.dump default that converts numpy scalars to Python numbers
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_json_atomic(path: str, data, **dump_kwargs):
+    """
+    Write data as JSON through a per-process temporary file and os.replace, so
+    readers never see a partly written file
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+
+class JSONFileCache:
+    """
+    Dict of entries persisted as one JSON file {key_field: key, entries_field: entries}.
+    A file written for another key (e.g. another model) is ignored on load, and with
+    persist=False updates stay in memory (e.g. in worker processes, so that only the
+    parent writes the file). Subclasses set the field names and description and add
+    lookups over _entries
+    """
+
+    key_field = 'key'
+    entries_field = 'entries'
+    description = 'cache'
+
+    def __init__(self, cache_dir: str, key: str, path: str):
+        self.cache_dir = cache_dir
+        self.key = key
+        self.path = path
+        self._entries: Dict = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.persist = True
+        self.load()
+
+    def load(self):
+        """
+        Load previously persisted entries for this key, if any
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get(self.key_field) == self.key:
+                self._entries = data.get(self.entries_field, {})
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable {self.description} {self.path}: {e}")
+
+    def save(self):
+        """
+        Persist the cache atomically if anything changed since the last save
+        """
+        with self._lock:
+            if not self._dirty or not self.persist:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_json_atomic(self.path, {self.key_field: self.key, self.entries_field: self._entries})
+            self._dirty = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,126 @@
+import re
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+# Ingredient keywords per allergen / food group. Matching is case-insensitive and
+# also catches compounds that start with a keyword ("milkshake", "cheesecake"),
+# except for the words in COMPOUND_EXCEPTIONS
+FOOD_LEXICON = {
+    'nuts': ['almond', 'cashew', 'walnut', 'pistachio', 'nut', 'peanut', 'groundnut', 'hazelnut', 'coconut'],
+    'dairy': ['dairy', 'milk', 'buttermilk', 'cheese', 'yogurt', 'butter', 'paneer', 'ghee', 'cream'],
+    'gluten': ['wheat', 'gluten', 'atta', 'maida'],
+    'seafood': ['seafood', 'fish', 'prawn', 'shrimp'],
+    'eggs': ['egg', 'anda', 'andaa'],
+    'meat': ['chicken', 'mutton', 'meat', 'keema']
+}
+
+# Words that start with a food group keyword without containing that food
+COMPOUND_EXCEPTIONS = ['eggplant', 'butternut', 'nutmeg']
+
+# Dishes that are often prepared with an allergen even if the name does not say so
+PREPARED_WITH_LEXICON = {
+    'dairy': ['curry', 'sabzi', 'pulao', 'biryani', 'paratha']
+}
+
+# Food groups excluded by each dietary preference
+DIET_EXCLUSIONS = {
+    'vegetarian': ['meat', 'seafood', 'eggs'],
+    'veg': ['meat', 'seafood', 'eggs'],
+    'vegan': ['meat', 'seafood', 'eggs', 'dairy']
+}
+
+
+def _alternation(keywords: Iterable[str]) -> str:
+    # Longest keywords first so e.g. "buttermilk" wins over "butter"
+    return '|'.join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+
+
+def _found_keyword(found) -> str:
+    # findall yields one string per match, or a tuple of groups when the pattern has
+    # a whole-word and a compound alternation (only one of them is non-empty)
+    return ''.join(found) if isinstance(found, tuple) else found
+
+
+class LexiconMatcher:
+    """
+    Single compiled word-boundary alternation over every keyword of a lexicon.
+    Matching returns a bitmask with one bit per lexicon category. With
+    whole_words=False keywords only need to start a word ("soy" matches "soybean");
+    compound_categories get that for their keywords only, and exceptions are whole
+    words that never match ("eggplant")
+    """
+
+    def __init__(self, lexicon: Dict[str, List[str]], whole_words: bool = True,
+                 compound_categories: Iterable[str] = (), exceptions: Iterable[str] = ()):
+        self.categories = list(lexicon)
+        self.bits = {category: 1 << i for i, category in enumerate(self.categories)}
+
+        self.keyword_bits: Dict[str, int] = {}
+        for category, keywords in lexicon.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self.keyword_bits[keyword] = self.keyword_bits.get(keyword, 0) | self.bits[category]
+
+        # Whole-word keywords (and exceptions, which carry no bits) are tried before
+        # compound keywords, so "eggplant" is claimed before "egg" can start a compound
+        compound_bits = self.category_mask(compound_categories)
+        compound = [keyword for keyword, bits in self.keyword_bits.items() if bits & compound_bits]
+        whole = [keyword for keyword in self.keyword_bits if keyword not in compound]
+        for exception in exceptions:
+            exception = exception.lower()
+            self.keyword_bits.setdefault(exception, 0)
+            whole.append(exception)
+
+        suffix = r"(?:e?s)?\b" if whole_words else ""
+        branches = []
+        if whole:
+            branches.append(rf"({_alternation(whole)}){suffix}")
+        if compound:
+            branches.append(rf"({_alternation(compound)})\w*")
+        self.pattern = re.compile(rf"\b(?:{'|'.join(branches)})", re.IGNORECASE)
+
+    def category_mask(self, categories: Iterable[str]) -> int:
+        """
+        Bitmask for the given categories (unknown categories are ignored)
+        """
+        mask = 0
+        for category in categories:
+            mask |= self.bits.get(category.lower(), 0)
+        return mask
+
+    def match(self, text: str) -> int:
+        """
+        Bitmask of the categories whose keywords appear in a single string
+        """
+        mask = 0
+        for found in self.pattern.findall(text):
+            mask |= self.keyword_bits[_found_keyword(found).lower()]
+        return mask
+
+    def match_series(self, texts: pd.Series) -> np.ndarray:
+        """
+        Bitmask per element of a string column, computed in one vectorized pass
+        """
+        matches = texts.astype(str).str.findall(self.pattern).tolist()
+        lengths = np.fromiter((len(found) for found in matches), dtype=np.int64, count=len(matches))
+        masks = np.zeros(len(matches), dtype=np.int64)
+        if lengths.sum():
+            positions = np.repeat(np.arange(len(matches)), lengths)
+            keyword_masks = np.fromiter(
+                (self.keyword_bits[_found_keyword(keyword).lower()] for found in matches for keyword in found),
+                dtype=np.int64, count=int(lengths.sum())
+            )
+            np.bitwise_or.at(masks, positions, keyword_masks)
+        return masks
+
+
+def build_food_lexicon() -> Dict[str, List[str]]:
+    """
+    Combined lexicon: food groups plus "prepared with" categories (prefixed "prepared:")
+    """
+    lexicon = {category: list(keywords) for category, keywords in FOOD_LEXICON.items()}
+    for category, keywords in PREPARED_WITH_LEXICON.items():
+        lexicon[f'prepared:{category}'] = list(keywords)
+    return lexicon
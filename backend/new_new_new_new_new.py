@@ -1,28 +1,229 @@
 import pandas as pd
 import pulp
 import numpy as np
-from transformers import pipeline
 from datetime import datetime
+import hashlib
+import json
+import copy
 import re
-from typing import Dict, List, Tuple, Set
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Set, Union
 import warnings
+import instrumentation
+from allergen_batcher import AllergenBatcher, group_by_labels
+from allergen_cache import AllergenScoreCache
+from allergen_models import (ALLERGY_RUNTIMES, ALLERGY_THRESHOLD, DEFAULT_ALLERGY_MODEL, allergy_model_key,
+                             classify_batches, load_zero_shot_classifier)
+from candidates import MealCandidates
+from export import CSVPlanWriter, SummaryWriter
+from catalog import is_catalog, load_annotations, load_catalog
+from lexicon import COMPOUND_EXCEPTIONS, DIET_EXCLUSIONS, FOOD_LEXICON, LexiconMatcher, build_food_lexicon
+from plan_cache import PlanCache, catalog_content_hash, make_plan_key, normalize_profile
+from portions import portion_grams
 warnings.filterwarnings('ignore')
 
+DOSHAS = ['Vata', 'Pitta', 'Kapha']
+
+# Integer encoding of the symbolic dosha effect columns (+ aggravates, - pacifies, = neutral)
+EFFECT_CODES = {'+': 1, '-': -1, '=': 0}
+
+# Version of the build_food_features column layout; part of the feature signature,
+# so catalogs imported with an older layout get their features rebuilt
+FEATURE_LAYOUT_VERSION = 2
+
+# Acceptable macronutrient ranges as shares of meal energy: (min share, max share, kcal per gram)
+MACRO_ENERGY_SHARES = {
+    'Protein (g)': (0.10, 0.35, 4),
+    'Fats (g)': (0.20, 0.35, 9),
+    'Carbs (g)': (0.45, 0.65, 4)
+}
+
+# Activity multipliers applied to the basal metabolic rate
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,
+    'light': 1.375,
+    'moderate': 1.55,
+    'active': 1.725,
+    'very active': 1.9,
+    'athlete': 1.9
+}
+
+# Daily calorie adjustment per weight goal
+GOAL_CALORIE_FACTORS = {'maintain': 1.0, 'loss': 0.85, 'gain': 1.15}
+
+# MILP backends for the PuLP models: CBC ships with PuLP, HiGHS requires highspy
+SOLVER_BACKENDS = ('cbc', 'highs')
+
+# Joint weekly mode: time limit (seconds) and relative MIP gap per solve when the
+# planner sets none
+JOINT_TIME_LIMIT = 10.0
+JOINT_MIP_GAP = 1e-4
+
+# Joint weekly mode: objective penalty per repeated food, above any dosha or calorie gain
+JOINT_REPEAT_PENALTY = 1000.0
+
+# Joint weekly mode: a week with days outside their calorie bands costs as much as the
+# score range of its candidates per this share of the daily calories outside (times
+# calorie_slack_penalty)
+JOINT_CALORIE_TOLERANCE = 0.01
+
+# Narrowings of the weekly calorie band (share of the week's calories) tried in turn
+# when the joint week's days do not all fit their daily bands
+JOINT_CALORIE_MARGINS = [0.0, 0.05, 0.1]
+
+def caloric_needs(age: int, height: float, weight: float, gender: str,
+                  activity_level: str, goal: str = 'maintain') -> Tuple[float, float]:
+    """
+    Daily calories (Mifflin-St Jeor BMR x activity, adjusted for the weight goal)
+    and calories per main meal. Unknown activity levels count as moderate and
+    unknown goals as maintain
+    """
+    # Basal Metabolic Rate (BMR)
+    if gender.lower() == 'male':
+        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+    else:  # female
+        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+    
+    multiplier = ACTIVITY_MULTIPLIERS.get(activity_level.lower(), ACTIVITY_MULTIPLIERS['moderate'])
+    daily_calories = bmr * multiplier * GOAL_CALORIE_FACTORS.get((goal or 'maintain').lower(), 1.0)
+    
+    # Calculate calories per meal (3 main meals)
+    return daily_calories, daily_calories / 3
+
+def macro_targets(calories: float) -> Dict[str, Tuple[float, float]]:
+    """
+    Macronutrient ranges in grams for the given calories
+    """
+    return {
+        nutrient: (calories * low / kcal_per_gram, calories * high / kcal_per_gram)
+        for nutrient, (low, high, kcal_per_gram) in MACRO_ENERGY_SHARES.items()
+    }
+
 class AdvancedAyurvedicMealPlanner:
-    def __init__(self, food_data_path: str = "food.csv"):
+    def __init__(self, food_data_path: Union[str, pd.DataFrame] = "food.csv", allergy_batch_size: int = 32,
+                 allergy_cache_dir: str = ".allergy_cache", meal_selector: str = "auto",
+                 weekly_mode: str = "greedy", items_per_meal: int = 1,
+                 allergy_backend: str = "auto", plan_cache: PlanCache = None,
+                 instrument: bool = False, alternatives_per_meal: int = 0,
+                 allergy_batch_window_ms: float = 0.0, allergy_model_id: str = DEFAULT_ALLERGY_MODEL,
+                 allergy_runtime: str = "torch", solver_backend: str = "cbc",
+                 solver_time_limit: float = None, solver_threads: int = 1,
+                 solver_gap: float = None, solver_seed: int = None):
         """
-        Initialize the meal planner with food data and Ayurvedic knowledge
+        Initialize the meal planner with food data and Ayurvedic knowledge.
+        food_data_path is a food CSV, a columnar catalog written by catalog.py or
+        an already loaded food table
         """
-        self.food_df = pd.read_csv(food_data_path)
+        stored_features = stored_signature = None
+        self.allergen_annotations = self.allergen_annotation_model = None
+        if isinstance(food_data_path, pd.DataFrame):
+            self.food_df = food_data_path.reset_index(drop=True)
+        elif is_catalog(food_data_path):
+            self.food_df, stored_features, stored_signature = load_catalog(food_data_path)
+            self.allergen_annotations, self.allergen_annotation_model = load_annotations(food_data_path)
+        else:
+            self.food_df = pd.read_csv(food_data_path)
+        self.catalog_hash = catalog_content_hash(self.food_df)
+        
+        # Zero-shot NLI model and how it runs on CPU ('torch', 'int8' or 'onnx'; see
+        # allergen_models.py and allergen_eval.py for the speed/agreement trade-off)
+        if allergy_runtime not in ALLERGY_RUNTIMES:
+            raise ValueError(f"Unknown allergy_runtime '{allergy_runtime}'")
+        self.allergy_model_id = allergy_model_id
+        self.allergy_runtime = allergy_runtime
+        self.allergy_threshold = ALLERGY_THRESHOLD  # Confidence threshold for zero-shot allergen scores
+        self.allergy_batch_size = allergy_batch_size
+        self.allergy_cache = AllergenScoreCache(allergy_cache_dir, self.allergy_model_key())
+        
+        # Allergen detection: 'keyword' never loads a model, 'zeroshot' requires the
+        # Hugging Face classifier, 'auto' tries the classifier and falls back to keywords.
+        # The classifier (and the transformers/torch import) is loaded on first use, so
+        # plans without allergies never pay for it
+        if allergy_backend not in ('keyword', 'zeroshot', 'auto'):
+            raise ValueError(f"Unknown allergy_backend '{allergy_backend}'")
+        self.allergy_backend = allergy_backend
         self.allergy_classifier = None
-        self.setup_allergy_classifier()
+        self.allergy_classifier_attempted = False
+        self.allergy_classifier_lock = threading.Lock()
+        
+        # With a batch window, classifier calls from concurrently built plans are queued
+        # for up to that many milliseconds and run as one batch (see AllergenBatcher);
+        # 0 classifies each plan's foods on its own thread
+        if allergy_batch_window_ms < 0:
+            raise ValueError("allergy_batch_window_ms cannot be negative")
+        self.allergy_batch_window_ms = allergy_batch_window_ms
+        self.allergy_batcher = None
+        self.allergy_batcher_lock = threading.Lock()
         
         # Standard portion size in grams (max 350g per meal)
         self.standard_portion = 250  # grams
         self.max_portion = 350  # grams
         
-        # Track used foods to avoid repetition
-        self.used_foods = set()
+        # Meal composition: up to items_per_meal foods per meal, with portion sizes and
+        # macronutrient bands optimized jointly when more than one item is allowed
+        if items_per_meal < 1:
+            raise ValueError("items_per_meal must be at least 1")
+        self.items_per_meal = items_per_meal
+        self.min_item_portion = 50  # grams
+        # Objective cost of each item of a composed meal, so a meal is only split into
+        # several foods when that scores better (not to spread a portion over near-duplicates)
+        self.item_penalty = 0.05
+        
+        # Meal selection engine: 'vectorized' (NumPy argmax), 'pulp' (LP model solved by CBC),
+        # or 'auto', which uses the vectorized selector for single-item meals and PuLP otherwise
+        if meal_selector not in ('auto', 'vectorized', 'pulp'):
+            raise ValueError(f"Unknown meal_selector '{meal_selector}'")
+        if meal_selector == 'vectorized' and items_per_meal > 1:
+            raise ValueError("The vectorized selector only supports single-item meals")
+        self.meal_selector = meal_selector
+        
+        # Weekly planning: 'greedy' solves the 21 slots one at a time, 'joint' solves the
+        # whole week as a single MILP with no-repeat and daily calorie constraints
+        if weekly_mode not in ('greedy', 'joint'):
+            raise ValueError(f"Unknown weekly_mode '{weekly_mode}'")
+        if weekly_mode == 'joint' and items_per_meal > 1:
+            raise ValueError("weekly_mode='joint' only supports single-item meals")
+        self.weekly_mode = weekly_mode
+        
+        # MILP solver settings shared by every PuLP model. A single thread and a fixed
+        # seed (the solver's built-in one when unset) make solves reproducible; the time
+        # limit (seconds per solve) bounds latency, and a stopped solve returns its best
+        # meal so far or falls back
+        if solver_backend not in SOLVER_BACKENDS:
+            raise ValueError(f"Unknown solver_backend '{solver_backend}'")
+        if solver_time_limit is not None and solver_time_limit <= 0:
+            raise ValueError("solver_time_limit must be positive")
+        if solver_threads < 1:
+            raise ValueError("solver_threads must be at least 1")
+        if solver_gap is not None and solver_gap < 0:
+            raise ValueError("solver_gap cannot be negative")
+        if solver_seed is not None and solver_seed < 1:
+            # CBC seeds from the clock when given 0
+            raise ValueError("solver_seed must be a positive integer")
+        self.solver_backend = solver_backend
+        self.solver_time_limit = solver_time_limit
+        self.solver_threads = solver_threads
+        self.solver_gap = solver_gap
+        self.solver_seed = solver_seed
+        if not self.make_solver().available():
+            raise ValueError(f"The '{solver_backend}' solver backend is not available (HiGHS requires highspy)")
+        
+        # Objective penalty per kcal outside the calorie band in composition mode, and its
+        # multiplier in joint mode (see JOINT_CALORIE_TOLERANCE)
+        self.calorie_slack_penalty = 1.0
+        
+        # Foods per meal type the joint week chooses from, by score and by calorie fit
+        # (so the weekly model stays the same size for any catalog)
+        self.joint_candidates_per_meal = 50
+        
+        # Penalty on the score of foods already served this week
+        self.reuse_penalty = 10.0
+        
+        # Ranked "other options" listed with each meal of the plan
+        if alternatives_per_meal < 0:
+            raise ValueError("alternatives_per_meal cannot be negative")
+        self.alternatives_per_meal = alternatives_per_meal
         
         # Taste to dosha mappings
         self.taste_effects = {
@@ -105,20 +306,98 @@ class AdvancedAyurvedicMealPlanner:
             }
         }
         
+        # Compiled allergen/diet keyword matcher, plus matchers for ad-hoc allergies
+        self.lexicon_matcher = LexiconMatcher(build_food_lexicon(), compound_categories=FOOD_LEXICON,
+                                              exceptions=COMPOUND_EXCEPTIONS)
+        self.extra_allergy_matchers = {}
+        
+        # Per-food taste, dosha and lexicon features, computed once for the whole catalog
+        # (or taken from an imported catalog built with the same taste/lexicon tables)
+        if stored_features is not None and stored_signature == self.feature_signature():
+            self.food_features = stored_features
+        else:
+            self.food_features = self.build_food_features(self.food_df)
+        
+        # Filtered catalogs of recent (diet, allergies) combinations, reused by
+        # replan_slot and repeated plans
+        self.filtered_cache_size = 32
+        self.filtered_foods_cache = OrderedDict()
+        self.filtered_foods_lock = threading.Lock()
+        
+        # Optional cache of finished plans, keyed by profile + catalog content hash
+        self.plan_cache = plan_cache
+        if plan_cache is not None:
+            plan_cache.prune(self.catalog_hash)
+        
+        # Optional per-stage and solver instrumentation: each plan gets a 'timings'
+        # block, and totals across plans are kept in self.metrics
+        self.instrument = instrument
+        self.metrics = instrumentation.PlannerMetrics() if instrument else None
+        
     def setup_allergy_classifier(self):
         """
-        Set up the Hugging Face model for allergy classification
+        Set up the Hugging Face model for allergy classification. With the 'zeroshot'
+        backend a failed load raises and is retried on the next call
         """
         try:
             # Using a zero-shot classification model to check if food contains allergens
-            self.allergy_classifier = pipeline(
-                "zero-shot-classification",
-                model="facebook/bart-large-mnli"
-            )
+            self.allergy_classifier = load_zero_shot_classifier(self.allergy_model_id, self.allergy_runtime)
         except Exception as e:
+            if self.allergy_backend == 'zeroshot':
+                raise RuntimeError(f"Error loading Hugging Face model: {e}") from e
             print(f"Error loading Hugging Face model: {e}")
             print("Using fallback keyword-based allergy detection")
             self.allergy_classifier = None
+        self.allergy_classifier_attempted = True
+    
+    def get_allergy_classifier(self):
+        """
+        Return the allergy classifier, loading it on first use, or None when
+        keyword matching should be used instead. Concurrent callers wait for a load
+        in progress rather than falling back to keywords while it runs
+        """
+        if self.allergy_backend == 'keyword':
+            return None
+        if not self.allergy_classifier_attempted:
+            with self.allergy_classifier_lock:
+                if not self.allergy_classifier_attempted:
+                    self.setup_allergy_classifier()
+        return self.allergy_classifier
+    
+    def allergy_model_key(self) -> str:
+        """
+        Identity of the allergen model + runtime whose scores this planner uses
+        """
+        return allergy_model_key(self.allergy_model_id, self.allergy_runtime)
+    
+    def get_allergy_batcher(self) -> AllergenBatcher:
+        """
+        Return the classifier's micro-batching queue, starting it on first use
+        """
+        with self.allergy_batcher_lock:
+            if self.allergy_batcher is None:
+                self.allergy_batcher = AllergenBatcher(
+                    self.classify_allergens, self.allergy_batch_window_ms, self.allergy_batch_size
+                )
+            return self.allergy_batcher
+    
+    def __getstate__(self):
+        # Worker processes get the preprocessed tables; the classifier and its batching
+        # queue are recreated lazily
+        state = self.__dict__.copy()
+        state['allergy_classifier'] = None
+        state['allergy_classifier_attempted'] = False
+        state['allergy_batcher'] = None
+        del state['filtered_foods_lock']
+        del state['allergy_batcher_lock']
+        del state['allergy_classifier_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.filtered_foods_lock = threading.Lock()
+        self.allergy_batcher_lock = threading.Lock()
+        self.allergy_classifier_lock = threading.Lock()
     
     def determine_age_dosha(self, age: int) -> Dict[str, float]:
         """
@@ -192,80 +471,259 @@ class AdvancedAyurvedicMealPlanner:
             
         return impact
     
+    def classify_allergens(self, food_names: List[str], labels: List[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Run the zero-shot model over food names for one set of candidate labels,
+        allergy_batch_size names per call
+        """
+        return classify_batches(self.get_allergy_classifier(), food_names, labels, self.allergy_batch_size)
+    
+    def score_allergens(self, food_names: List[str], allergies: List[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Score food names against allergens with the zero-shot model in batches,
+        classifying only (food, allergen) pairs that are not already cached
+        """
+        food_names = list(dict.fromkeys(food_names))
+        missing = self.allergy_cache.missing(food_names, allergies)
+        
+        if missing and self.allergy_batch_window_ms > 0:
+            scores = self.get_allergy_batcher().score(missing)
+        else:
+            # Group foods by the labels they still need so each batch shares candidate labels
+            scores = {}
+            for labels, names in group_by_labels(missing).items():
+                scores.update(self.classify_allergens(names, list(labels)))
+        
+        for name, food_scores in scores.items():
+            self.allergy_cache.update(name, food_scores)
+        if missing:
+            self.allergy_cache.save()
+        
+        return {
+            name: {allergy: self.allergy_cache.get(name, allergy) for allergy in allergies}
+            for name in food_names
+        }
+    
+    def build_food_features(self, food_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Build a columnar feature table (lowercase name, taste vector, normalized taste
+        impact and encoded symbolic effects) aligned with the rows of the food table
+        """
+        taste_names = list(self.taste_effects.keys())
+        names_lower = food_df['Food Name'].astype(str).str.lower()
+        
+        # Taste vector: which of the six tastes each food carries
+        taste_matrix = np.zeros((len(food_df), len(taste_names)), dtype=np.int8)
+        for ingredient, ingredient_tastes in self.food_tastes.items():
+            mask = names_lower.str.contains(ingredient, regex=False).to_numpy()
+            for taste in ingredient_tastes:
+                taste_matrix[mask, taste_names.index(taste)] = 1
+        
+        # Default to sweet if no tastes identified
+        taste_matrix[taste_matrix.sum(axis=1) == 0, taste_names.index('sweet')] = 1
+        
+        # Taste impact on each dosha, normalized like calculate_taste_impact
+        effect_matrix = np.array([
+            [EFFECT_CODES[self.taste_effects[taste][dosha]] for dosha in DOSHAS]
+            for taste in taste_names
+        ], dtype=np.float64)
+        impact = taste_matrix @ effect_matrix
+        total = np.abs(impact).sum(axis=1, keepdims=True)
+        impact = impact / np.where(total == 0, 1, total)
+        
+        features = pd.DataFrame(index=food_df.index)
+        features['name_lower'] = names_lower
+        for i, taste in enumerate(taste_names):
+            features[f'taste_{taste}'] = taste_matrix[:, i]
+        for i, dosha in enumerate(DOSHAS):
+            features[f'impact_{dosha}'] = impact[:, i]
+        for dosha in DOSHAS:
+            features[f'effect_{dosha}'] = food_df[dosha].astype(object).map(EFFECT_CODES).fillna(0).astype(np.int8)
+        features['tastes'] = [
+            ', '.join(taste for taste, present in zip(taste_names, row) if present)
+            for row in taste_matrix
+        ]
+        
+        # Allergen / food group bitmask from the keyword lexicon
+        features['lexicon_mask'] = self.lexicon_matcher.match_series(names_lower)
+        
+        return features
+    
+    def feature_signature(self) -> str:
+        """
+        Hash of the tables build_food_features depends on, so stored features are
+        only reused when they would come out the same
+        """
+        payload = json.dumps({
+            'layout': FEATURE_LAYOUT_VERSION,
+            'taste_effects': self.taste_effects,
+            'food_tastes': self.food_tastes,
+            'effect_codes': EFFECT_CODES,
+            'lexicon': build_food_lexicon(),
+            'compound_categories': list(FOOD_LEXICON),
+            'compound_exceptions': COMPOUND_EXCEPTIONS
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def calculate_dosha_weights(self, vikriti: str, age: int, season: str, meal_type: str) -> Dict[str, float]:
+        """
+        Combine vikriti, age, season and time of day into per-dosha balancing weights
+        """
+        age_dosha = self.determine_age_dosha(age)
+        seasonal_dosha = self.determine_seasonal_dosha(season)
+        time_dosha = self.determine_time_dosha(meal_type)
+        
+        # Base weights (prioritize balancing vikriti)
+        dosha_weights = {
+            'Vata': 1.0,
+            'Pitta': 1.0,
+            'Kapha': 1.0
+        }
+        
+        # Increase weight for imbalanced doshas (vikriti)
+        if vikriti:
+            for dosha in vikriti.split(','):
+                dosha = dosha.strip()
+                if dosha in dosha_weights:
+                    dosha_weights[dosha] = 2.0  # Higher priority to balance vikriti
+        
+        # Apply age, season, and time influences
+        for dosha in dosha_weights:
+            dosha_weights[dosha] *= age_dosha[dosha] * seasonal_dosha[dosha] * time_dosha[dosha]
+        
+        return dosha_weights
+    
+    def score_foods(self, foods: pd.DataFrame, dosha_weights: Dict[str, float]) -> np.ndarray:
+        """
+        Vectorized dosha balancing score (symbolic effect + taste impact) for each food
+        """
+        symbolic, taste = self.score_breakdown(foods, dosha_weights)
+        return symbolic + taste
+    
+    def score_breakdown(self, foods: pd.DataFrame, dosha_weights: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The two parts of score_foods: symbolic dosha effect score and taste score
+        """
+        with instrumentation.stage('scoring'):
+            features = self.food_features.loc[foods.index]
+            weights = np.array([dosha_weights[dosha] for dosha in DOSHAS])
+            
+            # A food that decreases a dosha scores +weight, one that increases it -weight
+            effects = features[[f'effect_{dosha}' for dosha in DOSHAS]].to_numpy(dtype=np.float64)
+            impact = features[[f'impact_{dosha}' for dosha in DOSHAS]].to_numpy()
+            
+            return -effects @ weights, -impact @ weights
+    
     def check_allergy(self, food_name: str, allergies: List[str]) -> bool:
         """
         Check if a food contains any allergens using LLM or fallback to keyword matching
         """
         if not allergies:
             return False
-            
-        if self.allergy_classifier:
-            try:
-                # Use the model to classify if the food contains allergens
-                result = self.allergy_classifier(
-                    food_name,
-                    candidate_labels=allergies,
-                    multi_label=True
-                )
-                # If any allergy has a score above threshold, consider it allergic
-                for label, score in zip(result['labels'], result['scores']):
-                    if score > 0.7:  # Confidence threshold
-                        return True
-                return False
-            except Exception as e:
-                print(f"Error using allergy classifier: {e}. Falling back to keyword matching")
-        
-        # Fallback: simple keyword matching
-        food_lower = food_name.lower()
-        for allergy in allergies:
-            if allergy.lower() in food_lower:
-                return True
-                
-            # Common ingredient mappings
-            allergy_mappings = {
-                'nuts': ['almond', 'cashew', 'walnut', 'pistachio', 'nut'],
-                'dairy': ['milk', 'cheese', 'yogurt', 'butter', 'paneer', 'ghee', 'cream'],
-                'gluten': ['wheat', 'gluten', 'atta', 'maida'],
-                'seafood': ['fish', 'prawn', 'shrimp', 'seafood'],
-                'eggs': ['egg', 'andaa']
-            }
-            
-            if allergy.lower() in allergy_mappings:
-                for keyword in allergy_mappings[allergy.lower()]:
-                    if keyword in food_lower:
-                        return True
         
-        return False
+        scores = self.model_allergen_scores([food_name], allergies)
+        if scores is not None:
+            # If any allergy has a score above threshold, consider it allergic
+            return any(score > self.allergy_threshold for score in scores[food_name].values())
+        
+        return self.check_allergy_keywords(food_name, allergies)
+    
+    def model_allergen_scores(self, food_names: List[str], allergies: List[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Zero-shot scores of food names against allergies, or None when keyword matching
+        should be used instead. The model is only loaded for pairs missing from the
+        score cache, so fully cached foods (e.g. classified by a batch parent process)
+        never load it
+        """
+        if self.allergy_backend == 'keyword':
+            return None
+        if not self.allergy_cache.missing(food_names, allergies):
+            return self.score_allergens(food_names, allergies)
+        if not self.get_allergy_classifier():
+            return None
+        try:
+            return self.score_allergens(food_names, allergies)
+        except Exception as e:
+            if self.allergy_backend == 'zeroshot':
+                raise
+            print(f"Error using allergy classifier: {e}. Falling back to keyword matching")
+            instrumentation.fallback('keyword_allergy_detection')
+            return None
+    
+    def get_allergy_keyword_matchers(self, allergies: List[str]) -> Tuple[int, LexiconMatcher]:
+        """
+        Lexicon bitmask for known allergies, and a matcher for any allergy that is
+        not in the lexicon (matched on its own name at the start of a word)
+        """
+        allergy_bits = self.lexicon_matcher.category_mask(
+            allergy for allergy in allergies if allergy.lower() in FOOD_LEXICON
+        )
+        unknown = tuple(sorted({allergy.lower() for allergy in allergies if allergy.lower() not in FOOD_LEXICON}))
+        if not unknown:
+            return allergy_bits, None
+        
+        if unknown not in self.extra_allergy_matchers:
+            self.extra_allergy_matchers[unknown] = LexiconMatcher(
+                {allergy: [allergy] for allergy in unknown}, whole_words=False
+            )
+        return allergy_bits, self.extra_allergy_matchers[unknown]
+    
+    def check_allergy_keywords(self, food_name: str, allergies: List[str]) -> bool:
+        """
+        Keyword-based allergy detection used when the classifier is unavailable
+        """
+        allergy_bits, extra_matcher = self.get_allergy_keyword_matchers(allergies)
+        if self.lexicon_matcher.match(food_name) & allergy_bits:
+            return True
+        return extra_matcher is not None and extra_matcher.match(food_name) != 0
+    
+    def keyword_allergy_mask(self, foods: pd.DataFrame, allergies: List[str]) -> np.ndarray:
+        """
+        Vectorized keyword allergy check over a subset of the food table
+        """
+        allergy_bits, extra_matcher = self.get_allergy_keyword_matchers(allergies)
+        lexicon_masks = self.food_features.loc[foods.index, 'lexicon_mask'].to_numpy()
+        allergic = (lexicon_masks & allergy_bits) != 0
+        if extra_matcher is not None:
+            allergic |= extra_matcher.match_series(self.food_features.loc[foods.index, 'name_lower']) != 0
+        return allergic
+    
+    def annotated_allergy_mask(self, foods: pd.DataFrame, allergies: List[str]) -> np.ndarray:
+        """
+        Vectorized zero-shot allergy check from the catalog's stored allergen scores
+        (catalog.py annotate), or None when they were made with another model or do
+        not cover these foods and allergies
+        """
+        annotations = self.allergen_annotations
+        if (self.allergy_backend == 'keyword' or annotations is None
+                or self.allergen_annotation_model != self.allergy_model_key()):
+            return None
+        labels = list(dict.fromkeys(allergy.strip().lower() for allergy in allergies))
+        if any(label not in annotations.columns for label in labels):
+            return None
+        scores = annotations[labels].to_numpy()[foods.index.to_numpy()]
+        if np.isnan(scores).any():
+            return None
+        return (scores > self.allergy_threshold).any(axis=1)
     
     def generate_allergy_warnings(self, food_name: str, allergies: List[str]) -> List[str]:
         """
         Generate specific warnings and substitutions for foods that might contain allergens
         """
         warnings = []
-        food_lower = food_name.lower()
+        food_mask = self.lexicon_matcher.match(food_name)
         
         for allergy in allergies:
             allergy_lower = allergy.lower()
             
             # Check if this food might contain or be prepared with the allergen
             if allergy_lower in self.allergy_substitutions:
-                # Check for potential allergen ingredients in this food
-                allergy_keywords = {
-                    'dairy': ['paneer', 'ghee', 'butter', 'milk', 'yogurt', 'cheese', 'cream'],
-                    'nuts': ['almond', 'cashew', 'walnut', 'pistachio', 'nut'],
-                    'gluten': ['wheat', 'atta', 'maida', 'gluten'],
-                    'seafood': ['fish', 'prawn', 'shrimp'],
-                    'eggs': ['egg', 'anda']
-                }
-                
                 # Check if this food typically contains the allergen
-                contains_allergen = any(keyword in food_lower for keyword in allergy_keywords.get(allergy_lower, []))
+                contains_allergen = food_mask & self.lexicon_matcher.category_mask([allergy_lower])
                 
                 # Check if this food is often prepared with the allergen
-                prepared_with_allergen = False
-                if allergy_lower == 'dairy':
-                    # Many Indian dishes are prepared with ghee or butter
-                    prepared_with_allergen = any(keyword in food_lower for keyword in ['curry', 'sabzi', 'pulao', 'biryani', 'paratha'])
+                # (e.g. many Indian dishes are prepared with ghee or butter)
+                prepared_with_allergen = food_mask & self.lexicon_matcher.category_mask([f'prepared:{allergy_lower}'])
                 
                 if contains_allergen or prepared_with_allergen:
                     warning = self.allergy_substitutions[allergy_lower]['warning']
@@ -279,245 +737,809 @@ class AdvancedAyurvedicMealPlanner:
         """
         Filter foods based on dietary preferences and allergies
         """
-        df = self.food_df.copy()
-        
-        # Filter by dietary preference
-        if dietary_pref.lower() == 'vegetarian' or dietary_pref.lower() == 'veg':
-            non_veg_keywords = ['chicken', 'mutton', 'fish', 'prawn', 'shrimp', 'egg', 'meat', 'keema']
-            mask = ~df['Food Name'].str.lower().str.contains('|'.join(non_veg_keywords))
-            df = df[mask]
-        elif dietary_pref.lower() == 'vegan':
-            non_vegan_keywords = ['chicken', 'mutton', 'fish', 'prawn', 'shrimp', 'egg', 'meat', 'keema', 
-                                 'paneer', 'ghee', 'butter', 'milk', 'yogurt', 'cheese', 'cream']
-            mask = ~df['Food Name'].str.lower().str.contains('|'.join(non_vegan_keywords))
-            df = df[mask]
-        
-        # Filter by allergies
-        if allergies:
-            allergic_foods = []
-            for _, row in df.iterrows():
-                if self.check_allergy(row['Food Name'], allergies):
-                    allergic_foods.append(row['Food Name'])
+        with instrumentation.stage('filter_foods'):
+            df = self.food_df.copy()
+            
+            # Filter by dietary preference using the precomputed lexicon bitmask
+            excluded_groups = DIET_EXCLUSIONS.get(dietary_pref.lower())
+            if excluded_groups:
+                diet_bits = self.lexicon_matcher.category_mask(excluded_groups)
+                df = df[(self.food_features.loc[df.index, 'lexicon_mask'].to_numpy() & diet_bits) == 0]
+            
+            # Filter by allergies
+            if allergies:
+                with instrumentation.stage('allergen_classification'):
+                    # Stored allergen scores make this a mask lookup, without loading the model
+                    annotated_mask = self.annotated_allergy_mask(df, allergies)
+                    if annotated_mask is not None:
+                        df = df[~annotated_mask]
+                    else:
+                        df = self.classify_and_filter(df, allergies)
             
-            df = df[~df['Food Name'].isin(allergic_foods)]
+            return df
         
-        return df
+    def classify_and_filter(self, df: pd.DataFrame, allergies: List[str]) -> pd.DataFrame:
+        """
+        Drop allergic foods using the zero-shot classifier, or keyword matching when
+        it is unavailable
+        """
+        scores = self.model_allergen_scores(df['Food Name'].unique().tolist(), allergies)
+        if scores is None:
+            return df[~self.keyword_allergy_mask(df, allergies)]
+        
+        allergic_foods = [
+            name for name, food_scores in scores.items()
+            if any(score > self.allergy_threshold for score in food_scores.values())
+        ]
+        return df[~df['Food Name'].isin(allergic_foods)]
+    
+    def get_filtered_foods(self, dietary_pref: str, allergies: List[str]) -> Tuple[pd.DataFrame, MealCandidates]:
+        """
+        filter_foods and its per-meal-type candidate index, memoized per (diet, allergy
+        set). The table is shared and must not be modified; the candidates are a fresh
+        copy for the caller
+        """
+        key = (dietary_pref.strip().lower(), tuple(sorted({allergy.strip().lower() for allergy in allergies or []})))
+        with self.filtered_foods_lock:
+            entry = self.filtered_foods_cache.get(key)
+            if entry is not None:
+                self.filtered_foods_cache.move_to_end(key)
+        
+        if entry is None:
+            filtered_foods = self.filter_foods(dietary_pref, allergies)
+            entry = (filtered_foods, MealCandidates(filtered_foods))
+            with self.filtered_foods_lock:
+                self.filtered_foods_cache[key] = entry
+                while len(self.filtered_foods_cache) > self.filtered_cache_size:
+                    self.filtered_foods_cache.popitem(last=False)
+        
+        filtered_foods, candidates = entry
+        return filtered_foods, candidates.fresh()
     
     def calculate_caloric_needs(self, age: int, height: float, weight: float, 
-                               gender: str, activity_level: str) -> Tuple[float, float]:
+                               gender: str, activity_level: str, goal: str = 'maintain') -> Tuple[float, float]:
         """
         Calculate daily caloric needs using Mifflin-St Jeor Equation
         Returns: (daily_calories, calories_per_meal)
         """
-        # Basal Metabolic Rate (BMR)
-        if gender.lower() == 'male':
-            bmr = 10 * weight + 6.25 * height - 5 * age + 5
-        else:  # female
-            bmr = 10 * weight + 6.25 * height - 5 * age - 161
-        
-        # Activity multiplier
-        activity_multipliers = {
-            'sedentary': 1.2,
-            'light': 1.375,
-            'moderate': 1.55,
-            'active': 1.725,
-            'very active': 1.9
-        }
-        
-        activity = activity_level.lower()
-        if activity not in activity_multipliers:
-            activity = 'moderate'  # default
-        
-        daily_calories = bmr * activity_multipliers[activity]
-        
-        # Calculate calories per meal (3 main meals)
-        calories_per_meal = daily_calories / 3
-        
-        return daily_calories, calories_per_meal
+        return caloric_needs(age, height, weight, gender, activity_level, goal)
+    
+    def calculate_macro_targets(self, calories: float) -> Dict[str, Tuple[float, float]]:
+        """
+        Macronutrient ranges in grams for a meal of the given calories
+        """
+        return macro_targets(calories)
     
     def calculate_portion_size(self, food_calories: float, meal_calories: float) -> float:
         """
         Calculate portion size in grams based on calorie content
         """
-        # Calculate how many grams needed to reach meal calorie target
-        portion = (meal_calories / food_calories) * self.standard_portion
-        
-        # Apply maximum portion limit
-        portion = min(portion, self.max_portion)
-        
-        return round(portion, 1)
+        # Grams needed to reach the meal calorie target, capped at the maximum portion
+        return float(portion_grams(food_calories, meal_calories, self.standard_portion, self.max_portion, decimals=1))
     
     def optimize_meals(self, filtered_foods: pd.DataFrame, prakriti: str, vikriti: str, 
                       calories_per_meal: float, season: str, meal_type: str, age: int, 
-                      weekly_used_foods: Set[str], day_idx: int) -> List[Dict]:
+                      weekly_used_foods: Set[str], day_idx: int,
+                      composition_models: Dict = None, candidates: MealCandidates = None) -> List[Dict]:
         """
-        Use linear programming to optimize meal selection based on advanced dosha balance
+        Select the best dosha-balancing food for a meal within the calorie window,
+        using the vectorized selector or a PuLP model depending on meal_selector.
+        With items_per_meal > 1 the meal is composed of several portioned foods instead.
+        candidates is the per-meal-type index of filtered_foods kept for the whole plan
+        (same profile), with the week's used foods marked in it
         """
-        # First, try to find foods that haven't been used yet
-        available_foods = filtered_foods[~filtered_foods['Food Name'].isin(weekly_used_foods)]
-        meal_type_foods = available_foods[available_foods['Meal Type'].str.lower() == meal_type.lower()]
+        if self.items_per_meal > 1:
+            return self.compose_meal(
+                filtered_foods, vikriti, calories_per_meal, season, meal_type, age,
+                weekly_used_foods, composition_models
+            )
         
-        # If no unused foods available for this meal type, use all foods for this meal type
-        if meal_type_foods.empty:
-            meal_type_foods = filtered_foods[filtered_foods['Meal Type'].str.lower() == meal_type.lower()]
+        if candidates is None:
+            candidates = MealCandidates(filtered_foods, weekly_used_foods)
+        positions, used, excluded = candidates.lookup(meal_type)
         
-        # If still no foods available, return empty
-        if meal_type_foods.empty:
+        # If no foods available for this meal type, return empty
+        allowed = ~excluded
+        if not allowed.any():
             return [], 0
         
-        # Create the problem
-        prob = pulp.LpProblem("AyurvedicMealPlanning", pulp.LpMaximize)
+        # First, try to find foods that haven't been used yet; if every food of this
+        # meal type was used, use all foods for this meal type
+        available = allowed & ~used
+        if not available.any():
+            available = allowed
+        meal_type_foods = candidates.foods.iloc[positions[available]]
+        
+        # Dosha balancing scores and calorie contributions only depend on the meal
+        # type, so they are computed once per plan and subset for each day
+        dosha_weights = self.calculate_dosha_weights(vikriti, age, season, meal_type)
+        dosha_scores = candidates.meal_array(
+            'scores', meal_type, lambda foods: self.score_foods(foods, dosha_weights)
+        )[available]
+        calorie_contributions = candidates.meal_array(
+            'calories', meal_type, lambda foods: self.calculate_calorie_contributions(foods, calories_per_meal)
+        )[available]
+        
+        # Objective: dosha balancing score with a high penalty for foods already used
+        # this week, to prevent selection
+        scores = dosha_scores + np.where(used[available], -self.reuse_penalty, 0.0)
+        
+        if self.meal_selector == 'pulp':
+            selected_idx = self.select_food_pulp(meal_type_foods, scores, calorie_contributions, calories_per_meal)
+        else:
+            selected_idx = self.select_food_vectorized(meal_type_foods, scores, calorie_contributions, calories_per_meal)
         
-        # Decision variables: whether to include each food (binary)
-        food_vars = pulp.LpVariable.dicts("Food", meal_type_foods.index, cat="Binary")
+        if selected_idx is None:
+            # Fallback: select the first available food
+            instrumentation.fallback('first_available_food')
+            selected_idx = meal_type_foods.index[0]
         
-        # Calculate dosha weights based on multiple factors
-        age_dosha = self.determine_age_dosha(age)
-        seasonal_dosha = self.determine_seasonal_dosha(season)
-        time_dosha = self.determine_time_dosha(meal_type)
+        food_entry = self.build_food_entry(meal_type_foods.loc[selected_idx], calories_per_meal)
+        return [food_entry], food_entry['calories']
+    
+    def suggest_alternatives(self, candidates: MealCandidates, vikriti: str, calories_per_meal: float,
+                             season: str, meal_type: str, age: int, k: int,
+                             selected_names: Set[str] = frozenset()) -> List[Dict]:
+        """
+        Top-k calorie-feasible foods for a slot other than the selected ones, best first,
+        each with its score breakdown. When no food of the meal type is calorie-feasible
+        the slot fell back like optimize_meals, so every allowed food is ranked instead.
+        Uses the per-meal-type scores cached in candidates (so no rescoring) and a partial
+        sort, linear in the number of candidates
+        """
+        positions, used, excluded = candidates.lookup(meal_type)
+        if k <= 0 or positions.size == 0:
+            return []
         
-        # Base weights (prioritize balancing vikriti)
-        dosha_weights = {
-            'Vata': 1.0,
-            'Pitta': 1.0,
-            'Kapha': 1.0
+        dosha_weights = self.calculate_dosha_weights(vikriti, age, season, meal_type)
+        dosha_scores = candidates.meal_array(
+            'scores', meal_type, lambda foods: self.score_foods(foods, dosha_weights)
+        )
+        calorie_contributions = candidates.meal_array(
+            'calories', meal_type, lambda foods: self.calculate_calorie_contributions(foods, calories_per_meal)
+        )
+        penalties = np.where(used, -self.reuse_penalty, 0.0)
+        
+        selected_codes = [candidates.name_lookup[name] for name in selected_names if name in candidates.name_lookup]
+        pool = self.calorie_feasible_mask(calorie_contributions, calories_per_meal) & ~excluded
+        if not pool.any():
+            pool = ~excluded
+        eligible = pool & ~np.isin(candidates.name_codes[positions], selected_codes)
+        eligible_positions = np.flatnonzero(eligible)
+        if eligible_positions.size == 0:
+            return []
+        
+        scores = (dosha_scores + penalties)[eligible_positions]
+        if eligible_positions.size > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(eligible_positions.size)
+        # Best first, ties to the earliest row like the selectors
+        top = top[np.lexsort((eligible_positions[top], -scores[top]))]
+        chosen = eligible_positions[top]
+        
+        top_foods = candidates.foods.iloc[positions[chosen]]
+        symbolic, taste = self.score_breakdown(top_foods, dosha_weights)
+        alternatives = []
+        for i, (_, food) in enumerate(top_foods.iterrows()):
+            entry = self.build_food_entry(food, calories_per_meal)
+            entry['score'] = {
+                'total': round(float(dosha_scores[chosen[i]] + penalties[chosen[i]]), 4),
+                'symbolic': round(float(symbolic[i]), 4),
+                'taste': round(float(taste[i]), 4),
+                'reuse_penalty': float(penalties[chosen[i]])
+            }
+            alternatives.append(entry)
+        return alternatives
+    
+    def add_week_alternatives(self, weekly_plan: Dict, candidates: MealCandidates, vikriti: str,
+                              calories_per_meal: float, season: str, age: int):
+        """
+        Set the 'alternatives' of every meal of a finished week: suggest_alternatives
+        with every food served anywhere in the week ruled out
+        """
+        served_names = {
+            food['name']
+            for day_plan in weekly_plan.values()
+            for meal in day_plan['meals'].values()
+            for food in meal['foods']
         }
+        for day_plan in weekly_plan.values():
+            for meal_type, meal in day_plan['meals'].items():
+                meal['alternatives'] = self.suggest_alternatives(
+                    candidates, vikriti, calories_per_meal, season, meal_type, age,
+                    self.alternatives_per_meal, served_names
+                )
+    
+    def calculate_calorie_contributions(self, foods: pd.DataFrame, calories_per_meal: float) -> np.ndarray:
+        """
+        Vectorized calorie contribution of each food at the portion calculate_portion_size would pick
+        """
+        food_calories = foods['Calories'].to_numpy(dtype=np.float64)
+        portions = portion_grams(food_calories, calories_per_meal, self.standard_portion, self.max_portion, decimals=1)
+        return (food_calories / self.standard_portion) * np.nan_to_num(portions, nan=0.0)
+    
+    def calorie_feasible_mask(self, calorie_contributions: np.ndarray, calories_per_meal: float) -> np.ndarray:
+        """
+        Foods whose contribution falls inside the calorie window (15% flexibility)
+        """
+        return ((calorie_contributions >= calories_per_meal * 0.85) &
+                (calorie_contributions <= calories_per_meal * 1.15))
+    
+    def make_solver(self, warm_start: bool = False, time_limit: float = None, gap: float = None):
+        """
+        PuLP solver configured with the planner's backend, time limit, threads, MIP
+        gap and seed. time_limit and gap are defaults for when the planner sets none.
+        Warm starts are only passed to CBC
+        """
+        time_limit = self.solver_time_limit if self.solver_time_limit is not None else time_limit
+        gap = self.solver_gap if self.solver_gap is not None else gap
+        if self.solver_backend == 'highs':
+            return pulp.HiGHS(msg=False, timeLimit=time_limit, threads=self.solver_threads,
+                              gapRel=gap, random_seed=self.solver_seed)
+        options = []
+        if self.solver_seed is not None:
+            options = [f"randomSeed {self.solver_seed}", f"randomCbcSeed {self.solver_seed}"]
+        return pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, threads=self.solver_threads,
+                                 gapRel=gap, warmStart=warm_start, options=options)
+    
+    def solve_settling_ties(self, prob: pulp.LpProblem, tie_break, time_limit: float = None,
+                            gap: float = None) -> bool:
+        """
+        Solve prob, then re-solve it among the solutions with the same objective value
+        for the smallest tie_break (a linear expression ranking catalog order), so the
+        result does not depend on the solver's seed or backend. The model is left as it
+        was, with the second solution loaded. Returns whether an optimum was found
+        """
+        instrumentation.solve(prob, self.make_solver(time_limit=time_limit, gap=gap))
+        if prob.status != pulp.LpStatusOptimal:
+            return False
         
-        # Increase weight for imbalanced doshas (vikriti)
-        if vikriti:
-            for dosha in vikriti.split(','):
-                dosha = dosha.strip()
-                if dosha in dosha_weights:
-                    dosha_weights[dosha] = 2.0  # Higher priority to balance vikriti
-        
-        # Apply age, season, and time influences
-        for dosha in dosha_weights:
-            dosha_weights[dosha] *= age_dosha[dosha] * seasonal_dosha[dosha] * time_dosha[dosha]
-        
-        # Objective function: maximize dosha balancing with penalty for used foods
-        objective_terms = []
-        for idx, food in meal_type_foods.iterrows():
-            # Calculate taste-based dosha impact
-            tastes = self.estimate_food_tastes(food['Food Name'])
-            taste_impact = self.calculate_taste_impact(tastes)
-            
-            # Combined score (symbolic effect + taste impact)
-            dosha_score = 0
-            for dosha in ['Vata', 'Pitta', 'Kapha']:
-                effect = food[dosha]
-                taste_effect = taste_impact[dosha]
-                
-                # Symbolic effect
-                if effect == '-':  # Food decreases this dosha
-                    symbol_score = dosha_weights[dosha]
-                elif effect == '+':  # Food increases this dosha (bad for imbalance)
-                    symbol_score = -dosha_weights[dosha]
-                else:  # Neutral
-                    symbol_score = 0
-                
-                # Taste effect (positive means we want to reduce this dosha)
-                taste_score = -taste_effect * dosha_weights[dosha]
-                
-                # Combine scores
-                dosha_score += symbol_score + taste_score
+        objective, sense = prob.objective, prob.sense
+        value = pulp.value(objective)
+        tolerance = 1e-6 * max(1.0, abs(value))
+        prob += (objective >= value - tolerance) if sense == pulp.LpMaximize else (objective <= value + tolerance), \
+            "SameObjective"
+        prob.sense = pulp.LpMinimize
+        prob.setObjective(tie_break)
+        try:
+            instrumentation.solve(prob, self.make_solver(time_limit=time_limit, gap=0.0))
+        finally:
+            del prob.constraints["SameObjective"]
+            prob.sense = sense
+            prob.setObjective(objective)
+        return prob.status == pulp.LpStatusOptimal
+    
+    def select_food_vectorized(self, foods: pd.DataFrame, scores: np.ndarray,
+                               calorie_contributions: np.ndarray, calories_per_meal: float):
+        """
+        Closed-form single-food selection: the best-scoring food inside the calorie window,
+        ties going to the earliest row. Returns the selected row label, or None if no food
+        is calorie-feasible
+        """
+        with instrumentation.stage('selection'):
+            feasible = self.calorie_feasible_mask(calorie_contributions, calories_per_meal)
+            if not feasible.any():
+                return None
             
-            # Apply penalty for foods that have been used in the week
-            penalty = 0
-            if food['Food Name'] in weekly_used_foods:
-                # High penalty for foods already used this week
-                penalty = -10.0  # Very high penalty to prevent selection
+            return foods.index[int(np.argmax(np.where(feasible, scores, -np.inf)))]
+    
+    def select_food_pulp(self, foods: pd.DataFrame, scores: np.ndarray,
+                         calorie_contributions: np.ndarray, calories_per_meal: float):
+        """
+        Use linear programming to select a food based on advanced dosha balance.
+        Returns the selected row label, or None if no optimal solution was found
+        """
+        with instrumentation.stage('model_build'):
+            # Create the problem
+            prob = pulp.LpProblem("AyurvedicMealPlanning", pulp.LpMaximize)
             
-            objective_terms.append(food_vars[idx] * (dosha_score + penalty))
-        
-        prob += pulp.lpSum(objective_terms), "Total_Dosha_Balancing_Score"
-        
-        # Constraints
-        # 1. Calorie constraint for the meal
-        calorie_terms = []
-        for idx, food in meal_type_foods.iterrows():
-            portion = self.calculate_portion_size(food['Calories'], calories_per_meal)
-            calorie_contribution = (food['Calories'] / self.standard_portion) * portion
-            calorie_terms.append(food_vars[idx] * calorie_contribution)
-        
-        # Allow 15% flexibility in calorie target
-        prob += pulp.lpSum(calorie_terms) >= calories_per_meal * 0.85, "MinCalories"
-        prob += pulp.lpSum(calorie_terms) <= calories_per_meal * 1.15, "MaxCalories"
-        
-        # 2. Select exactly 1 food per meal
-        prob += pulp.lpSum(food_vars.values()) == 1, "ExactlyOneFood"
+            # Decision variables: whether to include each food (binary)
+            food_vars = pulp.LpVariable.dicts("Food", foods.index, cat="Binary")
+            
+            prob += pulp.lpSum(
+                food_vars[idx] * score for idx, score in zip(foods.index, scores)
+            ), "Total_Dosha_Balancing_Score"
+            
+            # Constraints
+            # 1. Calorie constraint for the meal
+            calorie_terms = [
+                food_vars[idx] * contribution for idx, contribution in zip(foods.index, calorie_contributions)
+            ]
+            
+            # Allow 15% flexibility in calorie target
+            prob += pulp.lpSum(calorie_terms) >= calories_per_meal * 0.85, "MinCalories"
+            prob += pulp.lpSum(calorie_terms) <= calories_per_meal * 1.15, "MaxCalories"
+            
+            # 2. Select exactly 1 food per meal
+            prob += pulp.lpSum(food_vars.values()) == 1, "ExactlyOneFood"
         
         # Solve the problem
-        prob.solve()
+        instrumentation.solve(prob, self.make_solver())
         
         # Check if solution was found
         if prob.status != pulp.LpStatusOptimal:
-            # Fallback: select the first available food
-            if not meal_type_foods.empty:
-                food = meal_type_foods.iloc[0]
-                portion = self.calculate_portion_size(food['Calories'], calories_per_meal)
-                food_calories = (food['Calories'] / self.standard_portion) * portion
-                tastes = self.estimate_food_tastes(food['Food Name'])
-                
-                selected_foods = [{
-                    'name': food['Food Name'],
-                    'portion': portion,
-                    'calories': round(food_calories, 1),
-                    'protein': round((food['Protein (g)'] / self.standard_portion) * portion, 1),
-                    'carbs': round((food['Carbs (g)'] / self.standard_portion) * portion, 1),
-                    'fats': round((food['Fats (g)'] / self.standard_portion) * portion, 1),
-                    'vata_effect': food['Vata'],
-                    'pitta_effect': food['Pitta'],
-                    'kapha_effect': food['Kapha'],
-                    'tastes': ', '.join(tastes)
-                }]
-                return selected_foods, round(food_calories, 1)
-            else:
+            return None
+        
+        for position, idx in enumerate(foods.index):
+            if pulp.value(food_vars[idx]) == 1:
+                # CBC resolves ties arbitrarily; settle on the earliest equally good food
+                # so both selectors pick the same one
+                feasible = self.calorie_feasible_mask(calorie_contributions, calories_per_meal)
+                tied = feasible & (scores >= scores[position] - 1e-9)
+                return foods.index[int(np.argmax(tied))]
+        return None
+    
+    def build_composition_model(self, foods: pd.DataFrame, scores: np.ndarray, calories_per_meal: float) -> Dict:
+        """
+        Build the multi-item composition MILP for one meal type: a selection binary and
+        a portion (grams) variable per food, calorie and macronutrient bands as soft
+        constraints. Each food's score counts by its share of the meal's calories, and
+        each item costs item_penalty. The model is reused across the week by changing
+        variable bounds
+        """
+        # Stated as a minimization of cost (negative score plus slack penalties): CBC
+        # mishandles MIP starts on maximization problems and reports them as optimal
+        prob = pulp.LpProblem("AyurvedicMealComposition", pulp.LpMinimize)
+        
+        select_vars = pulp.LpVariable.dicts("Select", foods.index, cat="Binary")
+        gram_vars = pulp.LpVariable.dicts("Grams", foods.index, lowBound=0)
+        
+        # Score weighted by calorie share: a 50 g side adds little, and splitting a meal
+        # over equally scored foods gains nothing but costs item_penalty per extra item
+        calorie_share = foods['Calories'].to_numpy(dtype=np.float64) / self.standard_portion / calories_per_meal
+        cost_terms = [
+            self.item_penalty * select_vars[idx] - score * share * gram_vars[idx]
+            for idx, score, share in zip(foods.index, scores, calorie_share)
+        ]
+        
+        for idx in foods.index:
+            # A food only gets a portion if it is selected, within sensible portion limits
+            prob += gram_vars[idx] <= self.max_portion * select_vars[idx], f"MaxPortion_{idx}"
+            prob += gram_vars[idx] >= self.min_item_portion * select_vars[idx], f"MinPortion_{idx}"
+        
+        # Between 1 and items_per_meal foods per meal
+        prob += pulp.lpSum(select_vars.values()) >= 1, "AtLeastOneFood"
+        prob += pulp.lpSum(select_vars.values()) <= self.items_per_meal, "MaxFoods"
+        
+        # Calorie window (15% flexibility) and macronutrient bands, with penalized slack;
+        # one gram of a macronutrient is penalized like the calories it carries
+        bands = {'Calories': (calories_per_meal * 0.85, calories_per_meal * 1.15, 1)}
+        for nutrient, (low, high) in self.calculate_macro_targets(calories_per_meal).items():
+            bands[nutrient] = (low, high, MACRO_ENERGY_SHARES[nutrient][2])
+        
+        slack_vars = {}
+        for band_idx, (nutrient, (low, high, kcal_per_unit)) in enumerate(bands.items()):
+            per_gram = foods[nutrient].to_numpy(dtype=np.float64) / self.standard_portion
+            amount = pulp.lpSum(gram_vars[idx] * value for idx, value in zip(foods.index, per_gram))
+            under = pulp.LpVariable(f"Under_{band_idx}", lowBound=0)
+            over = pulp.LpVariable(f"Over_{band_idx}", lowBound=0)
+            prob += amount + under >= low, f"Min_{band_idx}"
+            prob += amount - over <= high, f"Max_{band_idx}"
+            cost_terms.append(self.calorie_slack_penalty * kcal_per_unit * (under + over))
+            slack_vars[nutrient] = (under, over, per_gram, low, high)
+        
+        # Inside the band, hold calories at the target: the deviation costs more per kcal
+        # than any score gains from a larger or smaller meal, so scores only decide what
+        # the meal is made of
+        per_gram = foods['Calories'].to_numpy(dtype=np.float64) / self.standard_portion
+        calories = pulp.lpSum(gram_vars[idx] * value for idx, value in zip(foods.index, per_gram))
+        below = pulp.LpVariable("BelowTarget", lowBound=0)
+        above = pulp.LpVariable("AboveTarget", lowBound=0)
+        prob += calories - calories_per_meal == above - below, "CalorieTarget"
+        deviation_penalty = 2 * max(float(np.abs(scores).max(initial=0.0)), 1.0) / calories_per_meal
+        cost_terms.append(deviation_penalty * (below + above))
+        
+        prob += pulp.lpSum(cost_terms), "Total_Composition_Cost"
+        
+        return {
+            'prob': prob,
+            'foods': foods,
+            'scores': scores,
+            'select': select_vars,
+            'grams': gram_vars,
+            'slacks': slack_vars,
+            'deviation': (below, above, per_gram)
+        }
+    
+    def compose_meal(self, filtered_foods: pd.DataFrame, vikriti: str, calories_per_meal: float,
+                     season: str, meal_type: str, age: int, weekly_used_foods: Set[str],
+                     composition_models: Dict = None) -> Tuple[List[Dict], float]:
+        """
+        Compose a meal of 1 to items_per_meal portioned foods. The solver is warm-started
+        from the best allowed single food at its portion: the previous day's solution of
+        the same model cannot be reused, since its foods are ruled out once served
+        """
+        if composition_models is not None and meal_type in composition_models:
+            model = composition_models[meal_type]
+        else:
+            meal_type_foods = filtered_foods[filtered_foods['Meal Type'].str.lower() == meal_type.lower()]
+            if meal_type_foods.empty:
                 return [], 0
+            dosha_weights = self.calculate_dosha_weights(vikriti, age, season, meal_type)
+            scores = self.score_foods(meal_type_foods, dosha_weights)
+            with instrumentation.stage('model_build'):
+                model = self.build_composition_model(meal_type_foods, scores, calories_per_meal)
+            if composition_models is not None:
+                composition_models[meal_type] = model
+        
+        foods = model['foods']
+        
+        # Exclude foods already used this week, unless nothing else is left
+        allowed = ~foods['Food Name'].isin(weekly_used_foods).to_numpy()
+        if not allowed.any():
+            allowed[:] = True
+        for idx, is_allowed in zip(foods.index, allowed):
+            model['select'][idx].upBound = 1 if is_allowed else 0
+        
+        # Warm start: the best calorie-feasible single food at its standard portion
+        calorie_contributions = self.calculate_calorie_contributions(foods, calories_per_meal)
+        start_position = int(np.argmax(np.where(
+            allowed & self.calorie_feasible_mask(calorie_contributions, calories_per_meal),
+            model['scores'], -np.inf
+        )))
+        if not allowed[start_position]:
+            start_position = int(np.argmax(allowed))
+        start_idx = foods.index[start_position]
+        start_grams = min(self.calculate_portion_size(foods.at[start_idx, 'Calories'], calories_per_meal),
+                          self.max_portion)
+        start_grams = max(start_grams, self.min_item_portion)
+        for idx in foods.index:
+            model['select'][idx].setInitialValue(1 if idx == start_idx else 0)
+            model['grams'][idx].setInitialValue(start_grams if idx == start_idx else 0)
+        for under, over, per_gram, low, high in model['slacks'].values():
+            amount = per_gram[start_position] * start_grams
+            under.setInitialValue(max(0.0, low - amount))
+            over.setInitialValue(max(0.0, amount - high))
+        below, above, per_gram = model['deviation']
+        amount = per_gram[start_position] * start_grams
+        below.setInitialValue(max(0.0, calories_per_meal - amount))
+        above.setInitialValue(max(0.0, amount - calories_per_meal))
+        
+        prob = model['prob']
+        instrumentation.solve(prob, self.make_solver(warm_start=True))
+        
+        if prob.status != pulp.LpStatusOptimal:
+            # Fallback: the warm-start meal
+            instrumentation.fallback('warm_start_meal')
+            food_entry = self.build_food_entry(foods.loc[start_idx], calories_per_meal)
+            return [food_entry], food_entry['calories']
         
         # Extract the solution
         selected_foods = []
-        total_calories = 0
+        for idx in foods.index:
+            if (pulp.value(model['select'][idx]) or 0) > 0.5:
+                portion = round(pulp.value(model['grams'][idx]), 1)
+                selected_foods.append(self.build_food_entry(foods.loc[idx], calories_per_meal, portion))
         
-        for idx, food in meal_type_foods.iterrows():
-            if pulp.value(food_vars[idx]) == 1:
-                portion = self.calculate_portion_size(food['Calories'], calories_per_meal)
-                food_calories = (food['Calories'] / self.standard_portion) * portion
-                total_calories += food_calories
+        return selected_foods, round(sum(food['calories'] for food in selected_foods), 1)
+    
+    def build_food_entry(self, food: pd.Series, calories_per_meal: float, portion: float = None) -> Dict:
+        """
+        Build the plan entry for a selected food at its calculated (or given) portion
+        """
+        # Plain floats: catalogs store macros as float32, which JSON encoders reject
+        if portion is None:
+            portion = self.calculate_portion_size(float(food['Calories']), calories_per_meal)
+        food_calories = (float(food['Calories']) / self.standard_portion) * portion
+        
+        return {
+            'name': food['Food Name'],
+            'portion': portion,
+            'calories': round(food_calories, 1),
+            'protein': round((float(food['Protein (g)']) / self.standard_portion) * portion, 1),
+            'carbs': round((float(food['Carbs (g)']) / self.standard_portion) * portion, 1),
+            'fats': round((float(food['Fats (g)']) / self.standard_portion) * portion, 1),
+            'vata_effect': food['Vata'],
+            'pitta_effect': food['Pitta'],
+            'kapha_effect': food['Kapha'],
+            'tastes': self.food_features.at[food.name, 'tastes']
+        }
+    
+    def joint_candidates(self, scores: np.ndarray, calorie_contributions: np.ndarray,
+                         calories_per_meal: float) -> np.ndarray:
+        """
+        Positions of the foods the joint week chooses from for one meal type: the
+        joint_candidates_per_meal best-scoring foods and as many with the calories
+        closest to the meal target, in catalog order (ties go to the earliest food)
+        """
+        limit = self.joint_candidates_per_meal
+        by_score = np.argsort(-scores, kind='stable')[:limit]
+        by_calories = np.argsort(np.abs(calorie_contributions - calories_per_meal), kind='stable')[:limit]
+        return np.union1d(by_score, by_calories)
+    
+    def optimize_week(self, filtered_foods: pd.DataFrame, vikriti: str, calories_per_meal: float,
+                      daily_calories: float, season: str, age: int, days: List[str],
+                      meal_types: List[str]) -> Dict[str, Dict[str, Tuple[List[Dict], float]]]:
+        """
+        Jointly optimize every (day, meal) slot of the week. Scores and calories do not
+        depend on the day, so one MILP chooses len(days) foods per meal type (no repeats,
+        weekly calorie band) from each meal type's joint_candidates, and the chosen foods
+        are then assigned to days to keep each day inside its calorie band (see
+        assign_week_days).
+        Returns {day: {meal_type: (selected_foods, meal_calories)}}, or None if not solved
+        """
+        with instrumentation.stage('model_build'):
+            prob = pulp.LpProblem("AyurvedicWeeklyMealPlanning", pulp.LpMaximize)
+            
+            objective_terms = []
+            count_vars = {}  # meal_type -> {candidate position: times served this week}
+            name_vars = {}  # food name -> count variables serving it anywhere in the week
+            calorie_terms = []
+            candidates = {}  # meal_type -> (foods, scores, calorie contributions) of its candidates
+            
+            for meal_type in meal_types:
+                meal_type_foods = filtered_foods[filtered_foods['Meal Type'].str.lower() == meal_type.lower()]
+                if meal_type_foods.empty:
+                    continue
+                
+                dosha_weights = self.calculate_dosha_weights(vikriti, age, season, meal_type)
+                scores = self.score_foods(meal_type_foods, dosha_weights)
+                calorie_contributions = self.calculate_calorie_contributions(meal_type_foods, calories_per_meal)
+                keep = self.joint_candidates(scores, calorie_contributions, calories_per_meal)
+                foods = meal_type_foods.iloc[keep]
+                scores, calorie_contributions = scores[keep], calorie_contributions[keep]
+                candidates[meal_type] = (foods, scores, calorie_contributions)
                 
-                # Estimate tastes for this food
-                tastes = self.estimate_food_tastes(food['Food Name'])
+                food_vars = pulp.LpVariable.dicts(f"Serve_{meal_type}", range(len(foods)), lowBound=0,
+                                                  upBound=len(days), cat="Integer")
+                count_vars[meal_type] = food_vars
+                for position, (name, score, contribution) in enumerate(zip(foods['Food Name'], scores,
+                                                                           calorie_contributions)):
+                    objective_terms.append(food_vars[position] * score)
+                    calorie_terms.append(food_vars[position] * contribution)
+                    name_vars.setdefault(name, []).append(food_vars[position])
+                
+                # One food per day
+                prob += pulp.lpSum(food_vars.values()) == len(days), f"OneFoodPerDay_{meal_type}"
+            
+            if not candidates:
+                return None
+            
+            # No repeats across the week. Repeats stay possible so that small catalogs remain
+            # feasible, but at a penalty that outweighs any dosha or calorie gain
+            for name_idx, food_vars in enumerate(name_vars.values()):
+                repeats = pulp.LpVariable(f"Repeats_{name_idx}", lowBound=0)
+                prob += pulp.lpSum(food_vars) <= 1 + repeats, f"NoRepeat_{name_idx}"
+                objective_terms.append(-JOINT_REPEAT_PENALTY * repeats)
+            
+            # Calories outside the bands are priced against the candidates' score range, so
+            # a small miss does not outweigh every dosha preference
+            score_range = max(float(np.ptp(np.concatenate([entry[1] for entry in candidates.values()]))), 1.0)
+            slack_penalty = self.calorie_slack_penalty * score_range / (JOINT_CALORIE_TOLERANCE * daily_calories)
+            
+            # Weekly calorie band (15% flexibility), softened with penalized slack; the
+            # daily bands are met when assigning days
+            under = pulp.LpVariable("CalorieShortfall", lowBound=0)
+            over = pulp.LpVariable("CalorieExcess", lowBound=0)
+            week_calories = daily_calories * len(days)
+            prob += pulp.lpSum(calorie_terms) + under >= week_calories * 0.85, "MinWeeklyCalories"
+            prob += pulp.lpSum(calorie_terms) - over <= week_calories * 1.15, "MaxWeeklyCalories"
+            objective_terms.append(-slack_penalty * (under + over))
+            
+            prob += pulp.lpSum(objective_terms), "Total_Weekly_Dosha_Balancing_Score"
+            
+            # Among equally good weeks, the earliest candidates: ranked across the week in
+            # meal type and then catalog order, and squared so that swapping foods between
+            # meal types or one early and one late food for two middle ones is no tie
+            ranked_vars = [var for food_vars in count_vars.values() for var in food_vars.values()]
+            tie_break = pulp.lpSum(var * (rank + 1) ** 2 for rank, var in enumerate(ranked_vars))
+        
+        # Meeting the weekly band can still leave single days outside theirs. If it does,
+        # re-solve with the weekly band narrowed by each margin in turn (until the solver
+        # returns the same foods) and keep the week with the best score net of repeat and
+        # daily calorie penalties
+        best = None
+        previous = None
+        for margin in JOINT_CALORIE_MARGINS:
+            prob.constraints["MinWeeklyCalories"].changeRHS(week_calories * (0.85 + margin))
+            prob.constraints["MaxWeeklyCalories"].changeRHS(week_calories * (1.15 - margin))
+            with instrumentation.slot('week'):
+                solved = self.solve_settling_ties(prob, tie_break, time_limit=JOINT_TIME_LIMIT, gap=JOINT_MIP_GAP)
+            if not solved:
+                break
+            
+            # Candidate positions in catalog order, a food served twice appearing twice
+            chosen = {
+                meal_type: [position for position, var in food_vars.items()
+                            for _ in range(int(round(pulp.value(var) or 0)))]
+                for meal_type, food_vars in count_vars.items()
+            }
+            if chosen == previous:
+                break
+            previous = chosen
+            assignment, slack = self.assign_week_days(chosen, candidates, daily_calories, days)
+            served = [candidates[meal_type][0]['Food Name'].iat[position]
+                      for meal_type, positions in chosen.items() for position in positions]
+            value = (sum(candidates[meal_type][1][positions].sum() for meal_type, positions in chosen.items())
+                     - JOINT_REPEAT_PENALTY * (len(served) - len(set(served))) - slack_penalty * slack)
+            if best is None or value > best[0] + 1e-9:
+                best = (value, assignment, slack)
+            if slack <= 1e-9:
+                break
+        
+        if best is None:
+            return None
+        _, assignment, slack = best
+        if slack > 1e-9:
+            print(f"Weekly optimization left {slack:.0f} kcal outside the daily calorie bands")
+        
+        week_selection = {}
+        for day_idx, day in enumerate(days):
+            week_selection[day] = {}
+            for meal_type in meal_types:
+                if meal_type not in assignment:
+                    week_selection[day][meal_type] = ([], 0)
+                    continue
                 
-                selected_foods.append({
-                    'name': food['Food Name'],
-                    'portion': portion,
-                    'calories': round(food_calories, 1),
-                    'protein': round((food['Protein (g)'] / self.standard_portion) * portion, 1),
-                    'carbs': round((food['Carbs (g)'] / self.standard_portion) * portion, 1),
-                    'fats': round((food['Fats (g)'] / self.standard_portion) * portion, 1),
-                    'vata_effect': food['Vata'],
-                    'pitta_effect': food['Pitta'],
-                    'kapha_effect': food['Kapha'],
-                    'tastes': ', '.join(tastes)
-                })
-        
-        return selected_foods, round(total_calories, 1)
+                foods = candidates[meal_type][0]
+                food_entry = self.build_food_entry(foods.iloc[assignment[meal_type][day_idx]], calories_per_meal)
+                week_selection[day][meal_type] = ([food_entry], food_entry['calories'])
+        
+        return week_selection
+    
+    def assign_week_days(self, chosen: Dict[str, List[int]], candidates: Dict, daily_calories: float,
+                         days: List[str]) -> Tuple[Dict[str, List[int]], float]:
+        """
+        Order each meal type's chosen foods by day, returning the assignment and its
+        calories outside the daily bands (15% flexibility). Catalog order is kept when
+        every day is inside its band; otherwise a small MILP assigns the foods to days
+        with the fewest calories outside the bands and, among those, the closest to
+        catalog order
+        """
+        def calorie_slack(assignment):
+            day_calories = np.zeros(len(days))
+            for meal_type, positions in assignment.items():
+                day_calories += candidates[meal_type][2][positions]
+            return float(np.sum(np.maximum(daily_calories * 0.85 - day_calories, 0) +
+                                np.maximum(day_calories - daily_calories * 1.15, 0)))
+        
+        chosen_slack = calorie_slack(chosen)
+        if chosen_slack <= 1e-9:
+            return chosen, chosen_slack
+        
+        with instrumentation.stage('selection'):
+            prob = pulp.LpProblem("WeekDayAssignment", pulp.LpMinimize)
+            day_vars = {
+                meal_type: pulp.LpVariable.dicts(f"Day_{meal_type}",
+                                                 [(i, day_idx) for i in range(len(positions))
+                                                  for day_idx in range(len(days))], cat="Binary")
+                for meal_type, positions in chosen.items()
+            }
+            
+            # The days are interchangeable, so the first meal type keeps its catalog order
+            # and only the others are moved between days
+            first_meal_type = next(iter(chosen))
+            for i in range(len(chosen[first_meal_type])):
+                day_vars[first_meal_type][i, i].lowBound = 1
+            
+            cost_terms = []
+            for meal_type, positions in chosen.items():
+                for i in range(len(positions)):
+                    prob += pulp.lpSum(day_vars[meal_type][i, day_idx] for day_idx in range(len(days))) == 1, \
+                        f"OneDay_{meal_type}_{i}"
+                for day_idx, day in enumerate(days):
+                    prob += pulp.lpSum(day_vars[meal_type][i, day_idx] for i in range(len(positions))) == 1, \
+                        f"OneFood_{meal_type}_{day}"
+            
+            for day_idx, day in enumerate(days):
+                day_calories = pulp.lpSum(day_vars[meal_type][i, day_idx] * candidates[meal_type][2][position]
+                                          for meal_type, positions in chosen.items()
+                                          for i, position in enumerate(positions))
+                under = pulp.LpVariable(f"Shortfall_{day}", lowBound=0)
+                over = pulp.LpVariable(f"Excess_{day}", lowBound=0)
+                prob += day_calories + under >= daily_calories * 0.85, f"MinCalories_{day}"
+                prob += day_calories - over <= daily_calories * 1.15, f"MaxCalories_{day}"
+                cost_terms.append(under + over)
+            
+            prob += pulp.lpSum(cost_terms), "Calories_Outside_Daily_Bands"
+            
+            # Among equally balanced weeks, the one closest to catalog order: days each food
+            # moves, weighted by its squared rank across the week so that moving different
+            # foods as far does not tie
+            ranked = [(meal_type, i) for meal_type, positions in chosen.items() for i in range(len(positions))]
+            tie_break = pulp.lpSum(day_vars[meal_type][i, day_idx] * abs(day_idx - i) * (rank + 1) ** 2
+                                   for rank, (meal_type, i) in enumerate(ranked) for day_idx in range(len(days)))
+            if not self.solve_settling_ties(prob, tie_break, time_limit=JOINT_TIME_LIMIT, gap=JOINT_MIP_GAP):
+                return chosen, chosen_slack
+            
+            assignment = {
+                meal_type: [positions[max(range(len(positions)),
+                                          key=lambda i: pulp.value(day_vars[meal_type][i, day_idx]) or 0)]
+                            for day_idx in range(len(days))]
+                for meal_type, positions in chosen.items()
+            }
+        
+        # Keep catalog order unless balancing is strictly better
+        slack = calorie_slack(assignment)
+        return (assignment, slack) if slack < chosen_slack - 1e-9 else (chosen, chosen_slack)
+    
+    def plan_config(self) -> Dict:
+        """
+        Planner settings that affect the generated plan (part of the plan cache key)
+        """
+        return {
+            'meal_selector': self.meal_selector,
+            'weekly_mode': self.weekly_mode,
+            'items_per_meal': self.items_per_meal,
+            'allergy_backend': self.allergy_backend,
+            'allergy_model_id': self.allergy_model_id,
+            'allergy_runtime': self.allergy_runtime,
+            'allergy_threshold': self.allergy_threshold,
+            'calorie_slack_penalty': self.calorie_slack_penalty,
+            'joint_candidates_per_meal': self.joint_candidates_per_meal,
+            'alternatives_per_meal': self.alternatives_per_meal,
+            'solver_backend': self.solver_backend,
+            'solver_time_limit': self.solver_time_limit,
+            'solver_threads': self.solver_threads,
+            'solver_gap': self.solver_gap,
+            'solver_seed': self.solver_seed
+        }
     
     def generate_weekly_plan(self, age: int, height: float, weight: float, gender: str,
                             prakriti: str, vikriti: str, activity_level: str, 
-                            season: str, dietary_pref: str, allergies: List[str]) -> Dict:
+                            season: str, dietary_pref: str, allergies: List[str],
+                            goal: str = 'maintain') -> Dict:
+        """
+        Generate a weekly meal plan based on user parameters, served from the plan
+        cache when an identical profile was planned against the same catalog.
+        With instrument=True the plan carries a 'timings' block
+        """
+        with instrumentation.recording(self.instrument) as recorder:
+            meal_plan = self.get_or_build_weekly_plan(age, height, weight, gender, prakriti, vikriti,
+                                                      activity_level, season, dietary_pref, allergies, goal)
+            if recorder is not None:
+                meal_plan['timings'] = recorder.to_dict()
+                self.metrics.observe(recorder)
+        return meal_plan
+    
+    def get_or_build_weekly_plan(self, age: int, height: float, weight: float, gender: str,
+                                 prakriti: str, vikriti: str, activity_level: str,
+                                 season: str, dietary_pref: str, allergies: List[str],
+                                 goal: str = 'maintain') -> Dict:
+        """
+        Look the plan up in the plan cache, building and caching it on a miss
+        """
+        if self.plan_cache is None:
+            return self.build_weekly_plan(age, height, weight, gender, prakriti, vikriti,
+                                          activity_level, season, dietary_pref, allergies, goal)
+        
+        with instrumentation.stage('plan_cache_lookup'):
+            profile = normalize_profile(age, height, weight, gender, prakriti, vikriti,
+                                        activity_level, season, dietary_pref, allergies, goal)
+            cache_key = make_plan_key(profile, self.catalog_hash, self.plan_config())
+            meal_plan = self.plan_cache.get(cache_key)
+        
+        if meal_plan is not None:
+            instrumentation.mark_cache_hit()
+            # Echo this request's profile rather than the one that filled the cache
+            summary = meal_plan['nutrition_summary']
+            summary.update({'age': age, 'height': height, 'weight': weight, 'gender': gender,
+                            'activity_level': activity_level, 'goal': goal, 'season': season,
+                            'prakriti': prakriti, 'vikriti': vikriti,
+                            'dietary_preference': dietary_pref, 'allergies': allergies})
+            return meal_plan
+        
+        meal_plan = self.build_weekly_plan(age, height, weight, gender, prakriti, vikriti,
+                                           activity_level, season, dietary_pref, allergies, goal)
+        if 'error' not in meal_plan:
+            self.plan_cache.put(cache_key, meal_plan, self.catalog_hash)
+        return meal_plan
+    
+    def build_weekly_plan(self, age: int, height: float, weight: float, gender: str,
+                          prakriti: str, vikriti: str, activity_level: str,
+                          season: str, dietary_pref: str, allergies: List[str],
+                          goal: str = 'maintain') -> Dict:
         """
         Generate a weekly meal plan based on user parameters
         """
-        # Reset used foods
-        self.used_foods = set()
-        
         # Calculate nutritional needs
         daily_calories, calories_per_meal = self.calculate_caloric_needs(
-            age, height, weight, gender, activity_level
+            age, height, weight, gender, activity_level, goal
         )
         
         # Filter foods based on preferences and allergies
-        filtered_foods = self.filter_foods(dietary_pref, allergies)
+        filtered_foods, candidates = self.get_filtered_foods(dietary_pref, allergies)
         
         if filtered_foods.empty:
             return {"error": "No foods available after applying filters"}
@@ -530,27 +1552,47 @@ class AdvancedAyurvedicMealPlanner:
         # Track all used foods across the week to ensure no repetition
         weekly_used_foods = set()
         
+        # Composition models are built once per meal type and reused for every day
+        composition_models = {}
+        
         # Track allergy warnings for the entire week
         weekly_allergy_warnings = {}
         
+        # In joint mode the whole week is solved up front
+        week_selection = None
+        if self.weekly_mode == 'joint':
+            with instrumentation.stage('week_optimization'):
+                week_selection = self.optimize_week(
+                    filtered_foods, vikriti, calories_per_meal, daily_calories, season, age, days, meal_types
+                )
+            if week_selection is None:
+                print("Weekly optimization failed. Falling back to greedy per-meal planning")
+                instrumentation.fallback('greedy_week')
+        
         for day_idx, day in enumerate(days):
             daily_meals = {}
             total_daily_calories = 0
             daily_allergy_warnings = []
             
             for meal_type in meal_types:
-                selected_foods, meal_calories = self.optimize_meals(
-                    filtered_foods, prakriti, vikriti, calories_per_meal, season, meal_type, age, 
-                    weekly_used_foods, day_idx
-                )
+                if week_selection is not None:
+                    selected_foods, meal_calories = week_selection[day][meal_type]
+                else:
+                    with instrumentation.slot(f"{day} {meal_type}"):
+                        selected_foods, meal_calories = self.optimize_meals(
+                            filtered_foods, prakriti, vikriti, calories_per_meal, season, meal_type, age, 
+                            weekly_used_foods, day_idx, composition_models, candidates
+                        )
                 
-                # Add selected food to weekly used foods to prevent repetition
-                if selected_foods:
-                    weekly_used_foods.add(selected_foods[0]['name'])
+                # Add selected foods to weekly used foods to prevent repetition
+                for food in selected_foods:
+                    weekly_used_foods.add(food['name'])
+                    candidates.mark_used(food['name'])
                     
                     # Generate allergy warnings for this food
                     if allergies:
-                        warnings = self.generate_allergy_warnings(selected_foods[0]['name'], allergies)
+                        with instrumentation.stage('allergy_warnings'):
+                            warnings = self.generate_allergy_warnings(food['name'], allergies)
                         if warnings:
                             daily_allergy_warnings.extend(warnings)
                 
@@ -563,6 +1605,7 @@ class AdvancedAyurvedicMealPlanner:
             weekly_plan[day] = {
                 'meals': daily_meals,
                 'total_calories': round(total_daily_calories, 1),
+                'within_calorie_band': bool(daily_calories * 0.85 <= total_daily_calories <= daily_calories * 1.15),
                 'allergy_warnings': daily_allergy_warnings
             }
             
@@ -570,6 +1613,10 @@ class AdvancedAyurvedicMealPlanner:
             if daily_allergy_warnings:
                 weekly_allergy_warnings[day] = daily_allergy_warnings
         
+        # Other options for each slot, once the whole week is known
+        if self.alternatives_per_meal:
+            self.add_week_alternatives(weekly_plan, candidates, vikriti, calories_per_meal, season, age)
+        
         # Add summary information
         result = {
             'weekly_plan': weekly_plan,
@@ -577,6 +1624,18 @@ class AdvancedAyurvedicMealPlanner:
             'nutrition_summary': {
                 'daily_calorie_target': round(daily_calories, 1),
                 'calories_per_meal_target': round(calories_per_meal, 1),
+                'daily_calorie_band': (round(daily_calories * 0.85, 1), round(daily_calories * 1.15, 1)),
+                'macro_targets_per_meal': {
+                    nutrient: (round(low, 1), round(high, 1))
+                    for nutrient, (low, high) in self.calculate_macro_targets(calories_per_meal).items()
+                },
+                'age': age,
+                'height': height,
+                'weight': weight,
+                'gender': gender,
+                'activity_level': activity_level,
+                'goal': goal,
+                'season': season,
                 'prakriti': prakriti,
                 'vikriti': vikriti,
                 'dietary_preference': dietary_pref,
@@ -588,6 +1647,95 @@ class AdvancedAyurvedicMealPlanner:
         
         return result
     
+    def replan_slot(self, meal_plan: Dict, day: str, meal_type: str, exclude: List[str] = None) -> Dict:
+        """
+        Replace the foods of one (day, meal) slot of a plan without re-solving the rest
+        of the week. The slot's current foods and any names in exclude are ruled out,
+        and foods served elsewhere in the week are avoided like in a full plan.
+        Returns a patched copy of the plan, or {"error": ...}
+        """
+        if 'error' in meal_plan:
+            return {"error": meal_plan['error']}
+        meal_type = meal_type.lower()
+        day_plan = meal_plan['weekly_plan'].get(day)
+        if day_plan is None or meal_type not in day_plan['meals']:
+            return {"error": f"No {meal_type} on {day} in this plan"}
+        summary = meal_plan['nutrition_summary']
+        if any(field not in summary for field in ('age', 'height', 'weight', 'gender', 'activity_level', 'season')):
+            return {"error": "Plan has no profile details to re-plan from; generate it again"}
+        
+        with instrumentation.recording(self.instrument) as recorder:
+            allergies = summary['allergies']
+            daily_calories, calories_per_meal = self.calculate_caloric_needs(
+                summary['age'], summary['height'], summary['weight'], summary['gender'], summary['activity_level'],
+                summary.get('goal', 'maintain')
+            )
+            
+            # The filtered catalog is memoized per diet and allergies, so only the
+            # slot itself is solved here
+            excluded = set(exclude or []) | {food['name'] for food in day_plan['meals'][meal_type]['foods']}
+            filtered_foods, candidates = self.get_filtered_foods(summary['dietary_preference'], allergies)
+            
+            # No repeats against every other slot of the week
+            weekly_used_foods = {
+                food['name']
+                for other_day, other_day_plan in meal_plan['weekly_plan'].items()
+                for other_meal_type, meal in other_day_plan['meals'].items()
+                if (other_day, other_meal_type) != (day, meal_type)
+                for food in meal['foods']
+            }
+            for name in weekly_used_foods:
+                candidates.mark_used(name)
+            for name in excluded:
+                candidates.exclude(name)
+            if self.items_per_meal > 1:
+                # Composition works on the table itself rather than the candidate index
+                filtered_foods = filtered_foods[~filtered_foods['Food Name'].isin(excluded)]
+            
+            with instrumentation.slot(f"{day} {meal_type}"):
+                selected_foods, meal_calories = self.optimize_meals(
+                    filtered_foods, summary['prakriti'], summary['vikriti'], calories_per_meal,
+                    summary['season'], meal_type, summary['age'], weekly_used_foods,
+                    list(meal_plan['weekly_plan']).index(day), candidates=candidates
+                )
+            if not selected_foods:
+                return {"error": f"No alternative foods available for {meal_type} on {day}"}
+            
+            # Patch a copy: the slot, the day's calories and the day's allergy warnings
+            patched = copy.deepcopy(meal_plan)
+            patched.pop('timings', None)
+            patched_day = patched['weekly_plan'][day]
+            patched_day['meals'][meal_type] = {'foods': selected_foods, 'total_calories': meal_calories}
+            if self.alternatives_per_meal:
+                # The new foods may have been another slot's alternatives, so every slot is refreshed
+                for name in {food['name'] for food in selected_foods}:
+                    candidates.mark_used(name)
+                self.add_week_alternatives(patched['weekly_plan'], candidates, summary['vikriti'],
+                                           calories_per_meal, summary['season'], summary['age'])
+            patched_day['total_calories'] = round(
+                sum(meal['total_calories'] for meal in patched_day['meals'].values()), 1
+            )
+            patched_day['within_calorie_band'] = bool(
+                daily_calories * 0.85 <= patched_day['total_calories'] <= daily_calories * 1.15
+            )
+            
+            daily_allergy_warnings = []
+            if allergies:
+                with instrumentation.stage('allergy_warnings'):
+                    for meal in patched_day['meals'].values():
+                        for food in meal['foods']:
+                            daily_allergy_warnings.extend(self.generate_allergy_warnings(food['name'], allergies))
+            patched_day['allergy_warnings'] = daily_allergy_warnings
+            if daily_allergy_warnings:
+                patched['weekly_allergy_warnings'][day] = daily_allergy_warnings
+            else:
+                patched['weekly_allergy_warnings'].pop(day, None)
+            
+            if recorder is not None:
+                patched['timings'] = recorder.to_dict()
+                self.metrics.observe(recorder)
+        return patched
+    
     def export_to_csv(self, meal_plan: Dict, filename: str = "ayurvedic_meal_plan.csv"):
         """
         Export the meal plan to a CSV file
@@ -596,46 +1744,9 @@ class AdvancedAyurvedicMealPlanner:
             print(f"Cannot export: {meal_plan['error']}")
             return False
         
-        # Prepare data for CSV
-        rows = []
-        
-        # Add header
-        rows.append([
-            'Day', 'Meal Type', 'Food Name', 'Portion (g)', 'Calories', 
-            'Protein (g)', 'Carbs (g)', 'Fats (g)', 'Vata Effect', 
-            'Pitta Effect', 'Kapha Effect', 'Tastes', 'Allergy Warnings'
-        ])
-        
-        # Add meal data
-        for day, day_plan in meal_plan['weekly_plan'].items():
-            for meal_type, meal in day_plan['meals'].items():
-                for food in meal['foods']:
-                    # Get allergy warnings for this food
-                    warnings = ""
-                    if day in meal_plan['weekly_allergy_warnings']:
-                        food_warnings = [w for w in meal_plan['weekly_allergy_warnings'][day] if food['name'] in w]
-                        if food_warnings:
-                            warnings = " | ".join(food_warnings)
-                    
-                    rows.append([
-                        day,
-                        meal_type.capitalize(),
-                        food['name'],
-                        food['portion'],
-                        food['calories'],
-                        food['protein'],
-                        food['carbs'],
-                        food['fats'],
-                        food['vata_effect'],
-                        food['pitta_effect'],
-                        food['kapha_effect'],
-                        food['tastes'],
-                        warnings
-                    ])
-        
-        # Create DataFrame and export to CSV
-        df = pd.DataFrame(rows[1:], columns=rows[0])
-        df.to_csv(filename, index=False)
+        # Rows are streamed to the file (see export.py for JSONL/Parquet and multi-patient files)
+        with CSVPlanWriter(filename) as writer:
+            writer.write_plan(meal_plan)
         print(f"Meal plan exported to {filename}")
         
         # Also export a summary CSV
@@ -647,50 +1758,8 @@ class AdvancedAyurvedicMealPlanner:
         """
         Export a summary of the meal plan to a CSV file
         """
-        # Prepare summary data
-        summary_rows = []
-        
-        # Add user profile
-        summary = meal_plan['nutrition_summary']
-        summary_rows.append(['User Profile', ''])
-        summary_rows.append(['Age', '35'])  # Hardcoded for now, should be parameterized
-        summary_rows.append(['Height (cm)', '170'])
-        summary_rows.append(['Weight (kg)', '70'])
-        summary_rows.append(['Gender', 'male'])
-        summary_rows.append(['Prakriti', summary['prakriti']])
-        summary_rows.append(['Vikriti', summary['vikriti']])
-        summary_rows.append(['Dietary Preference', summary['dietary_preference']])
-        summary_rows.append(['Allergies', ', '.join(summary['allergies'])])
-        summary_rows.append(['Daily Calorie Target', summary['daily_calorie_target']])
-        summary_rows.append(['Calories per Meal Target', summary['calories_per_meal_target']])
-        summary_rows.append(['', ''])
-        
-        # Add daily totals
-        summary_rows.append(['Daily Nutrition Summary', ''])
-        summary_rows.append(['Day', 'Total Calories', 'Breakfast Calories', 'Lunch Calories', 'Dinner Calories'])
-        
-        for day, day_plan in meal_plan['weekly_plan'].items():
-            breakfast_cals = day_plan['meals']['breakfast']['total_calories']
-            lunch_cals = day_plan['meals']['lunch']['total_calories']
-            dinner_cals = day_plan['meals']['dinner']['total_calories']
-            total_cals = day_plan['total_calories']
-            
-            summary_rows.append([day, total_cals, breakfast_cals, lunch_cals, dinner_cals])
-        
-        # Add allergy warnings section
-        summary_rows.append(['', ''])
-        summary_rows.append(['Allergy Warnings', ''])
-        
-        if meal_plan['weekly_allergy_warnings']:
-            for day, warnings in meal_plan['weekly_allergy_warnings'].items():
-                for warning in warnings:
-                    summary_rows.append([day, warning])
-        else:
-            summary_rows.append(['No allergy warnings', ''])
-        
-        # Create DataFrame and export to CSV
-        df = pd.DataFrame(summary_rows)
-        df.to_csv(filename, index=False, header=False)
+        with SummaryWriter(filename) as writer:
+            writer.write_summary(meal_plan)
         print(f"Meal plan summary exported to {filename}")
 
 def main():
@@ -747,7 +1816,8 @@ def main():
     # Print weekly plan
     for day, day_plan in meal_plan['weekly_plan'].items():
         print(f"\n{day.upper()}:")
-        print(f"Total Calories: {day_plan['total_calories']} kcal")
+        print(f"Total Calories: {day_plan['total_calories']} kcal"
+              f"{'' if day_plan.get('within_calorie_band', True) else ' (outside the daily calorie band)'}")
         
         # Print allergy warnings for the day if any
         if day_plan['allergy_warnings']:
@@ -0,0 +1,141 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from json_files import json_default, write_json_atomic
+
+
+def catalog_content_hash(food_df: pd.DataFrame) -> str:
+    """
+    Content hash of a food catalog; any edit to a row or column changes it
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in food_df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(food_df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def normalize_profile(age: int, height: float, weight: float, gender: str, prakriti: str, vikriti: str,
+                      activity_level: str, season: str, dietary_pref: str, allergies: List[str],
+                      goal: str = 'maintain') -> Dict:
+    """
+    Canonical form of the generate_weekly_plan inputs, so equivalent requests share a key
+    """
+    return {
+        'age': int(age),
+        'height': round(float(height), 1),
+        'weight': round(float(weight), 1),
+        'gender': gender.strip().lower(),
+        'prakriti': (prakriti or '').strip(),
+        'vikriti': (vikriti or '').strip(),
+        'activity_level': activity_level.strip().lower(),
+        'goal': (goal or 'maintain').strip().lower(),
+        'season': season.strip().lower(),
+        'dietary_pref': dietary_pref.strip().lower(),
+        'allergies': sorted({allergy.strip().lower() for allergy in allergies or [] if allergy.strip()})
+    }
+
+
+def make_plan_key(profile: Dict, catalog_hash: str, config: Dict) -> str:
+    """
+    Cache key: hash of the normalized profile, the catalog content hash and planner settings
+    """
+    payload = json.dumps({'profile': profile, 'catalog': catalog_hash, 'config': config}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Weekly plan cache with an in-memory LRU tier and an optional on-disk tier.
+    Entries from a different food catalog never match, since the catalog hash is
+    part of every key
+    """
+
+    def __init__(self, max_entries: int = 256, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Return a copy of the cached plan for key, or None
+        """
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None:
+                self._entries.move_to_end(key)
+
+        if plan is None and self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    plan = json.load(f)['plan']
+                self._remember(key, plan)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable plan cache entry {key}: {e}")
+                plan = None
+
+        with self._lock:
+            if plan is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(plan)
+
+    def put(self, key: str, plan: Dict, catalog_hash: str = None):
+        """
+        Store a plan in memory and, if configured, on disk
+        """
+        plan = copy.deepcopy(plan)
+        self._remember(key, plan)
+
+        if self.cache_dir:
+            write_json_atomic(self._path(key), {'catalog_hash': catalog_hash, 'plan': plan}, default=json_default)
+
+    def _remember(self, key: str, plan: Dict):
+        with self._lock:
+            self._entries[key] = plan
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def prune(self, catalog_hash: str) -> int:
+        """
+        Delete on-disk entries that were built from a different food catalog
+        """
+        if not self.cache_dir:
+            return 0
+        removed = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    stale = json.load(f).get('catalog_hash') != catalog_hash
+            except (OSError, ValueError):
+                stale = True
+            if stale:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,391 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import normalize_catalog
+from dessert_cache import DessertLabelCache, dessert_model_key
+from lexicon import LexiconMatcher
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner, caloric_needs, macro_targets
+from plan_cache import catalog_content_hash
+from portions import plan_portion_grams
+
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner']
+
+PLAN_TABLE_COLUMNS = ['day', 'day_name', 'meal', 'name_common', 'portion_grams', 'calories_kcal', 'protein_g', 'fat_g', 'carbs_g',
+                      'vata', 'pitta', 'kapha', 'tastes']
+
+# Plan tables report nutrients per 100 g (the catalog stores them per standard portion)
+REFERENCE_GRAMS = 100
+
+# Share of the daily calories given to the optional dessert, on top of the main meals
+DESSERT_CALORIE_SHARE = 0.10
+
+# Names that identify a dessert without a model; also the weak labels the
+# dessert classifier is trained on
+DESSERT_KEYWORDS = [
+    'kheer', 'halwa', 'halva', 'ladoo', 'laddu', 'payasam', 'barfi', 'burfi', 'jamun', 'jalebi',
+    'rasgulla', 'rasmalai', 'kulfi', 'shrikhand', 'peda', 'sandesh', 'mysore pak', 'modak',
+    'phirni', 'rabri', 'basundi', 'sheera', 'kesari', 'chikki', 'gajak', 'pudding', 'custard',
+    'cake', 'cookie', 'brownie', 'pastry', 'pie', 'tart', 'ice cream', 'mousse', 'dessert'
+]
+
+# Dishes that are never desserts; names matching these (and no dessert keyword)
+# are labelled without the model
+SAVORY_KEYWORDS = [
+    'dal', 'curry', 'sabzi', 'sambar', 'rasam', 'soup', 'salad', 'biryani', 'pulao', 'khichdi',
+    'paratha', 'roti', 'dosa', 'idli', 'upma', 'poha', 'chilla', 'raita', 'pickle', 'chutney',
+    'masala', 'tikka', 'paneer', 'chicken', 'fish', 'mutton', 'egg', 'omelette', 'sandwich', 'stew'
+]
+
+DESSERT_MATCHER = LexiconMatcher({'dessert': DESSERT_KEYWORDS, 'savory': SAVORY_KEYWORDS})
+
+DESSERT_LABEL = 'dessert'
+NOT_DESSERT_LABEL = 'not_dessert'
+
+DESSERT_META_FILE = 'dessert_meta.json'
+DESSERT_LABELS_FILE = 'label_encoder.joblib'
+DESSERT_CACHE_DIR = '.dessert_cache'
+
+# Planners for recently used food tables, keyed by catalog content hash
+_PLANNER_CACHE_SIZE = 4
+_planners = OrderedDict()
+_planners_lock = threading.Lock()
+
+
+def get_planner(food_df: pd.DataFrame, **planner_kwargs) -> AdvancedAyurvedicMealPlanner:
+    """
+    Planner for a food table in the catalog schema (see catalog.REQUIRED_COLUMNS),
+    built once per table content and settings and shared by every caller in the
+    process. Raises ValueError for an invalid table
+    """
+    foods = normalize_catalog(food_df)
+    key = (catalog_content_hash(foods), json.dumps(planner_kwargs, sort_keys=True, default=str))
+    with _planners_lock:
+        planner = _planners.get(key)
+        if planner is not None:
+            _planners.move_to_end(key)
+            return planner
+
+    # No allergy input in the front ends, so the zero-shot model is not loaded by default
+    planner = AdvancedAyurvedicMealPlanner(foods, **{'allergy_backend': 'keyword', **planner_kwargs})
+    with _planners_lock:
+        _planners[key] = planner
+        while len(_planners) > _PLANNER_CACHE_SIZE:
+            _planners.popitem(last=False)
+    return planner
+
+
+def nutrient_requirements(age: int, weight: float, height: float, gender: str, activity: str,
+                          goal: str = 'maintain') -> Tuple[float, float, float, float]:
+    """
+    Daily (calories, protein g, fat g, carbs g): the planner's calorie target for the
+    profile, with each macronutrient at the middle of its acceptable range
+    """
+    calories, _ = caloric_needs(age, height, weight, gender, activity, goal)
+    targets = {nutrient: (low + high) / 2 for nutrient, (low, high) in macro_targets(calories).items()}
+    return calories, targets['Protein (g)'], targets['Fats (g)'], targets['Carbs (g)']
+
+
+def calculate_portion_sizes(calories: float, protein: float, fat: float, carbs: float,
+                            include_dessert: bool = False) -> Dict[str, Dict[str, float]]:
+    """
+    Per-meal nutrient targets: the daily targets split evenly over the three main
+    meals (as the planner does), plus a dessert of DESSERT_CALORIE_SHARE if requested
+    """
+    daily = {'calories': calories, 'protein': protein, 'fat': fat, 'carbs': carbs}
+    portion_sizes = {meal_type: {nutrient: value / 3 for nutrient, value in daily.items()} for meal_type in MEAL_TYPES}
+    if include_dessert:
+        portion_sizes['dessert'] = {nutrient: value * DESSERT_CALORIE_SHARE for nutrient, value in daily.items()}
+    return portion_sizes
+
+
+def enhanced_dessert_label(food_name: str) -> str:
+    """
+    Keyword label of a food name: DESSERT_LABEL if it names a known dessert
+    """
+    is_dessert = DESSERT_MATCHER.match(str(food_name)) & DESSERT_MATCHER.category_mask(['dessert'])
+    return DESSERT_LABEL if is_dessert else NOT_DESSERT_LABEL
+
+
+def train_dessert_classifier(food_names: Sequence[str], model_dir: str = "dessert_model_dir",
+                             base_model: str = "distilbert-base-uncased", epochs: int = 3,
+                             batch_size: int = 16, learning_rate: float = 5e-5) -> Dict:
+    """
+    Fine-tune a sequence classifier on food names labelled by enhanced_dessert_label
+    and save it (tokenizer, model, label encoder, metadata) to model_dir
+    """
+    import joblib
+    import torch
+    from sklearn.preprocessing import LabelEncoder
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    names = list(dict.fromkeys(str(name) for name in food_names))
+    label_encoder = LabelEncoder().fit([NOT_DESSERT_LABEL, DESSERT_LABEL])
+    labels = torch.tensor(label_encoder.transform([enhanced_dessert_label(name) for name in names]))
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    model = AutoModelForSequenceClassification.from_pretrained(base_model, num_labels=len(label_encoder.classes_))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate)
+
+    model.train()
+    generator = torch.Generator().manual_seed(0)
+    for _ in range(epochs):
+        for batch in torch.randperm(len(names), generator=generator).split(batch_size):
+            inputs = tokenizer([names[i] for i in batch], padding=True, truncation=True, return_tensors='pt')
+            loss = model(**inputs, labels=labels[batch]).loss
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+    model.eval()
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer.save_pretrained(model_dir)
+    model.save_pretrained(model_dir)
+    joblib.dump(label_encoder, os.path.join(model_dir, DESSERT_LABELS_FILE))
+    meta = {
+        'base_model': base_model,
+        'labels': label_encoder.classes_.tolist(),
+        'examples': len(names),
+        'dessert_examples': int((labels == label_encoder.transform([DESSERT_LABEL])[0]).sum()),
+        'epochs': epochs,
+        'trained_at': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(os.path.join(model_dir, DESSERT_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_dessert_classifier(model_dir: str = "dessert_model_dir"):
+    """
+    Load a classifier saved by train_dessert_classifier.
+    Returns (tokenizer, model, label encoder, metadata)
+    """
+    import joblib
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    label_encoder = joblib.load(os.path.join(model_dir, DESSERT_LABELS_FILE))
+    meta_path = os.path.join(model_dir, DESSERT_META_FILE)
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    return tokenizer, model, label_encoder, meta
+
+
+def predict_dessert(food_names: Sequence[str], dessert_tokenizer, dessert_model, dessert_label_encoder,
+                    batch_size: int = 32) -> List[str]:
+    """
+    Dessert classifier label of each food name. Names are tokenized once and
+    batched in order of token length, so each batch is only padded to its own
+    longest name; labels come back in the input order
+    """
+    import torch
+
+    names = [str(name) for name in food_names]
+    if not names:
+        return []
+    encoded = dessert_tokenizer(names, truncation=True)['input_ids']
+    order = np.argsort([len(ids) for ids in encoded], kind='stable')
+    predictions = np.empty(len(names), dtype=np.int64)
+    with torch.no_grad():
+        for start in range(0, len(names), batch_size):
+            batch = order[start:start + batch_size]
+            inputs = dessert_tokenizer.pad({'input_ids': [encoded[i] for i in batch]}, return_tensors='pt')
+            predictions[batch] = dessert_model(**inputs).logits.argmax(dim=-1).numpy()
+    return dessert_label_encoder.inverse_transform(predictions).tolist()
+
+
+def dessert_classifier_key(dessert_model) -> str:
+    """
+    Cache key of a dessert model loaded by load_dessert_classifier: its saved
+    metadata (training run) and config
+    """
+    metadata = {'config': dessert_model.config.to_dict()}
+    meta_path = os.path.join(str(getattr(dessert_model, 'name_or_path', '')), DESSERT_META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            metadata['meta'] = json.load(f)
+    return dessert_model_key(metadata)
+
+
+_dessert_caches = {}
+_dessert_caches_lock = threading.Lock()
+
+
+def get_dessert_cache(dessert_model, cache_dir: str = DESSERT_CACHE_DIR) -> DessertLabelCache:
+    """
+    Label cache for a dessert model, shared by every caller in the process
+    """
+    key = (cache_dir, dessert_classifier_key(dessert_model))
+    with _dessert_caches_lock:
+        if key not in _dessert_caches:
+            _dessert_caches[key] = DessertLabelCache(cache_dir, key[1])
+        return _dessert_caches[key]
+
+
+def label_desserts(food_names: pd.Series, dessert_tokenizer, dessert_model, dessert_label_encoder,
+                   batch_size: int = 32, cache_dir: str = DESSERT_CACHE_DIR) -> np.ndarray:
+    """
+    Whether each food name is a dessert. Names with a dessert keyword are desserts
+    and names with only savory keywords are not, both decided in one vectorized
+    keyword pass; the model labels the remaining names, each at most once per model
+    (labels are cached on disk under cache_dir)
+    """
+    names = pd.Series(food_names, dtype=object).astype(str)
+    masks = DESSERT_MATCHER.match_series(names)
+    is_dessert = (masks & DESSERT_MATCHER.category_mask(['dessert'])) != 0
+    ambiguous = ~is_dessert & ((masks & DESSERT_MATCHER.category_mask(['savory'])) == 0)
+    if not ambiguous.any():
+        return is_dessert
+
+    cache = get_dessert_cache(dessert_model, cache_dir)
+    ambiguous_names = names[ambiguous].unique().tolist()
+    missing = cache.missing(ambiguous_names)
+    if missing:
+        labels = predict_dessert(missing, dessert_tokenizer, dessert_model, dessert_label_encoder, batch_size)
+        cache.update(dict(zip(missing, labels)))
+        cache.save()
+
+    is_dessert[ambiguous] = names[ambiguous].map(cache.get).to_numpy() == DESSERT_LABEL
+    return is_dessert
+
+
+def _plan_rows(planner: AdvancedAyurvedicMealPlanner, meal_plan: Dict) -> List[Dict]:
+    """
+    One row per planned food at the portion the planner chose, with catalog
+    nutrients per REFERENCE_GRAMS
+    """
+    foods = planner.food_df.drop_duplicates('Food Name').set_index('Food Name')
+    scale = REFERENCE_GRAMS / planner.standard_portion
+    rows = []
+    for day, (day_name, day_plan) in enumerate(meal_plan['weekly_plan'].items()):
+        for meal_type, meal in day_plan['meals'].items():
+            for food in meal['foods']:
+                catalog_row = foods.loc[food['name']]
+                rows.append({
+                    'day': day,
+                    'day_name': day_name,
+                    'meal': meal_type,
+                    'name_common': food['name'],
+                    'portion_grams': food['portion'],
+                    'calories_kcal': float(catalog_row['Calories']) * scale,
+                    'protein_g': float(catalog_row['Protein (g)']) * scale,
+                    'fat_g': float(catalog_row['Fats (g)']) * scale,
+                    'carbs_g': float(catalog_row['Carbs (g)']) * scale,
+                    'vata': food['vata_effect'],
+                    'pitta': food['pitta_effect'],
+                    'kapha': food['kapha_effect'],
+                    'tastes': food['tastes']
+                })
+    return rows
+
+
+def _dessert_rows(planner: AdvancedAyurvedicMealPlanner, allowed_foods: pd.DataFrame, dessert_names: List[str],
+                  vikriti: str, age: int, season: str, days: List[str]) -> List[Dict]:
+    """
+    One dessert per day: the best dosha-balancing foods among dessert_names in
+    allowed_foods (the planner's foods filtered for the diet and allergies), rotating
+    so a dessert only repeats once all of them were served
+    """
+    foods = allowed_foods[allowed_foods['Food Name'].isin(dessert_names)].drop_duplicates('Food Name')
+    if foods.empty:
+        return []
+    scores = planner.score_foods(foods, planner.calculate_dosha_weights(vikriti, age, season, 'dinner'))
+    ranked = foods.iloc[np.argsort(-scores, kind='stable')]
+    scale = REFERENCE_GRAMS / planner.standard_portion
+    rows = []
+    for day, day_name in enumerate(days):
+        food = ranked.iloc[day % len(ranked)]
+        rows.append({
+            'day': day,
+            'day_name': day_name,
+            'meal': 'dessert',
+            'name_common': food['Food Name'],
+            'portion_grams': np.nan,
+            'calories_kcal': float(food['Calories']) * scale,
+            'protein_g': float(food['Protein (g)']) * scale,
+            'fat_g': float(food['Fats (g)']) * scale,
+            'carbs_g': float(food['Carbs (g)']) * scale,
+            'vata': food['Vata'],
+            'pitta': food['Pitta'],
+            'kapha': food['Kapha'],
+            'tastes': planner.food_features.at[food.name, 'tastes']
+        })
+    return rows
+
+
+def plan_weekly_meals(df_foods: pd.DataFrame, dessert_tokenizer=None, dessert_model=None,
+                      dessert_label_encoder=None, person_profile: Dict = None, dietary_pref: str = 'none',
+                      allergies: List[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, Dict[str, float]]]:
+    """
+    Weekly plan for a person, built by AdvancedAyurvedicMealPlanner on the given food
+    table, as flat tables for display and download:
+
+    - plan_df: one row per food (day 0-6, meal, name_common, portion_grams, nutrients
+      per 100 g, dosha effects). Main meals keep the planner's portions; desserts are
+      sized to their portion_sizes calorie target
+    - totals_df: per-day calories, protein, fat and carbs at those portions
+    - portion_sizes: per-meal nutrient targets (calculate_portion_sizes)
+
+    person_profile has age, gender, weight, height, activity, goal, prakriti, vikriti
+    (None: same as prakriti) and season. With a dessert classifier, one dessert per
+    day is added from the foods it labels as desserts, among those allowed by the
+    diet and allergies and not served in the main meals. Raises ValueError when no
+    plan can be made
+    """
+    profile = person_profile or {}
+    prakriti = profile['prakriti']
+    vikriti = profile.get('vikriti') or prakriti
+    goal = profile.get('goal', 'maintain')
+    planner = get_planner(df_foods)
+
+    meal_plan = planner.generate_weekly_plan(
+        age=profile['age'], height=profile['height'], weight=profile['weight'], gender=profile['gender'],
+        prakriti=prakriti, vikriti=vikriti, activity_level=profile.get('activity', 'moderate'),
+        season=profile['season'], dietary_pref=dietary_pref, allergies=allergies or [], goal=goal
+    )
+    if 'error' in meal_plan:
+        raise ValueError(meal_plan['error'])
+
+    rows = _plan_rows(planner, meal_plan)
+    has_dessert_model = dessert_model is not None and dessert_tokenizer is not None and dessert_label_encoder is not None
+    if has_dessert_model:
+        # Desserts come from the same diet- and allergy-filtered foods as the main meals,
+        # leaving out foods the week already serves
+        allowed_foods = planner.get_filtered_foods(dietary_pref, allergies or [])[0]
+        names = pd.Series(allowed_foods['Food Name'].unique())
+        names = names[~names.isin({row['name_common'] for row in rows})]
+        dessert_names = names[label_desserts(names, dessert_tokenizer, dessert_model, dessert_label_encoder)].tolist()
+        rows.extend(_dessert_rows(planner, allowed_foods, dessert_names, vikriti, profile['age'], profile['season'],
+                                  list(meal_plan['weekly_plan'])))
+
+    calories, protein, fat, carbs = nutrient_requirements(
+        profile['age'], profile['weight'], profile['height'], profile['gender'], profile.get('activity', 'moderate'),
+        goal
+    )
+    portion_sizes = calculate_portion_sizes(calories, protein, fat, carbs, include_dessert=has_dessert_model)
+
+    # Desserts were appended after the week; a stable sort puts each after its day's dinner
+    plan_df = pd.DataFrame(rows, columns=PLAN_TABLE_COLUMNS).sort_values('day', kind='stable').reset_index(drop=True)
+
+    desserts = (plan_df['meal'] == 'dessert').to_numpy()
+    if desserts.any():
+        plan_df.loc[desserts, 'portion_grams'] = plan_portion_grams(plan_df[desserts], portion_sizes)
+    plan_df['portion_grams'] = plan_df['portion_grams'].astype(float)
+
+    grams = plan_df['portion_grams'] / REFERENCE_GRAMS
+    nutrients = plan_df[['calories_kcal', 'protein_g', 'fat_g', 'carbs_g']].mul(grams, axis=0)
+    nutrients.columns = ['calories', 'protein', 'fat', 'carbs']
+    totals_df = nutrients.groupby(plan_df['day']).sum().reset_index()
+    totals_df.insert(1, 'day_name', totals_df['day'].map(dict(zip(plan_df['day'], plan_df['day_name']))))
+
+    return plan_df, totals_df, portion_sizes
@@ -0,0 +1,54 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Streamlit plan table: portion caps per meal type (grams), other meals get DEFAULT_MAX_PORTION
+MEAL_MAX_PORTION = {'breakfast': 250, 'lunch': 350, 'dinner': 300}
+DEFAULT_MAX_PORTION = 300
+MIN_PORTION = 80
+PORTION_STEP = 25
+BASE_PORTION = 100
+
+
+def portion_grams(food_calories, target_calories, reference_grams: float, max_grams,
+                  min_grams=None, step: float = None, decimals: int = None,
+                  default: float = None) -> np.ndarray:
+    """
+    Grams of each food that supply target_calories, for foods with food_calories
+    per reference_grams: clamped to [min_grams, max_grams], then rounded to a
+    multiple of step or to decimals. Targets and caps may be scalars or per-food
+    arrays. With default, foods without calorie data (0 or NaN) get that portion
+    """
+    food_calories = np.asarray(food_calories, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grams = np.clip(np.asarray(target_calories, dtype=np.float64) / food_calories * reference_grams,
+                        min_grams, max_grams)
+    if step is not None:
+        grams = np.round(grams / step) * step
+    elif decimals is not None:
+        grams = np.round(grams, decimals)
+    if default is not None:
+        grams = np.where(np.nan_to_num(food_calories) > 0, grams, default)
+    return grams
+
+
+def plan_portion_grams(plan_df: pd.DataFrame, portion_sizes: Dict[str, Dict[str, float]],
+                       calories_column: str = 'calories_kcal', meal_column: str = 'meal') -> np.ndarray:
+    """
+    Portion in grams for every row of a weekly plan table (calories per 100 g),
+    sized to its meal's calorie target from portion_sizes: between MIN_PORTION and
+    the meal's cap, rounded to PORTION_STEP. Rows without calorie data, or of a meal
+    with no target, get BASE_PORTION
+    """
+    meals = plan_df[meal_column]
+    targets = meals.map({meal: sizes['calories'] for meal, sizes in portion_sizes.items()}).to_numpy(dtype=np.float64)
+    caps = meals.map(MEAL_MAX_PORTION).fillna(DEFAULT_MAX_PORTION).to_numpy(dtype=np.float64)
+    if calories_column in plan_df:
+        food_calories = pd.to_numeric(plan_df[calories_column], errors='coerce').to_numpy(dtype=np.float64)
+    else:
+        food_calories = np.zeros(len(plan_df))
+
+    grams = portion_grams(food_calories, targets, BASE_PORTION, caps, min_grams=MIN_PORTION,
+                          step=PORTION_STEP, default=BASE_PORTION)
+    return np.where(np.isnan(targets), BASE_PORTION, grams).astype(int)
@@ -0,0 +1,182 @@
+"""
+JSON API for the Ayurvedic meal planner.
+
+The planner (food table, feature table and allergy classifier) is loaded once
+per worker process and shared by all requests that worker serves:
+
+    uvicorn server:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from allergen_models import DEFAULT_ALLERGY_MODEL
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+from plan_cache import PlanCache
+
+FOOD_DATA_PATH = os.environ.get("FOOD_DATA_PATH", "new_foods.csv")
+ALLERGY_CACHE_DIR = os.environ.get("ALLERGY_CACHE_DIR", ".allergy_cache")
+ALLERGY_BACKEND = os.environ.get("ALLERGY_BACKEND", "auto")
+ALLERGY_MODEL_ID = os.environ.get("ALLERGY_MODEL_ID", DEFAULT_ALLERGY_MODEL)
+ALLERGY_RUNTIME = os.environ.get("ALLERGY_RUNTIME", "torch")
+ALLERGY_BATCH_WINDOW_MS = float(os.environ.get("ALLERGY_BATCH_WINDOW_MS", "5"))
+PLAN_CACHE_SIZE = int(os.environ.get("PLAN_CACHE_SIZE", "1024"))
+PLAN_CACHE_DIR = os.environ.get("PLAN_CACHE_DIR") or None
+PLANNER_INSTRUMENT = os.environ.get("PLANNER_INSTRUMENT", "1") not in ("0", "false", "")
+ALTERNATIVES_PER_MEAL = int(os.environ.get("ALTERNATIVES_PER_MEAL", "0"))
+SOLVER_BACKEND = os.environ.get("SOLVER_BACKEND", "cbc")
+SOLVER_TIME_LIMIT = float(os.environ["SOLVER_TIME_LIMIT"]) if os.environ.get("SOLVER_TIME_LIMIT") else None
+SOLVER_THREADS = int(os.environ.get("SOLVER_THREADS", "1"))
+SOLVER_GAP = float(os.environ["SOLVER_GAP"]) if os.environ.get("SOLVER_GAP") else None
+SOLVER_SEED = int(os.environ["SOLVER_SEED"]) if os.environ.get("SOLVER_SEED") else None
+
+
+class PlanRequest(BaseModel):
+    age: int
+    height: float
+    weight: float
+    gender: str
+    prakriti: str
+    vikriti: Optional[str] = None
+    activity_level: str = "moderate"
+    goal: str = "maintain"
+    season: str
+    dietary_pref: str = "none"
+    allergies: List[str] = []
+
+
+class ReplanRequest(BaseModel):
+    plan: Dict[str, Any]
+    day: str
+    meal_type: str
+    exclude: List[str] = []
+
+
+class LatencyStats:
+    """
+    Thread-safe running totals of per-stage latency, exported as text metrics
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[float]] = {}  # stage -> [count, total seconds, max seconds]
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            stats = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {'count': count, 'total_s': total, 'max_s': longest}
+                for stage, (count, total, longest) in self._stages.items()
+            }
+
+    def to_text(self) -> str:
+        stages = sorted(self.snapshot().items())
+        lines = [
+            '# HELP planner_stage_seconds Latency of server stages (startup, plan, serialize, replan)',
+            '# TYPE planner_stage_seconds summary'
+        ]
+        for stage, stats in stages:
+            lines.append(f'planner_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+            lines.append(f'planner_stage_seconds_sum{{stage="{stage}"}} {stats["total_s"]:.6f}')
+        lines.append('# HELP planner_stage_seconds_max Longest latency seen per server stage')
+        lines.append('# TYPE planner_stage_seconds_max gauge')
+        for stage, stats in stages:
+            lines.append(f'planner_stage_seconds_max{{stage="{stage}"}} {stats["max_s"]:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+latency = LatencyStats()
+state = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the planner once per worker process
+    start = time.perf_counter()
+    state['planner'] = AdvancedAyurvedicMealPlanner(
+        FOOD_DATA_PATH, allergy_cache_dir=ALLERGY_CACHE_DIR, allergy_backend=ALLERGY_BACKEND,
+        allergy_model_id=ALLERGY_MODEL_ID, allergy_runtime=ALLERGY_RUNTIME,
+        allergy_batch_window_ms=ALLERGY_BATCH_WINDOW_MS,
+        plan_cache=PlanCache(PLAN_CACHE_SIZE, PLAN_CACHE_DIR) if PLAN_CACHE_SIZE > 0 else None,
+        instrument=PLANNER_INSTRUMENT, alternatives_per_meal=ALTERNATIVES_PER_MEAL,
+        solver_backend=SOLVER_BACKEND, solver_time_limit=SOLVER_TIME_LIMIT, solver_threads=SOLVER_THREADS,
+        solver_gap=SOLVER_GAP, solver_seed=SOLVER_SEED
+    )
+    latency.record('startup', time.perf_counter() - start)
+    yield
+    state.clear()
+
+
+app = FastAPI(title="Ayurvedic Meal Planner", lifespan=lifespan)
+
+
+@app.get("/health")
+def health():
+    planner = state.get('planner')
+    return {
+        'status': 'ok' if planner is not None else 'loading',
+        'foods': len(planner.food_df) if planner is not None else 0,
+        'allergy_backend': planner.allergy_backend if planner is not None else None,
+        'allergy_classifier_loaded': planner is not None and planner.allergy_classifier is not None
+    }
+
+
+@app.post("/plan")
+def plan(request: PlanRequest):
+    # Declared as a plain function so FastAPI runs concurrent requests in its thread pool
+    planner = state['planner']
+    timings = {}
+
+    start = time.perf_counter()
+    meal_plan = planner.generate_weekly_plan(**request.model_dump())
+    timings['plan'] = time.perf_counter() - start
+    latency.record('plan', timings['plan'])
+
+    if 'error' in meal_plan:
+        raise HTTPException(status_code=422, detail=meal_plan['error'])
+
+    start = time.perf_counter()
+    content = jsonable_encoder(meal_plan)
+    timings['serialize'] = time.perf_counter() - start
+    latency.record('serialize', timings['serialize'])
+
+    content['latency_ms'] = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+    return JSONResponse(content)
+
+
+@app.post("/replan")
+def replan(request: ReplanRequest):
+    planner = state['planner']
+
+    start = time.perf_counter()
+    meal_plan = planner.replan_slot(request.plan, request.day, request.meal_type, request.exclude)
+    elapsed = time.perf_counter() - start
+    latency.record('replan', elapsed)
+
+    if 'error' in meal_plan:
+        raise HTTPException(status_code=422, detail=meal_plan['error'])
+
+    content = jsonable_encoder(meal_plan)
+    content['latency_ms'] = {'replan': round(elapsed * 1000, 2)}
+    return JSONResponse(content)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    planner = state.get('planner')
+    if planner is None or planner.metrics is None:
+        return latency.to_text()
+    return latency.to_text() + planner.metrics.to_text()
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+import pytest
+
+import new_new_new_new_new
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+
+def fake_classifier(names, candidate_labels, multi_label=True, batch_size=32):
+    """
+    Zero-shot stand-in that flags a label only when the food name contains it, so
+    its decisions differ from keyword matching
+    """
+    return [
+        {'labels': list(candidate_labels),
+         'scores': [0.9 if label in name.lower() else 0.1 for label in candidate_labels]}
+        for name in names
+    ]
+
+
+@pytest.fixture
+def slow_loader(monkeypatch):
+    calls = []
+    
+    def load(model_id, runtime):
+        calls.append(model_id)
+        time.sleep(0.5)
+        return fake_classifier
+    
+    monkeypatch.setattr(new_new_new_new_new, 'load_zero_shot_classifier', load)
+    return calls
+
+
+@pytest.mark.parametrize('backend', ['zeroshot', 'auto'])
+def test_concurrent_requests_wait_for_classifier_load(tmp_path, slow_loader, backend):
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend=backend,
+                                           allergy_cache_dir=str(tmp_path))
+    results = {}
+    
+    def plan_foods(i):
+        results[i] = planner.filter_foods('none', ['dairy'])
+    
+    threads = [threading.Thread(target=plan_foods, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(slow_loader) == 1
+    expected = planner.food_df[~planner.food_df['Food Name'].str.lower().str.contains('dairy')]
+    for foods in results.values():
+        assert foods.index.equals(expected.index)
+    # The classifier's decisions, which differ from keyword matching
+    keyword_foods = planner.food_df[~planner.keyword_allergy_mask(planner.food_df, ['dairy'])]
+    assert not keyword_foods.index.equals(expected.index)
+
+
+def test_zeroshot_backend_never_downgrades_to_keywords(tmp_path, monkeypatch):
+    def failing_load(model_id, runtime):
+        raise OSError("model unavailable")
+    
+    monkeypatch.setattr(new_new_new_new_new, 'load_zero_shot_classifier', failing_load)
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend='zeroshot',
+                                           allergy_cache_dir=str(tmp_path))
+    
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            planner.get_filtered_foods('none', ['dairy'])
+    assert not planner.filtered_foods_cache
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+# Default adult profile: no bundled food is calorie-feasible, so every slot falls back
+PROFILE = dict(age=30, height=170, weight=70, gender='male', prakriti='Vata', vikriti='Vata',
+               activity_level='moderate', season='summer', dietary_pref='none', allergies=[])
+
+
+@pytest.fixture(scope='module')
+def plan():
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend='keyword', alternatives_per_meal=3)
+    return planner.generate_weekly_plan(**PROFILE)
+
+
+def test_fallback_slots_still_get_alternatives(plan):
+    for day_plan in plan['weekly_plan'].values():
+        for meal in day_plan['meals'].values():
+            selected = {food['name'] for food in meal['foods']}
+            names = [alternative['name'] for alternative in meal['alternatives']]
+            assert len(names) == 3
+            assert not selected & set(names)
+
+
+def test_alternatives_are_ranked_best_first(plan):
+    for day_plan in plan['weekly_plan'].values():
+        for meal in day_plan['meals'].values():
+            totals = [alternative['score']['total'] for alternative in meal['alternatives']]
+            assert totals == sorted(totals, reverse=True)
+
+
+
+def served_alternatives(plan):
+    served = {food['name'] for day_plan in plan['weekly_plan'].values()
+              for meal in day_plan['meals'].values() for food in meal['foods']}
+    return {alternative['name'] for day_plan in plan['weekly_plan'].values()
+            for meal in day_plan['meals'].values() for alternative in meal['alternatives']} & served
+
+
+@pytest.mark.parametrize('weekly_mode', ['greedy', 'joint'])
+def test_alternatives_are_never_served_in_the_week(weekly_mode):
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend='keyword', alternatives_per_meal=3,
+                                           weekly_mode=weekly_mode)
+    plan = planner.generate_weekly_plan(**PROFILE)
+    assert served_alternatives(plan) == set()
+    assert served_alternatives(planner.replan_slot(plan, 'Wednesday', 'lunch')) == set()
@@ -0,0 +1,76 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import batch
+import new_new_new_new_new
+from batch import generate_plans_batch
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+PROFILE = dict(age=35, height=170, weight=70, gender='male', prakriti='Vata-Pitta', vikriti='Vata',
+               activity_level='moderate', season='winter', dietary_pref='vegetarian', allergies=['dairy', 'nuts'])
+
+
+def fake_classifier(names, candidate_labels, multi_label=True, batch_size=32):
+    return [
+        {'labels': list(candidate_labels),
+         'scores': [0.9 if label in name.lower() else 0.1 for label in candidate_labels]}
+        for name in names
+    ]
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    
+    def load(model_id, runtime):
+        calls.append(model_id)
+        return fake_classifier
+    
+    monkeypatch.setattr(new_new_new_new_new, 'load_zero_shot_classifier', load)
+    return calls
+
+
+def test_cached_scores_do_not_load_the_classifier(tmp_path, loads):
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend='zeroshot',
+                                           allergy_cache_dir=str(tmp_path))
+    expected = planner.filter_foods('vegetarian', ['dairy', 'nuts'])
+    assert len(loads) == 1
+    
+    # A worker gets the planner without its classifier but with the warm score cache
+    worker = pickle.loads(pickle.dumps(planner))
+    assert worker.filter_foods('vegetarian', ['dairy', 'nuts']).index.equals(expected.index)
+    assert worker.check_allergy(expected['Food Name'].iloc[0], ['dairy', 'nuts']) is False
+    assert len(loads) == 1
+    
+    worker.filter_foods('none', ['gluten'])
+    assert len(loads) == 2
+
+
+def test_spawned_workers_reuse_the_parent_scores(tmp_path, loads, monkeypatch):
+    # Spawned workers import the real loader, which cannot load a model here, so any
+    # worker that tried to classify would report an error
+    start_methods = []
+    get_context = batch.mp.get_context
+    monkeypatch.setattr(batch.mp, 'get_context', lambda method: start_methods.append(method) or get_context(method))
+    planner = AdvancedAyurvedicMealPlanner(BUNDLED_CATALOG, allergy_backend='zeroshot',
+                                           allergy_cache_dir=str(tmp_path / 'scores'))
+    profiles = [{'patient_id': str(i), 'profile': PROFILE} for i in range(4)]
+    output_path = str(tmp_path / 'plans.jsonl')
+    summary = generate_plans_batch(profiles, workers=2, output_path=output_path, planner=planner)
+    
+    assert summary['planned'] == 4 and summary['failed'] == 0
+    # The parent loaded the classifier, so workers are spawned rather than forked
+    assert start_methods == ['spawn']
+    assert len(loads) == 1
+    with open(output_path, 'r', encoding='utf-8') as f:
+        plans = [json.loads(line)['plan'] for line in f]
+    reference = planner.generate_weekly_plan(**PROFILE)
+    assert all(plan['weekly_plan'] == reference['weekly_plan'] for plan in plans)
+    
+    with open(planner.allergy_cache.path, 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['scores']) == len(planner.allergy_cache)
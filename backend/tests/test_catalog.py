@@ -0,0 +1,17 @@
+import os
+
+from catalog import import_catalog
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+
+def test_imported_catalog_opens_with_stored_features(tmp_path, monkeypatch):
+    catalog_path = str(tmp_path / 'foods.catalog')
+    import_catalog(BUNDLED_CATALOG, catalog_path)
+
+    def rebuild(self, food_df):
+        raise AssertionError("features were rebuilt")
+    monkeypatch.setattr(AdvancedAyurvedicMealPlanner, 'build_food_features', rebuild)
+    planner = AdvancedAyurvedicMealPlanner(catalog_path, allergy_backend='keyword')
+    assert planner.food_features['name_lower'].tolist() == planner.food_df['Food Name'].str.lower().tolist()
@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+import pytest
+
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+PROFILE = dict(age=60, height=155, weight=50, gender='female', prakriti='Pitta', vikriti='Kapha',
+               activity_level='sedentary', season='spring', dietary_pref='none', allergies=[])
+
+
+def composed_meals(catalog, items_per_meal=3):
+    planner = AdvancedAyurvedicMealPlanner(catalog, allergy_backend='keyword', items_per_meal=items_per_meal)
+    plan = planner.generate_weekly_plan(**PROFILE)
+    target = plan['nutrition_summary']['calories_per_meal_target']
+    meals = [meal for day_plan in plan['weekly_plan'].values() for meal in day_plan['meals'].values()]
+    return planner, meals, target
+
+
+def test_equally_scored_foods_are_not_split_into_portions():
+    # Identical nutrients and doshas: extra items add nothing, so every meal is a single food
+    meal_types = ['Breakfast'] * 10 + ['Lunch'] * 10 + ['Dinner'] * 10
+    foods = pd.DataFrame({
+        'Meal Type': meal_types,
+        'Food Name': [f'Khichdi {i}' for i in range(len(meal_types))],
+        'Calories': 300,
+        'Protein (g)': 12,
+        'Fats (g)': 8,
+        'Carbs (g)': 45,
+        'Vata': '-',
+        'Pitta': '-',
+        'Kapha': '-',
+    })
+    _, meals, target = composed_meals(foods)
+    assert [len(meal['foods']) for meal in meals] == [1] * 21
+    assert [meal['total_calories'] for meal in meals] == pytest.approx([target] * 21, abs=0.5)
+
+
+def test_composed_meals_hold_the_calorie_target():
+    planner, meals, target = composed_meals(BUNDLED_CATALOG)
+    assert [meal['total_calories'] for meal in meals] == pytest.approx([target] * 21, abs=0.5)
+    # At most one minimum-portion side per meal, never a meal of sides
+    for meal in meals:
+        portions = [food['portion'] for food in meal['foods']]
+        assert sum(portion <= planner.min_item_portion for portion in portions) <= 1
+        assert max(portions) > planner.min_item_portion
@@ -0,0 +1,39 @@
+import json
+import os
+import pickle
+
+import numpy as np
+
+from allergen_cache import AllergenScoreCache
+from dessert_cache import DessertLabelCache
+from json_files import json_default, write_json_atomic
+
+
+def test_write_json_atomic_leaves_only_the_target(tmp_path):
+    path = str(tmp_path / 'data.json')
+    write_json_atomic(path, {'count': np.int64(3)}, default=json_default)
+    assert os.listdir(tmp_path) == ['data.json']
+    with open(path, 'r', encoding='utf-8') as f:
+        assert json.load(f) == {'count': 3}
+
+
+def test_caches_round_trip_per_key(tmp_path):
+    scores = AllergenScoreCache(str(tmp_path), 'org/model')
+    scores.update('Dal Tadka', {'Dairy': 0.25})
+    scores.save()
+    labels = DessertLabelCache(str(tmp_path), 'abc')
+    labels.update({'Gajar Halwa': 'dessert'})
+    labels.save()
+
+    reloaded = pickle.loads(pickle.dumps(AllergenScoreCache(str(tmp_path), 'org/model')))
+    assert reloaded.get('Dal Tadka', 'dairy') == 0.25
+    assert reloaded.missing(['Dal Tadka'], ['dairy', 'nuts']) == {'Dal Tadka': ['nuts']}
+    assert DessertLabelCache(str(tmp_path), 'abc').get('Gajar Halwa') == 'dessert'
+    assert len(DessertLabelCache(str(tmp_path), 'other')) == 0
+
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    cache = AllergenScoreCache(str(tmp_path), 'org/model')
+    with open(cache.path, 'w', encoding='utf-8') as f:
+        f.write('{truncated')
+    assert len(AllergenScoreCache(str(tmp_path), 'org/model')) == 0
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from lexicon import COMPOUND_EXCEPTIONS, FOOD_LEXICON, LexiconMatcher, build_food_lexicon
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+
+@pytest.fixture(scope='module')
+def matcher():
+    return LexiconMatcher(build_food_lexicon(), compound_categories=FOOD_LEXICON, exceptions=COMPOUND_EXCEPTIONS)
+
+
+def categories(matcher, name):
+    mask = matcher.match(name)
+    return {category for category in FOOD_LEXICON if mask & matcher.bits[category]}
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Milkshake', {'dairy'}),
+    ('Mango Milkshake', {'dairy'}),
+    ('Cheesecake', {'dairy'}),
+    ('Buttercream Cake', {'dairy'}),
+    ('Buttermilk', {'dairy'}),
+    ('Peanut Chikki', {'nuts'}),
+    ('Walnuts', {'nuts'}),
+    ('Egg Bhurji', {'eggs'}),
+    ('Fishball Curry', {'seafood'}),
+    ('Wheatgrass Juice', {'gluten'}),
+])
+def test_compound_allergen_names_are_flagged(matcher, name, expected):
+    assert categories(matcher, name) == expected
+
+
+@pytest.mark.parametrize('name', ['Eggplant Curry', 'Baingan (Eggplants) Bharta', 'Butternut Soup', 'Nutmeg Rice',
+                                  'Doughnut'])
+def test_compound_exceptions_are_not_flagged(matcher, name):
+    assert categories(matcher, name) == set()
+
+
+def test_vectorized_matching_agrees_with_single_names(matcher):
+    names = pd.Series(['Milkshake', 'Eggplant Curry', 'Cheesecake with Walnuts', 'Dal Tadka', 'Paneer Tikka'])
+    assert matcher.match_series(names).tolist() == [matcher.match(name) for name in names]
+
+
+def test_keyword_allergy_filter_drops_compound_names():
+    foods = pd.DataFrame({
+        'Meal Type': ['Breakfast', 'Breakfast', 'Lunch', 'Dinner'],
+        'Food Name': ['Banana Milkshake', 'Eggplant Sabzi', 'Cheesecake', 'Moong Dal'],
+        'Calories': [150, 120, 300, 200],
+        'Protein (g)': [5, 3, 6, 12],
+        'Fats (g)': [4, 5, 18, 4],
+        'Carbs (g)': [25, 15, 30, 30],
+        'Vata': ['-', '+', '-', '-'],
+        'Pitta': ['-', '=', '+', '-'],
+        'Kapha': ['+', '-', '+', '='],
+    })
+    planner = AdvancedAyurvedicMealPlanner(foods, allergy_backend='keyword')
+    
+    assert planner.filter_foods('none', ['dairy'])['Food Name'].tolist() == ['Eggplant Sabzi', 'Moong Dal']
+    assert planner.filter_foods('none', ['eggs'])['Food Name'].tolist() == foods['Food Name'].tolist()
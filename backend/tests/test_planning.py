@@ -0,0 +1,89 @@
+import os
+
+import pandas as pd
+import pytest
+
+import planning
+from planning import DESSERT_LABEL, enhanced_dessert_label, plan_weekly_meals
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+DESSERTS = pd.DataFrame({
+    'Meal Type': ['Dinner'] * 5,
+    'Food Name': ['Cashew Milk Kheer', 'Egg Cake', 'Gajar Halwa', 'Ghee Ladoo', 'Sooji Kesari'],
+    'Calories': [320, 350, 280, 400, 300],
+    'Protein (g)': [8, 7, 4, 6, 5],
+    'Fats (g)': [14, 16, 10, 22, 9],
+    'Carbs (g)': [40, 45, 42, 44, 48],
+    'Vata': ['-', '-', '-', '-', '-'],
+    'Pitta': ['-', '=', '-', '-', '='],
+    'Kapha': ['+', '+', '+', '+', '+'],
+})
+
+PROFILE = dict(age=30, gender='female', weight=60, height=165, activity='moderate', goal='maintain',
+               prakriti='Vata', vikriti='Vata', season='winter')
+
+
+@pytest.fixture(scope='module')
+def foods():
+    return pd.concat([pd.read_csv(BUNDLED_CATALOG), DESSERTS], ignore_index=True)
+
+
+@pytest.fixture(autouse=True)
+def keyword_dessert_labels(monkeypatch):
+    # Label desserts by keyword only, so no dessert model is needed
+    def label_desserts(food_names, *args, **kwargs):
+        return pd.Series(food_names).map(enhanced_dessert_label).eq(DESSERT_LABEL).to_numpy()
+    monkeypatch.setattr(planning, 'label_desserts', label_desserts)
+
+
+def weekly_desserts(foods, dietary_pref, allergies):
+    model = tokenizer = label_encoder = object()
+    plan_df, _, _ = plan_weekly_meals(foods, tokenizer, model, label_encoder, person_profile=PROFILE,
+                                      dietary_pref=dietary_pref, allergies=allergies)
+    return set(plan_df.loc[plan_df['meal'] == 'dessert', 'name_common'])
+
+
+def test_desserts_respect_diet_and_allergies(foods):
+    desserts = weekly_desserts(foods, 'vegan', ['nuts', 'dairy', 'eggs'])
+    assert desserts == {'Gajar Halwa', 'Sooji Kesari'}
+
+
+def test_desserts_without_restrictions_use_every_dessert(foods):
+    assert weekly_desserts(foods, 'none', []) == set(DESSERTS['Food Name'])
+
+
+def test_desserts_are_not_served_as_main_meals():
+    # Every food is a dessert and only two are left once the week's 21 meals are planned
+    meal_types = ['Breakfast'] * 7 + ['Lunch'] * 7 + ['Dinner'] * 9
+    foods = pd.DataFrame({
+        'Meal Type': meal_types,
+        'Food Name': [f'Halwa {i}' for i in range(len(meal_types))],
+        'Calories': [300 + i for i in range(len(meal_types))],
+        'Protein (g)': 6,
+        'Fats (g)': 10,
+        'Carbs (g)': 45,
+        'Vata': '-',
+        'Pitta': '=',
+        'Kapha': '+',
+    })
+    plan_df, _, _ = plan_weekly_meals(foods, object(), object(), object(), person_profile=PROFILE)
+    main_meals = set(plan_df.loc[plan_df['meal'] != 'dessert', 'name_common'])
+    desserts = set(plan_df.loc[plan_df['meal'] == 'dessert', 'name_common'])
+    assert len(main_meals) == 21
+    assert len(desserts) == 2
+    assert not main_meals & desserts
+
+
+def test_plan_table_keeps_the_planner_portions(foods):
+    plan_df, totals_df, _ = plan_weekly_meals(foods, person_profile=PROFILE)
+    plan = planning.get_planner(foods).generate_weekly_plan(
+        age=PROFILE['age'], height=PROFILE['height'], weight=PROFILE['weight'], gender=PROFILE['gender'],
+        prakriti=PROFILE['prakriti'], vikriti=PROFILE['vikriti'], activity_level=PROFILE['activity'],
+        season=PROFILE['season'], dietary_pref='none', allergies=[], goal=PROFILE['goal']
+    )
+    planned = [food for day_plan in plan['weekly_plan'].values()
+               for meal in day_plan['meals'].values() for food in meal['foods']]
+    assert plan_df['portion_grams'].tolist() == [food['portion'] for food in planned]
+    daily_calories = [day_plan['total_calories'] for day_plan in plan['weekly_plan'].values()]
+    assert totals_df['calories'].round(1).tolist() == pytest.approx(daily_calories, abs=0.2)
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from benchmark import generate_synthetic_catalog
+from new_new_new_new_new import AdvancedAyurvedicMealPlanner
+
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'new_foods.csv')
+
+PROFILES = [
+    dict(age=35, height=170, weight=70, gender='male', prakriti='Vata-Pitta', vikriti='Vata',
+         activity_level='moderate', season='winter', dietary_pref='vegetarian', allergies=['dairy', 'nuts']),
+    dict(age=25, height=160, weight=55, gender='female', prakriti='Kapha', vikriti='Pitta',
+         activity_level='light', season='summer', dietary_pref='none', allergies=[]),
+    dict(age=60, height=165, weight=60, gender='female', prakriti='Pitta', vikriti='Kapha',
+         activity_level='sedentary', season='spring', dietary_pref='vegan', allergies=[])
+]
+
+
+@pytest.fixture(scope='module', params=['bundled', 'synthetic'])
+def catalog(request):
+    if request.param == 'bundled':
+        return BUNDLED_CATALOG
+    return generate_synthetic_catalog(400, seed=7)
+
+
+def planner_for(catalog, meal_selector):
+    return AdvancedAyurvedicMealPlanner(catalog, allergy_backend='keyword', meal_selector=meal_selector)
+
+
+def plan_picks(plan):
+    return {
+        (day, meal_type): [food['name'] for food in meal['foods']]
+        for day, day_plan in plan['weekly_plan'].items()
+        for meal_type, meal in day_plan['meals'].items()
+    }
+
+
+def test_selectors_pick_same_food_per_meal(catalog):
+    planner = planner_for(catalog, 'vectorized')
+    foods = planner.food_df
+    
+    feasible_picks = 0
+    for meal_type in ['breakfast', 'lunch', 'dinner']:
+        meal_type_foods = foods[foods['Meal Type'].str.lower() == meal_type]
+        for vikriti in ['Vata', 'Pitta', 'Kapha']:
+            scores = planner.score_foods(meal_type_foods, planner.calculate_dosha_weights(vikriti, 35, 'winter', meal_type))
+            for calories_per_meal in [250, 400, 600, 800]:
+                contributions = planner.calculate_calorie_contributions(meal_type_foods, calories_per_meal)
+                vectorized = planner.select_food_vectorized(meal_type_foods, scores, contributions, calories_per_meal)
+                pulp_pick = planner.select_food_pulp(meal_type_foods, scores, contributions, calories_per_meal)
+                assert vectorized == pulp_pick, (meal_type, vikriti, calories_per_meal)
+                feasible_picks += vectorized is not None
+    
+    assert feasible_picks > 0
+
+
+@pytest.mark.parametrize('profile', PROFILES)
+def test_selectors_build_same_weekly_plan(catalog, profile):
+    vectorized = planner_for(catalog, 'vectorized').generate_weekly_plan(**profile)
+    pulp_plan = planner_for(catalog, 'pulp').generate_weekly_plan(**profile)
+    
+    assert plan_picks(vectorized) == plan_picks(pulp_plan)